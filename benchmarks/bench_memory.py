@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Memory held per cached GameResult (with its ProtonDBReport), for the slotted,
+frozen and interned classes against the plain dataclasses used before.
+Every result is built from freshly decoded json, as the clients do, so that
+equal strings aren't shared unless interned.
+
+    python benchmarks/bench_memory.py [entries]
+"""
+
+import json
+import os
+import sys
+import tracemalloc
+from dataclasses import dataclass
+from typing import Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from modules.GameResult import GameResult
+from modules.ProtonDBReport import ProtonDBReport, ProtonDBTier
+
+
+# the classes as they were before
+@dataclass
+class OldProtonDBReport:
+    bestReportedTier: ProtonDBTier
+    confidence: str
+    score: float
+    tier: ProtonDBTier
+    total: int
+    trendingTier: ProtonDBTier
+
+
+@dataclass
+class OldGameResult:
+    link: str
+    title: str
+    appid: str
+    price: Optional[str]
+    is_free: bool
+    country: Optional[str]
+    discount: Optional[str]
+    protonDBReport: Optional[OldProtonDBReport] = None
+
+
+def payload(i: int) -> str:
+    return json.dumps({
+        "appid": str(1000 + i), "title": f"Game number {i}", "price": f"${i % 60}.99",
+        "country": ("US", "BR", "DE")[i % 3], "discount": "-50%" if i % 4 == 0 else None,
+        "report": {"best": 5, "confidence": ("strong", "good", "moderate")[i % 3], "score": 0.8,
+                   "tier": 1 + i % 5, "total": 100 + i, "trending": 4},
+    })
+
+
+def build(cls, reportCls, data: dict):
+    r = data["report"]
+    report = reportCls(
+        bestReportedTier=ProtonDBTier(r["best"]), confidence=r["confidence"], score=r["score"],
+        tier=ProtonDBTier(r["tier"]), total=r["total"], trendingTier=ProtonDBTier(r["trending"]),
+    )
+    return cls(
+        link=f"https://store.steampowered.com/app/{data['appid']}/", title=data["title"], appid=data["appid"],
+        price=data["price"], is_free=False, country=data["country"], discount=data["discount"],
+        protonDBReport=report,
+    )
+
+
+def measure(cls, reportCls, payloads: list[str]) -> float:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = [build(cls, reportCls, json.loads(p)) for p in payloads]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # the list itself isn't part of an entry
+    return (after - before - sys.getsizeof(kept)) / len(kept)
+
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    payloads = [payload(i) for i in range(entries)]
+    old = measure(OldGameResult, OldProtonDBReport, payloads)
+    new = measure(GameResult, ProtonDBReport, payloads)
+    print(f"before: {old:.0f} bytes per result")
+    print(f" after: {new:.0f} bytes per result ({100 * (old - new) / old:.0f}% less)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Rendering throughput of inline query results: TelegramInlineQueryMaker with its
+render cache against rendering every result from scratch, as done before it.
+Results are drawn from a pool of distinct ones, with repeats as in real traffic.
+
+    python benchmarks/bench_render.py [iterations] [distinct results]
+"""
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from modules.GameResult import GameResult
+from modules.ProtonDBReport import ProtonDBReport, ProtonDBTier
+from modules.db.GameResultRepository import GameResultRepository
+from modules.view.TelegramQueryMaker import TelegramInlineQueryMaker
+
+
+def makeResults(n: int) -> list[tuple[GameResult, str]]:
+    results = []
+    for i in range(n):
+        report = None
+        if i % 3:
+            report = ProtonDBReport(
+                bestReportedTier=ProtonDBTier.PLATINUM, confidence="strong", score=0.8,
+                tier=ProtonDBTier(1 + i % 5), total=100 + i, trendingTier=ProtonDBTier.GOLD,
+            )
+        game = GameResult(
+            link=f"https://store.steampowered.com/app/{1000 + i}/",
+            title=f"Game number {i}",
+            appid=str(1000 + i),
+            price=f"${i % 60}.99",
+            is_free=i % 10 == 0,
+            country="US",
+            discount="-50%" if i % 4 == 0 else None,
+            protonDBReport=report,
+        )
+        results.append((game, GameResultRepository.snapshot_key(game)))
+    return results
+
+
+def uncached(maker: TelegramInlineQueryMaker, game: GameResult, key: str):
+    # a fresh cache every time renders like before the render cache
+    maker._rendered.clear()
+    return maker.makeInlineQueryResultArticle_interactive(game, key)
+
+
+def cached(maker: TelegramInlineQueryMaker, game: GameResult, key: str):
+    return maker.makeInlineQueryResultArticle_interactive(game, key)
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    distinct = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    results = makeResults(distinct)
+    rng = random.Random(0)
+    # a few titles get most of the queries
+    workload = rng.choices(results, weights=[1 / (i + 1) for i in range(distinct)], k=iterations)
+
+    for name, render in (("uncached", uncached), ("cached", cached)):
+        maker = TelegramInlineQueryMaker(None)
+        start = time.perf_counter()
+        for game, key in workload:
+            render(maker, game, key)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>9}: {iterations / elapsed:>10.0f} results/s ({elapsed * 1e6 / iterations:.1f}us each)")
+
+
+if __name__ == "__main__":
+    main()
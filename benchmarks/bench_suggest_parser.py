@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Compares modules.SuggestParser against the BeautifulSoup html.parser extraction
+getAppids used before, over the saved search/suggest pages in fixtures/.
+
+    python benchmarks/bench_suggest_parser.py [iterations]
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bs4 import BeautifulSoup
+
+from modules.SuggestParser import parseSuggestions
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def parseWithBeautifulSoup(html: str) -> dict:
+    appids = {}
+    soup = BeautifulSoup(html, "html.parser")
+    for l in soup.find_all("a"):
+        if l.has_attr("data-ds-appid"):
+            appids[l["data-ds-appid"]] = ""
+    return appids
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    for name in sorted(os.listdir(FIXTURES)):
+        if not name.startswith("suggest_"):
+            continue
+        with open(os.path.join(FIXTURES, name)) as f:
+            html = f.read()
+
+        assert [s.appid for s in parseSuggestions(html)] == list(parseWithBeautifulSoup(html))
+
+        bs4_s = timeit.timeit(lambda: parseWithBeautifulSoup(html), number=iterations)
+        streaming_s = timeit.timeit(lambda: parseSuggestions(html), number=iterations)
+        print(
+            f"{name} ({len(html)} bytes, {iterations} runs): "
+            f"beautifulsoup {bs4_s / iterations * 1e6:.1f}us/page, "
+            f"streaming {streaming_s / iterations * 1e6:.1f}us/page, "
+            f"{bs4_s / streaming_s:.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -11,15 +11,29 @@ import sys
 from logging import basicConfig, WARNING, INFO, DEBUG
 import logging
 from telegram import InlineKeyboardMarkup, InlineKeyboardButton, Update
-from telegram.ext import CallbackQueryHandler, Updater, InlineQueryHandler, CommandHandler,Application
+from telegram.ext import CallbackQueryHandler, Updater, InlineQueryHandler, CommandHandler,Application, TypeHandler
 from telegram import InlineQueryResultArticle, InputTextMessageContent
 import sqlite3
 import time
+import asyncio
+import multiprocessing
+import queue
+import secrets
+import shutil
+import signal
+import tempfile
+from types import MappingProxyType
+from typing import Mapping, Optional
 import dotenv
 
 from modules.db import init_db
+from modules.db.AsyncDB import AsyncDB
+from modules.db.CacheRepository import CacheRepository
+from modules.db.GameResultRepository import GameResultRepository
+from modules.db.RemoteDB import RemoteDB
+from modules.db.ProtonDBRepository import ProtonDBRepository
 from modules.GameResult import GameResult
-from modules.TelegramQueryMaker import (
+from modules.view.TelegramQueryMaker import (
     TelegramInlineQueryMaker,
     ERROR_RESULT,
     TOO_SHORT_RESULT,
@@ -27,6 +41,20 @@ from modules.TelegramQueryMaker import (
 )
 from modules.SteamSearcher import SteamSearcher
 from modules.Bot import Bot
+from modules.CacheWarmer import CacheWarmer
+from modules.HttpClient import HttpClient
+from modules.UpstreamGuard import UpstreamGuard
+from modules.AppDetailsCache import AppDetailsCache
+from modules.AppCatalogIndex import AppCatalog
+from modules.PrefixResultCache import PrefixResultCache
+from modules.ProtonDBSnapshot import ProtonDBSnapshot
+from modules.WebhookServer import WebhookServer
+from modules.Metrics import metrics
+from modules.async_lru_cache_ttl import set_l2_backend
+from modules.L2Cache import L2Cache
+from modules.RPC import RPCClient, RPCServer
+from modules.SharedCache import SharedCache, SharedCacheClient
+from modules.WorkerPool import WorkerPool
 
 
 dotenv.load_dotenv()
@@ -65,17 +93,189 @@ async def error(update: Update, context):
     print(f"Update {update} caused error {context.error}")
 
 
-def main():
-    try:
-        token = os.environ["BOT_TOKEN"]
-    except KeyError:
-        print("No BOT_TOKEN environment variable passed. Terminating.")
-        sys.exit(1)
+async def run_webhook(application: Application, webhook: WebhookServer, url: str, max_connections: int):
+    """webhook counterpart of application.run_polling(), until SIGINT or SIGTERM"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    async with application:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        await webhook.start()
+        await application.bot.set_webhook(
+            url,
+            secret_token=webhook.secret_token,
+            max_connections=max_connections,
+            allowed_updates=Update.ALL_TYPES,
+        )
+        try:
+            await stop.wait()
+        finally:
+            await webhook.stop()
+            await application.stop()
+            if application.post_shutdown:
+                await application.post_shutdown(application)
+
+
+def budget(name: str, default: float):
+    """latency budget in seconds from the environment, 0 meaning no budget"""
+    return float(os.environ.get(name, default)) or None
+
+
+def application_builder(token: str, updater: bool = True):
+    builder = (
+        Application.builder()
+        .token(token)
+        .concurrent_updates(int(os.environ.get("UPDATE_CONCURRENCY", 32)))
+    )
+    if os.environ.get("TELEGRAM_API_BASE_URL"):
+        # e.g. the one of modules.FakeTelegram, for testing offline
+        builder = builder.base_url(os.environ["TELEGRAM_API_BASE_URL"])
+    if not updater:
+        builder = builder.updater(None)
+    return builder
 
-    db = init_db.init_db("data/db.sqlite")
-    bot = Bot(db)
 
-    application = Application.builder().token(token).build()
+def maintenance_tasks(db: AsyncDB, l2: Optional[CacheRepository]) -> list[asyncio.Task]:
+    """the sweeps of the process owning the db"""
+    tasks = [asyncio.create_task(GameResultRepository(db).sweep_snapshots(
+        max_age_s=float(os.environ.get("SNAPSHOT_RETENTION_S", 7 * 24 * 60 * 60)),
+        interval_s=float(os.environ.get("SNAPSHOT_SWEEP_INTERVAL_S", 60 * 60)),
+    ))]
+    if l2 is not None:
+        tasks.append(asyncio.create_task(
+            l2.sweep(float(os.environ.get("L2_CACHE_SWEEP_INTERVAL_S", 60 * 60)))))
+    return tasks
+
+
+def build_application(token: str, db, countries: Mapping[str, str], l2: Optional[L2Cache],
+                      worker: Optional[int] = None, workers: int = 1) -> Application:
+    """the application answering updates, either alone (worker None) or as worker
+    number worker of workers, whose db and l2 are the front process's"""
+    set_l2_backend(l2)
+    # the workers' share of the upstreams' rates
+    rate_share = 1 / workers
+    # background duties done by a single process
+    leader = worker in (None, 0)
+    http = HttpClient(
+        limit=int(os.environ.get("HTTP_MAX_CONNECTIONS", 100)),
+        limit_per_host=int(os.environ.get("HTTP_MAX_CONNECTIONS_PER_HOST", 20)),
+        keepalive_timeout_s=float(os.environ.get("HTTP_KEEPALIVE_S", 30)),
+        dns_ttl_s=int(os.environ.get("HTTP_DNS_TTL_S", 300)),
+        total_timeout_s=float(os.environ.get("HTTP_TIMEOUT_S", 10)),
+        connect_timeout_s=float(os.environ.get("HTTP_CONNECT_TIMEOUT_S", 3)),
+        read_timeout_s=float(os.environ.get("HTTP_READ_TIMEOUT_S", 5)),
+    )
+    upstream_max_wait_s = float(os.environ.get("UPSTREAM_MAX_WAIT_S", 2))
+    breaker_failures = int(os.environ.get("UPSTREAM_BREAKER_FAILURES", 5))
+    breaker_reset_s = float(os.environ.get("UPSTREAM_BREAKER_RESET_S", 30))
+    http.guard(UpstreamGuard(
+        "store.steampowered.com",
+        rate=float(os.environ.get("STEAM_RATE_PER_S", 5)) * rate_share,
+        burst=float(os.environ.get("STEAM_RATE_BURST", 20)) * rate_share,
+        max_wait_s=upstream_max_wait_s,
+        failure_threshold=breaker_failures,
+        reset_timeout_s=breaker_reset_s,
+    ))
+    http.guard(UpstreamGuard(
+        "www.protondb.com",
+        rate=float(os.environ.get("PROTONDB_RATE_PER_S", 20)) * rate_share,
+        burst=float(os.environ.get("PROTONDB_RATE_BURST", 50)) * rate_share,
+        max_wait_s=upstream_max_wait_s,
+        failure_threshold=breaker_failures,
+        reset_timeout_s=breaker_reset_s,
+    ))
+    protondb_snapshot = ProtonDBSnapshot(
+        ProtonDBRepository(db),
+        http,
+        source=os.environ["PROTONDB_SNAPSHOT_SOURCE"],
+        max_age_s=float(os.environ.get("PROTONDB_SNAPSHOT_MAX_AGE_S", 3 * 24 * 60 * 60)),
+    ) if os.environ.get("PROTONDB_SNAPSHOT_SOURCE") else None
+    catalog = AppCatalog(os.environ["APP_CATALOG_PATH"]) if os.environ.get("APP_CATALOG_PATH") else None
+    searcher = SteamSearcher(
+        MAX_RESULTS=6,
+        http=http,
+        detailsCache=AppDetailsCache(
+            maxsize=int(os.environ.get("APPDETAILS_CACHE_SIZE", 20000)),
+            price_ttl_s=float(os.environ.get("APPDETAILS_PRICE_TTL_S", 15 * 60)),
+            static_ttl_s=float(os.environ.get("APPDETAILS_STATIC_TTL_S", 12 * 60 * 60)),
+            refresh_ahead_s=float(os.environ.get("APPDETAILS_REFRESH_AHEAD_S", 60)),
+            l2=l2,
+        ),
+        batchDetails=os.environ.get("APPDETAILS_BATCH", "1") == "1",
+        catalog=catalog,
+        catalogFirst=os.environ.get("APP_CATALOG_FIRST", "0") == "1",
+        prefixCache=PrefixResultCache(
+            maxsize=int(os.environ.get("PREFIX_CACHE_SIZE", 10000)),
+            ttl_s=float(os.environ.get("PREFIX_CACHE_TTL_S", 10 * 60)),
+            completeBelow=int(os.environ.get("PREFIX_CACHE_COMPLETE_BELOW", 10)),
+        ) if os.environ.get("PREFIX_CACHE", "1") == "1" else None,
+        searchBudget_s=budget("BUDGET_SEARCH_S", 2),
+        detailsBudget_s=budget("BUDGET_DETAILS_S", 2),
+        protonDBBudget_s=budget("BUDGET_PROTONDB_S", 1),
+        protonDBSnapshot=protondb_snapshot,
+    )
+    bot = Bot(
+        db,
+        searcher,
+        countries,
+        userCacheSize=int(os.environ.get("USER_CACHE_SIZE", 100_000)),
+        debounce_s=float(os.environ.get("INLINE_DEBOUNCE_S", 0)),
+        renderCacheSize=int(os.environ.get("RENDER_CACHE_SIZE", 20000)),
+    )
+
+    warmer = CacheWarmer(
+        searcher,
+        bot.gameResultRepo,
+        topGames=int(os.environ.get("CACHE_WARMER_GAMES", 300)),
+        topCountries=int(os.environ.get("CACHE_WARMER_COUNTRIES", 3)),
+        concurrency=int(os.environ.get("CACHE_WARMER_CONCURRENCY", 4)),
+        rateShare=float(os.environ.get("CACHE_WARMER_RATE_SHARE", 0.2)),
+        margin_s=float(os.environ.get("CACHE_WARMER_MARGIN_S", 60)),
+    )
+    warmer_interval_s = float(os.environ.get("CACHE_WARMER_INTERVAL_S", 10 * 60))
+
+    background_tasks: list[asyncio.Task] = []
+
+    async def on_startup(application: Application):
+        await http.start()
+        if worker is None:
+            background_tasks.extend(maintenance_tasks(db, l2))  # type:ignore
+        if catalog is not None:
+            await catalog.reload()
+            background_tasks.append(asyncio.create_task(
+                catalog.watch(float(os.environ.get("APP_CATALOG_RELOAD_INTERVAL_S", 10 * 60)))))
+        if protondb_snapshot is not None:
+            await protondb_snapshot.load()
+            if leader:
+                background_tasks.append(asyncio.create_task(protondb_snapshot.watch(
+                    float(os.environ.get("PROTONDB_SNAPSHOT_INTERVAL_S", 24 * 60 * 60)))))
+            else:
+                # ingested by the leader, into the db
+                background_tasks.append(asyncio.create_task(protondb_snapshot.follow()))
+        if warmer_interval_s > 0 and leader:
+            background_tasks.append(asyncio.create_task(warmer.run(warmer_interval_s)))
+        metrics_interval_s = float(os.environ.get("METRICS_LOG_INTERVAL_S", 5 * 60))
+        if metrics_interval_s > 0:
+            background_tasks.append(asyncio.create_task(metrics.logPeriodically(metrics_interval_s)))
+
+    async def on_shutdown(application: Application):
+        for task in background_tasks:
+            task.cancel()
+        await http.close()
+        if l2 is not None:
+            await l2.flush()
+        db.close()
+
+    application = (
+        application_builder(token, updater=worker is None and not os.environ.get("WEBHOOK_URL"))
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
 
     application.add_handler(CommandHandler("start", help))
     application.add_handler(CommandHandler("help", help))
@@ -89,8 +289,132 @@ def main():
 
 
     application.add_error_handler(error)  # type:ignore
+    return application
+
+
+def build_front(token: str, db: AsyncDB, countries: Mapping[str, str], l2: Optional[CacheRepository],
+                workers: int) -> Application:
+    """the application of the front process of the worker mode: it only receives
+    updates, dispatching them to worker processes running run_worker, and
+    serves them the db (of which it's the single writer) and the shared cache"""
+    shared = SharedCache(maxsize=int(os.environ.get("SHARED_CACHE_SIZE", 200_000)), backing=l2)
+    # only reachable by this user, as the workers' messages are pickled
+    socket_dir = tempfile.mkdtemp(prefix="steaminlinebot-")
+    socket_path = os.path.join(socket_dir, "rpc.sock")
+    server = RPCServer(socket_path, {
+        "db.run": db.run,
+        "cache.get_many": shared.get_many,
+        "cache.put": shared.put,
+    })
+    pool = WorkerPool(
+        run_worker,
+        workers,
+        args=(socket_path, dict(countries)),
+        queueSize=int(os.environ.get("WORKER_QUEUE_SIZE", 10_000)),
+    )
+    background_tasks: list[asyncio.Task] = []
+
+    async def on_startup(application: Application):
+        await server.start()
+        pool.start()
+        background_tasks.extend(maintenance_tasks(db, l2))
+        background_tasks.append(asyncio.create_task(pool.watch()))
+        metrics_interval_s = float(os.environ.get("METRICS_LOG_INTERVAL_S", 5 * 60))
+        if metrics_interval_s > 0:
+            background_tasks.append(asyncio.create_task(metrics.logPeriodically(metrics_interval_s)))
+
+    async def on_shutdown(application: Application):
+        for task in background_tasks:
+            task.cancel()
+        await pool.stop()
+        await server.stop()
+        await shared.flush()
+        db.close()
+        shutil.rmtree(socket_dir, ignore_errors=True)
+
+    application = (
+        application_builder(token, updater=not os.environ.get("WEBHOOK_URL"))
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
+    application.add_handler(TypeHandler(Update, pool.dispatch))
+    application.add_error_handler(error)  # type:ignore
+    return application
+
+
+def run_worker(index: int, workers: int, updates, socket_path: str, countries: dict[str, str]):
+    """entry point of the worker processes of build_front"""
+    # stopped by the front process, through its queue
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(serve_worker(index, workers, updates, socket_path, countries))
+
+
+async def serve_worker(index: int, workers: int, updates, socket_path: str, countries: dict[str, str]):
+    """handles the updates of the updates queue until it yields None"""
+    rpc = RPCClient(socket_path)
+    await rpc.connect()
+    application = build_application(
+        os.environ["BOT_TOKEN"],
+        RemoteDB(rpc),
+        MappingProxyType(countries),
+        SharedCacheClient(rpc),
+        worker=index,
+        workers=workers,
+    )
+    front = multiprocessing.parent_process()
+    try:
+        async with application:
+            await application.post_init(application)  # type:ignore
+            await application.start()
+            while True:
+                try:
+                    data = await asyncio.to_thread(updates.get, timeout=1)
+                except queue.Empty:
+                    if front is not None and not front.is_alive():
+                        logging.error(f"Worker {index} lost the front process, exiting")
+                        break
+                    continue
+                if data is None:
+                    break
+                await application.update_queue.put(Update.de_json(data, application.bot))
+            await application.stop()
+            await application.post_shutdown(application)  # type:ignore
+    finally:
+        await rpc.close()
+
+
+def main():
+    try:
+        token = os.environ["BOT_TOKEN"]
+    except KeyError:
+        print("No BOT_TOKEN environment variable passed. Terminating.")
+        sys.exit(1)
+
+    connection = init_db.init_db("data/db.sqlite")
+    countries = init_db.load_countries(connection)
+    db = AsyncDB(connection)
+    l2 = CacheRepository(db) if os.environ.get("L2_CACHE", "1") == "1" else None
+
+    workers = int(os.environ.get("WORKERS", 0))
+    if workers > 0:
+        application = build_front(token, db, countries, l2, workers)
+    else:
+        application = build_application(token, db, countries, l2)
 
-    application.run_polling()
+    webhook_url = os.environ.get("WEBHOOK_URL")
+    if webhook_url:
+        webhook = WebhookServer(
+            application,
+            secret_token=os.environ.get("WEBHOOK_SECRET") or secrets.token_urlsafe(32),
+            path=os.environ.get("WEBHOOK_PATH", "/telegram"),
+            host=os.environ.get("WEBHOOK_LISTEN", "0.0.0.0"),
+            port=int(os.environ.get("WEBHOOK_PORT", 8443)),
+        )
+        max_connections = min(int(os.environ.get("UPDATE_CONCURRENCY", 32)), 100)
+        asyncio.run(run_webhook(application, webhook, webhook_url, max_connections=max_connections))
+    else:
+        application.run_polling()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,200 @@
+import asyncio
+import heapq
+import json
+import logging
+import math
+import os
+import re
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from typing import Iterable, Optional
+
+from modules.SuggestParser import Suggestion
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+def normalize(text: str) -> str:
+    """lowercase ascii words separated by single spaces: 'Pokémon™: Ruby' -> 'pokemon ruby'"""
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode()
+    return _NON_ALNUM.sub(" ", text.lower()).strip()
+
+
+def trigrams(normalized: str) -> set[str]:
+    padded = f"  {normalized} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class AppCatalogIndex:
+    """In-memory search index over a dump of the steam app catalog.
+
+    The dump is the json of steam's GetAppList ({"applist": {"apps": [{"appid",
+    "name"}, ...]}}) or a plain list of such apps, optionally with a numeric
+    "popularity" (e.g. owners or reviews) used to rank equally good matches,
+    and an "is_free" boolean.
+
+    Queries whose words are all prefixes of words of a name are answered from a
+    sorted word list, anything else falls back to trigram similarity, which
+    tolerates typos. Names are stored once, postings as arrays of app indexes.
+
+    Searches run on the event loop, so their work is bounded: a query word
+    matching more than maxCandidates apps only yields its first maxCandidates,
+    the other words then filter those by name, and trigrams of more than
+    maxCandidates apps (like "the") are skipped.
+    """
+
+    def __init__(self, apps: Iterable[dict], maxCandidates: int = 500):
+        self.maxCandidates = maxCandidates
+        self.appids: array = array("I")
+        self.names: list[str] = []
+        self.normalized: list[str] = []
+        self.popularity: array = array("f")
+        self.free = bytearray()
+        """1 for the apps the dump says are free"""
+
+        words: defaultdict[str, array] = defaultdict(lambda: array("I"))
+        grams: defaultdict[str, array] = defaultdict(lambda: array("I"))
+        for app in apps:
+            name = str(app.get("name") or "").strip()
+            normalized = normalize(name)
+            if not normalized:
+                continue
+            i = len(self.names)
+            self.appids.append(int(app["appid"]))
+            self.names.append(name)
+            self.normalized.append(normalized)
+            self.popularity.append(float(app.get("popularity") or 0))
+            self.free.append(bool(app.get("is_free")))
+            for word in set(normalized.split()):
+                words[word].append(i)
+            for gram in trigrams(normalized):
+                grams[gram].append(i)
+
+        self.words = dict(words)
+        self.sortedWords = sorted(self.words)
+        self.grams = dict(grams)
+
+    def __len__(self):
+        return len(self.names)
+
+    @staticmethod
+    def load(path: str) -> "AppCatalogIndex":
+        with open(path) as f:
+            dump = json.load(f)
+        apps = dump["applist"]["apps"] if isinstance(dump, dict) else dump
+        return AppCatalogIndex(apps)
+
+    def _withWordPrefix(self, prefix: str) -> tuple[set[int], bool]:
+        """apps with a word starting with prefix, the ones with prefix as a whole word
+        first, up to maxCandidates, and whether that's all of them"""
+        apps: set[int] = set()
+        i = bisect_left(self.sortedWords, prefix)
+        while i < len(self.sortedWords) and self.sortedWords[i].startswith(prefix):
+            postings = self.words[self.sortedWords[i]]
+            room = self.maxCandidates - len(apps)
+            if len(postings) > room:
+                apps.update(postings[:room])
+                return apps, False
+            apps.update(postings)
+            i += 1
+        return apps, True
+
+    def _prefixMatches(self, queryWords: list[str]) -> dict[int, float]:
+        expansions = sorted((self._withWordPrefix(word) + (word,) for word in queryWords), key=lambda e: len(e[0]))
+        # most selective word first, so that the candidates are few
+        candidates, _, _ = expansions[0]
+        for apps, complete, word in expansions[1:]:
+            if not candidates:
+                return {}
+            if complete:
+                candidates = candidates & apps
+            else:
+                # too common to be listed whole, so checked against the names instead
+                candidates = {
+                    i for i in candidates
+                    if any(w.startswith(word) for w in self.normalized[i].split())
+                }
+        if not candidates:
+            return {}
+
+        query = " ".join(queryWords)
+        return {
+            # whole query as prefix of the name first, then shorter names (the
+            # base game rather than its soundtrack)
+            i: 1 + (self.normalized[i].startswith(query)) + len(query) / len(self.normalized[i])
+            for i in candidates or ()
+        }
+
+    def _trigramMatches(self, query: str, minSimilarity=0.3, rescored=50) -> dict[int, float]:
+        queryGrams = trigrams(query)
+        hits: Counter[int] = Counter()
+        for gram in queryGrams:
+            postings = self.grams.get(gram, ())
+            # too common to tell names apart, and too long to scan
+            if len(postings) <= self.maxCandidates:
+                hits.update(postings)
+
+        matches = {}
+        # the apps sharing the most uncommon trigrams, with every trigram counted
+        for i, _ in hits.most_common(rescored):
+            shared = len(queryGrams & trigrams(self.normalized[i]))
+            # jaccard similarity, the name's trigram count being about its length + 1
+            similarity = shared / (len(queryGrams) + len(self.normalized[i]) + 1 - shared)
+            if similarity >= minSimilarity:
+                matches[i] = similarity
+        return matches
+
+    def search(self, query: str, limit: int = 10) -> list[Suggestion]:
+        normalized = normalize(query)
+        if not normalized:
+            return []
+
+        matches = self._prefixMatches(normalized.split()) or self._trigramMatches(normalized)
+        ranked = heapq.nlargest(
+            limit,
+            matches,
+            key=lambda i: matches[i] * (1 + 0.1 * math.log1p(self.popularity[i])),
+        )
+        # the price is unknown, and so is whether the game is free unless the dump said so
+        return [
+            Suggestion(appid=str(self.appids[i]), name=self.names[i], price="Free" if self.free[i] else None)
+            for i in ranked
+        ]
+
+
+class AppCatalog:
+    """Holds the current AppCatalogIndex of a catalog dump file and rebuilds it
+    when the file changes, so that the dump can be refreshed by an external job"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.index: Optional[AppCatalogIndex] = None
+        self._mtime: Optional[float] = None
+
+    def search(self, query: str, limit: int = 10) -> list[Suggestion]:
+        return self.index.search(query, limit) if self.index is not None else []
+
+    async def reload(self) -> bool:
+        """rebuilds the index if the dump changed since the last load, off the event loop"""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError as e:
+            logging.warning(f"App catalog dump unavailable: {e}")
+            return False
+        if mtime == self._mtime:
+            return False
+
+        index = await asyncio.to_thread(AppCatalogIndex.load, self.path)
+        self.index, self._mtime = index, mtime
+        logging.warning(f"Loaded app catalog index of {len(index)} apps from {self.path}")
+        return True
+
+    async def watch(self, interval_s: float):
+        while True:
+            try:
+                await self.reload()
+            except Exception as e:
+                logging.error(f"Failed to load app catalog {self.path}: {e}")
+            await asyncio.sleep(interval_s)
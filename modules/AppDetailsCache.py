@@ -0,0 +1,181 @@
+from collections import OrderedDict
+from typing import Iterable, Optional, Tuple
+import asyncio
+import json
+import logging
+import time
+
+from modules.L2Cache import L2Cache
+
+
+class AppDetailsCache:
+    """LRU cache of the steam appdetails fields results are made of.
+
+    Only name and is_free (the static part, kept per appid) and price_overview
+    (kept per (appid, country)) are stored, not the rest of the basic filter's
+    payload. Prices change far more often than names or is_free, so each part
+    has its own entry: the static one lives for static_ttl_s, the price one for
+    price_ttl_s, or for static_ttl_s when the game has no price. When only the
+    price is expiring, it can be refreshed with a price_overview request alone.
+
+    Entries close to expiring are reported by needsRefresh so the caller can
+    refresh them in the background before anyone misses, and expired ones
+    remain available to getStale for when steam is failing.
+
+    With an l2 cache, stored entries are written through to it, and load reads
+    back the ones missing from memory, e.g. after a restart. Keys the l2 cache
+    didn't have aren't looked up again for l2_miss_ttl_s.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 20000,
+        price_ttl_s: float = 15 * 60,
+        static_ttl_s: float = 12 * 60 * 60,
+        refresh_ahead_s: float = 60,
+        stale_s: float = 24 * 60 * 60,
+        l2: Optional[L2Cache] = None,
+        l2_miss_ttl_s: float = 60,
+    ):
+        self.maxsize = maxsize
+        self.price_ttl_s = price_ttl_s
+        self.static_ttl_s = static_ttl_s
+        self.refresh_ahead_s = refresh_ahead_s
+        self.stale_s = stale_s
+        """how long expired entries are kept for getStale"""
+        self.l2 = l2
+        self.l2_miss_ttl_s = l2_miss_ttl_s
+        # (namespace, key) -> until when the l2 cache is known not to have it
+        self._l2Misses: OrderedDict[Tuple[str, str], float] = OrderedDict()
+        # appid -> (expiry, name, is_free)
+        self._static: OrderedDict[str, Tuple[float, str, bool]] = OrderedDict()
+        # (appid, country) -> (expiry, price_overview or None)
+        self._prices: OrderedDict[Tuple[str, str], Tuple[float, Optional[dict]]] = OrderedDict()
+
+    def _lookup(self, appid: str, country: str, maxAge_s: float) -> Optional[dict]:
+        """both parts of appid in country, shaped like the api's response, if neither
+        expired more than maxAge_s ago"""
+        static = self._static.get(appid)
+        price = self._prices.get((appid, country))
+        if static is None or price is None:
+            return None
+        limit = time.monotonic() - maxAge_s
+        if static[0] < limit or price[0] < limit:
+            return None
+        data = {"name": static[1], "is_free": static[2]}
+        if price[1] is not None:
+            data["price_overview"] = price[1]
+        return {appid: {"success": True, "data": data}}
+
+    def get(self, appid: str, country: str) -> Optional[dict]:
+        """returns the cached appdetails response for appid, shaped like the api's
+        ({appid: {"success": True, "data": ...}}), or None if absent or expired"""
+        found = self._lookup(appid, country, 0)
+        if found is not None:
+            self._static.move_to_end(appid)
+            self._prices.move_to_end((appid, country))
+        return found
+
+    def getStale(self, appid: str, country: str) -> Optional[dict]:
+        """like get, but also returns entries expired less than stale_s ago"""
+        return self._lookup(appid, country, self.stale_s)
+
+    def hasStatic(self, appid: str, within_s: float = 0) -> bool:
+        """whether the static part of appid is cached and doesn't expire within within_s,
+        so that only its price needs to be requested"""
+        static = self._static.get(appid)
+        return static is not None and static[0] - time.monotonic() >= within_s
+
+    def needsRefresh(self, appid: str, country: str, within_s: Optional[float] = None) -> bool:
+        """whether either part of the entry expires within within_s, refresh_ahead_s by default"""
+        window = self.refresh_ahead_s if within_s is None else within_s
+        static = self._static.get(appid)
+        price = self._prices.get((appid, country))
+        if static is None or price is None or not window:
+            return False
+        return min(static[0], price[0]) - time.monotonic() < window
+
+    def put(self, appid: str, country: str, gamedetails: dict):
+        """stores a successful appdetails response for appid, ignoring failed ones"""
+        result = gamedetails.get(appid)
+        if not result or not result.get("success"):
+            return
+        data = result["data"]
+        self.putStatic(appid, data["name"], bool(data["is_free"]))
+        self.putPrice(appid, country, data.get("price_overview"))
+
+    def putStatic(self, appid: str, name: str, is_free: bool):
+        expiry = time.monotonic() + self.static_ttl_s
+        self._store(self._static, appid, (expiry, name, is_free))
+        self._putL2("appdetails_static", appid, expiry, (name, is_free))
+
+    def putPrice(self, appid: str, country: str, overview: Optional[dict]):
+        """stores the price_overview of appid in country, None for games without a price"""
+        if overview is not None:
+            overview = {k: overview[k] for k in ("currency", "initial", "final", "discount_percent",
+                                                 "initial_formatted", "final_formatted") if k in overview}
+        expiry = time.monotonic() + (self.price_ttl_s if overview is not None else self.static_ttl_s)
+        self._store(self._prices, (appid, country), (expiry, overview))
+        self._putL2("appdetails_price", f"{appid}:{country}", expiry, overview)
+
+    def _putL2(self, namespace: str, key: str, expiry: float, value):
+        if self.l2 is None:
+            return
+        self._l2Misses.pop((namespace, key), None)
+        try:
+            # expiries are stored as wall clock times, which survive restarts
+            self.l2.put(namespace, key, expiry + time.time() - time.monotonic(),
+                        json.dumps(value, separators=(",", ":")).encode())
+        except Exception as e:
+            logging.warning(f"L2 cache put of {namespace} {key} failed: {e}")
+
+    def _store(self, entries: OrderedDict, key, entry):
+        entries[key] = entry
+        entries.move_to_end(key)
+        while len(entries) > self.maxsize:
+            entries.popitem(last=False)
+
+    async def load(self, appids: Iterable[str], country: str):
+        """reads the parts of appids missing from memory from the l2 cache, if any"""
+        if self.l2 is None:
+            return
+        appids = list(appids)
+        missingStatic = self._notMissed("appdetails_static", [
+            appid for appid in appids if appid not in self._static])
+        missingPrices = self._notMissed("appdetails_price", [
+            f"{appid}:{country}" for appid in appids if (appid, country) not in self._prices])
+        if not missingStatic and not missingPrices:
+            return
+        try:
+            static, prices = await asyncio.gather(
+                self._getL2("appdetails_static", missingStatic),
+                self._getL2("appdetails_price", missingPrices),
+            )
+        except Exception as e:
+            logging.warning(f"L2 cache get of appdetails failed: {e}")
+            return
+        offset = time.monotonic() - time.time()
+        # unless fetched meanwhile
+        for appid, (expires, payload) in static.items():
+            if appid not in self._static:
+                name, is_free = json.loads(payload)
+                self._store(self._static, appid, (expires + offset, name, is_free))
+        for l2key, (expires, payload) in prices.items():
+            appid = l2key.rpartition(":")[0]
+            if (appid, country) not in self._prices:
+                self._store(self._prices, (appid, country), (expires + offset, json.loads(payload)))
+
+    def _notMissed(self, namespace: str, keys: list[str]) -> list[str]:
+        """keys not known to be missing from the l2 cache"""
+        now = time.monotonic()
+        return [key for key in keys if self._l2Misses.get((namespace, key), 0) <= now]
+
+    async def _getL2(self, namespace: str, keys: list[str]) -> dict[str, Tuple[float, bytes]]:
+        if not keys:
+            return {}
+        found = await self.l2.get_many(namespace, keys)  # type:ignore
+        until = time.monotonic() + self.l2_miss_ttl_s
+        for key in keys:
+            if key not in found:
+                self._store(self._l2Misses, (namespace, key), until)
+        return found
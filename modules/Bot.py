@@ -1,10 +1,9 @@
 from collections import defaultdict
-from sqlite3 import Connection
 from types import CoroutineType
 from typing import Callable,Any, Coroutine, Mapping
 from modules.GameResult import GameResult
 import asyncio
-from modules.TelegramQueryMaker import (
+from modules.view.TelegramQueryMaker import (
     CHANGE_CURRENCY_BUTTON,
     TelegramInlineQueryMaker,
     ERROR_RESULT,
@@ -12,6 +11,7 @@ from modules.TelegramQueryMaker import (
     NO_MATCHES_RESULT,
 )
 from modules.SteamSearcher import SteamSearcher
+from modules.QueryScheduler import QueryScheduler, Superseded
 
 import logging
 import time
@@ -23,22 +23,26 @@ from telegram import InlineQueryResultArticle, InputTextMessageContent
 from modules.db.UserRepository import UserRepository
 
 from modules.db.GameResultRepository import GameResultRepository
+from modules.db.AsyncDB import AsyncDB
 
 class Bot:
-    def __init__(self, db:Connection):
-        self.queryMaker = TelegramInlineQueryMaker(SteamSearcher(MAX_RESULTS=6))
+    def __init__(self, db:AsyncDB, searcher: SteamSearcher, countries: Mapping[str, str], userCacheSize: int = 100_000, debounce_s: float = 0,
+                 renderCacheSize: int = 20000):
+        self.queryMaker = TelegramInlineQueryMaker(searcher, renderCacheSize=renderCacheSize)
+        self.scheduler = QueryScheduler(debounce_s=debounce_s)
         self.db = db
-        self.userRepo = UserRepository(db)
+        self.userRepo = UserRepository(db, countries, cache_size=userCacheSize)
         self.gameResultRepo = GameResultRepository(db)
+        self._inserting: set[asyncio.Task] = set()
         self._callback_handlers: Mapping[str, Callable[[Update, Any], Coroutine[Any, Any, Any]]] = self._init_callback_handlers()
 
-    def _get_country(self, id, fallback_languages=[]):
-        country = self.userRepo.get_user_country(id)
+    async def _get_country(self, id, fallback_languages=[]):
+        country = await self.userRepo.get_user_country(id)
         has_set=True
         if not country:
             has_set = False
             for l in fallback_languages:
-                country = self.userRepo.get_country_by_language(l)
+                country = await self.userRepo.get_country_by_language(l)
                 if country: break
 
         if not country: country = "US"
@@ -53,17 +57,21 @@ class Bot:
         results = []
         gameResults = []
         hasSetCountry = None
+        partial = False
 
         if len(query) < 3:
             specialResults.add(TOO_SHORT_RESULT)
         else:
             try:
-                hasSetCountry,country = self._get_country(
-                    update.inline_query.from_user.id,#type:ignore
+                user_id = update.inline_query.from_user.id #type:ignore
+                hasSetCountry,country = await self._get_country(
+                    user_id,
                     fallback_languages=[update.inline_query.from_user.language_code, "en-us"]) #type:ignore
 
-                res = await self.queryMaker.scrapeQuery(query, country)
+                res = await self.scheduler.run(
+                    user_id, lambda: self.queryMaker.scrapeQuery(query, country))
                 gameResults = res.results
+                partial = res.partial
 
                 if not gameResults:
                     specialResults.add(NO_MATCHES_RESULT)
@@ -73,16 +81,22 @@ class Bot:
 
                 # telegram Inline Objects that are actually rendered after they are tap sent
                 results: list[InlineQueryResultArticle] = []
-                for r in gameResults:
+                # keys are hashes of the results: the answer doesn't wait for them to be stored
+                resultKeys = [GameResultRepository.snapshot_key(r) for r in gameResults]
+                if gameResults:
+                    self._insertInBackground(gameResults, resultKeys)
+                for r, resultKey in zip(gameResults, resultKeys):
                     try:
                         #results.append(self.queryMaker.makeInlineQueryResultArticle(r))
-                        resultId = self.gameResultRepo.insert_game_result(r)
-                        article,_,_ = self.queryMaker.makeInlineQueryResultArticle_interactive(r, resultId)
+                        article,_,_ = self.queryMaker.makeInlineQueryResultArticle_interactive(r, resultKey)
                         results.append(article)
                     except Exception as e:
                         print(f"LOG: ERROR: {e} WITH RESULTS: {gameResults}")
                         specialResults.add(ERROR_RESULT)
                 
+            except Superseded:
+                # the user kept typing, their newer query gets answered instead
+                return
             except Exception as e:
                 print(f"LOG: Failed to query: {e} WITH RESULTS: {gameResults}")
                 specialResults.add(ERROR_RESULT)  # type:ignore
@@ -92,7 +106,8 @@ class Bot:
         ##                                    <--------------------- magic here
         await update.inline_query.answer( #type:ignore
             results + list(specialResults),
-            cache_time=30,
+            # partial answers aren't cached by telegram, so the next identical query gets the late data
+            cache_time=0 if partial else 30,
             button=CHANGE_CURRENCY_BUTTON if hasSetCountry == False else None
         )
 
@@ -102,12 +117,25 @@ class Bot:
             f"LOG: scrape time: {(updateTime - start):.4f}s, totalTime: {(endTime - start):.4f}s"
         )
         
+    def _insertInBackground(self, gameResults: list[GameResult], resultKeys: list[str]):
+        """stores the results behind the buttons of an answer. The write is queued to the
+        db before the answer is sent, so it's done before any button can be tapped"""
+        task = asyncio.create_task(self.gameResultRepo.insert_game_results(gameResults, resultKeys))
+        self._inserting.add(task)
+
+        def on_done(t: asyncio.Task):
+            self._inserting.discard(t)
+            if not t.cancelled() and t.exception() is not None:
+                logging.error(f"Failed to store game results: {t.exception()}")
+
+        task.add_done_callback(on_done)
+
     async def delete_user_info(self, update:Update, context):
         msg = update.message
         assert msg and msg.from_user
         id = msg.from_user.id
         try:
-            self.userRepo.delete_user(id)
+            await self.userRepo.delete_user(id)
             await msg.reply_text("Your data has been deleted 🫡")
         except Exception as e:
             logging.error(f"delete user error f{e}")
@@ -126,7 +154,7 @@ class Bot:
                 requested_country = args[0].upper()
 
                 try:
-                    success = self.userRepo.upsert_user_country(user_id, requested_country)
+                    success = await self.userRepo.upsert_user_country(user_id, requested_country)
                 except:
                     success = False
 
@@ -138,7 +166,7 @@ class Bot:
 
             #empty message, recommend languages
             user_lang = message.from_user.language_code or "en-us"
-            local_suggestion = self.userRepo.get_country_by_language(user_lang)
+            local_suggestion = await self.userRepo.get_country_by_language(user_lang)
             
             target_codes = ["BR", "US", "MX", "PL"]
             if local_suggestion and local_suggestion not in target_codes:
@@ -202,7 +230,7 @@ class Bot:
                 user_id = query.from_user.id
                 
                 try:
-                    success = self.userRepo.upsert_user_country(user_id, country_code)
+                    success = await self.userRepo.upsert_user_country(user_id, country_code)
                 except:
                     success = False
                 query.edit_message_reply_markup
@@ -217,11 +245,13 @@ class Bot:
         
         
         if query.data.startswith("protondb_cb"):
-            resultId = int(query.data.split(' ')[1])
-            gameResult = self.gameResultRepo.get_game_result(resultId)
-            assert gameResult
+            resultKey = query.data.split(' ')[1]
+            gameResult = await self.gameResultRepo.get_game_result(resultKey)
+            if not gameResult:
+                logging.info(f"Callback for swept or unknown result {resultKey}")
+                return
             protondb = gameResult.protonDBReport
-            text,keyboardMarkup = TelegramInlineQueryMaker.makeProtonDBResultText(gameResult, resultId)
+            text,keyboardMarkup = TelegramInlineQueryMaker.makeProtonDBResultText(gameResult, resultKey)
             # await asyncio.gather(
             #     query.edit_message_text(text),
             #     query.edit_message_reply_markup(keyboardMarkup)
@@ -234,11 +264,13 @@ class Bot:
     async def _handle_overview_callback(self, update:Update, context):
         query = update.callback_query
         assert query and query.data
-        resultId = int(query.data.split(' ')[1])
-        gameResult = self.gameResultRepo.get_game_result(resultId)
-        assert gameResult
-        article,text,keyboardMarkup = TelegramInlineQueryMaker.makeInlineQueryResultArticle_interactive(
-            gameResult, resultId
+        resultKey = query.data.split(' ')[1]
+        gameResult = await self.gameResultRepo.get_game_result(resultKey)
+        if not gameResult:
+            logging.info(f"Callback for swept or unknown result {resultKey}")
+            return
+        article,text,keyboardMarkup = self.queryMaker.makeInlineQueryResultArticle_interactive(
+            gameResult, resultKey
         )
         #todo: refactor asap
         await query.edit_message_text(text, parse_mode='Markdown')
@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import time
+
+from modules.Metrics import metrics
+from modules.SteamSearcher import SteamSearcher
+from modules.SuggestParser import Suggestion
+from modules.UpstreamGuard import UpstreamUnavailable, background_share
+from modules.db.GameResultRepository import GameResultRepository
+
+
+class CacheWarmer:
+    """Keeps the appdetails and ProtonDB caches hot for the games shown the most
+    recently, in the countries shown the most, so that most queries don't wait
+    for upstreams at all.
+
+    Its requests are background ones (see UpstreamGuard.background_share): they
+    only use rateShare of each upstream's rate, leaving the rest to user queries.
+    ProtonDB reports are fetched through the shared calls of async_lru_cache_ttl,
+    which don't see it, so ProtonDBClient.warmReport waits for the background pace
+    before starting them.
+    """
+
+    def __init__(
+        self,
+        searcher: SteamSearcher,
+        gameResultRepo: GameResultRepository,
+        topGames: int = 300,
+        topCountries: int = 3,
+        lookback_s: float = 7 * 24 * 60 * 60,
+        concurrency: int = 4,
+        rateShare: float = 0.2,
+        batchSize: int = 20,
+        margin_s: float = 60,
+    ):
+        self.searcher = searcher
+        self.gameResultRepo = gameResultRepo
+        self.topGames = topGames
+        self.topCountries = topCountries
+        self.lookback_s = lookback_s
+        self.concurrency = concurrency
+        self.rateShare = rateShare
+        self.batchSize = batchSize
+        """games per appdetails request, in batch mode"""
+        self.margin_s = margin_s
+        """entries expiring within a run's interval plus margin_s are refreshed by that run"""
+
+    async def warm(self, within_s: float = 0) -> int:
+        """fetches whatever is missing or expires within within_s among the popular games,
+        once. Returns the number of appdetails refreshed"""
+        games = await self.gameResultRepo.get_popular_games(self.lookback_s, self.topGames)
+        countries = await self.gameResultRepo.get_popular_countries(self.lookback_s, self.topCountries)
+        if not games:
+            return 0
+
+        # the price text only tells _getGamePrices whether the game is free
+        suggestions = [Suggestion(appid, title or "", "Free" if is_free else "") for appid, title, is_free in games]
+        batchSize = self.batchSize if self.searcher.batchDetails else 1
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def limited(coro):
+            async with semaphore:
+                try:
+                    return await coro
+                except UpstreamUnavailable:
+                    # the upstream is failing, its circuit isn't closed
+                    return 0
+                except Exception as e:
+                    logging.info(f"Cache warming request failed: {e}")
+                    return 0
+
+        # background_share is read by every request made from this context
+        token = background_share.set(self.rateShare)
+        try:
+            refreshed = await asyncio.gather(*(
+                limited(self.searcher.warmGameDetails(suggestions[start:start + batchSize], country, within_s))
+                for country in countries
+                for start in range(0, len(suggestions), batchSize)
+            ))
+            # reports don't depend on the country
+            await asyncio.gather(*(
+                limited(self.searcher.protonDBClient.warmReport(s.appid, within_s)) for s in suggestions
+            ))
+        finally:
+            background_share.reset(token)
+        return sum(refreshed)
+
+    async def run(self, interval_s: float = 10 * 60):
+        """warms the caches every interval_s, forever. Each run refreshes what would
+        expire before the next one"""
+        while True:
+            start = time.monotonic()
+            try:
+                refreshed = await self.warm(interval_s + self.margin_s)
+                metrics.inc("cache_warmer.appdetails_refreshed", refreshed)
+                logging.info(f"Cache warming refreshed {refreshed} appdetails in {time.monotonic() - start:.1f}s")
+            except Exception as e:
+                logging.error(f"Cache warming failed: {e}")
+            await asyncio.sleep(interval_s)
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+A local stand-in for the telegram bot api, to run the bot offline.
+
+It answers the bot api methods the bot uses, records the answers to inline
+queries, and sends fake inline query updates, either to the webhook registered
+with setWebhook or through getUpdates for polling mode. For example:
+
+    python -m modules.FakeTelegram --port 8081 --users 3 --query "elden ring"
+
+and, in another shell:
+
+    TELEGRAM_API_BASE_URL=http://127.0.0.1:8081/bot BOT_TOKEN=fake \\
+    WEBHOOK_URL=http://127.0.0.1:8443/telegram python main.py
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import time
+
+import aiohttp
+from aiohttp import web
+
+FAKE_BOT_USER = {
+    "id": 1,
+    "is_bot": True,
+    "first_name": "FakeSteamInlineBot",
+    "username": "FakeSteamInlineBot",
+    "can_join_groups": True,
+    "can_read_all_group_messages": False,
+    "supports_inline_queries": True,
+}
+
+
+def inlineQueryUpdate(update_id: int, user_id: int, query: str, language_code="en") -> dict:
+    return {
+        "update_id": update_id,
+        "inline_query": {
+            "id": f"{update_id}",
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "language_code": language_code},
+            "query": query,
+            "offset": "",
+        },
+    }
+
+
+class FakeTelegram:
+    def __init__(self, host="127.0.0.1", port=8081):
+        self.host = host
+        self.port = port
+        self.webhook_url: str | None = None
+        self.webhook_secret = ""
+        self.ready = asyncio.Event()
+        """set once the bot called getMe"""
+        self.answers: dict[str, list] = {}
+        """inline query id -> results answered"""
+        self.sent_at: dict[str, float] = {}
+        self.latencies: dict[str, float] = {}
+        self._updates: list[dict] = []
+        self._new_update = asyncio.Event()
+        self._update_ids = itertools.count(1)
+        self._runner: web.AppRunner | None = None
+        self._session: aiohttp.ClientSession | None = None
+
+    async def _params(self, request: web.Request) -> dict:
+        if request.content_type == "application/json":
+            return await request.json()
+        params = dict(await request.post())
+        # pairs of form data are json encoded by python-telegram-bot
+        for k, v in params.items():
+            try:
+                params[k] = json.loads(v)
+            except (TypeError, ValueError):
+                pass
+        return params
+
+    async def _handleMethod(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = await self._params(request)
+        result = await self.handle(method, params)
+        return web.json_response({"ok": True, "result": result})
+
+    async def handle(self, method: str, params: dict):
+        if method == "getMe":
+            self.ready.set()
+            return FAKE_BOT_USER
+        if method == "setWebhook":
+            self.webhook_url = params.get("url") or None
+            self.webhook_secret = params.get("secret_token", "")
+            return True
+        if method == "deleteWebhook":
+            self.webhook_url = None
+            return True
+        if method == "getUpdates":
+            return await self._getUpdates(int(params.get("offset") or 0), float(params.get("timeout") or 0))
+        if method == "answerInlineQuery":
+            query_id = str(params["inline_query_id"])
+            self.answers[query_id] = params.get("results", [])
+            if query_id in self.sent_at:
+                self.latencies[query_id] = time.monotonic() - self.sent_at[query_id]
+            return True
+        if method in ("sendMessage", "editMessageText", "editMessageReplyMarkup"):
+            return {"message_id": 1, "date": int(time.time()), "chat": {"id": params.get("chat_id", 1), "type": "private"}}
+        return True
+
+    async def _getUpdates(self, offset: int, timeout: float) -> list[dict]:
+        self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        if not self._updates and timeout:
+            self._new_update.clear()
+            try:
+                await asyncio.wait_for(self._new_update.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._updates
+
+    async def sendUpdate(self, update: dict):
+        """delivers update to the webhook if one is set, otherwise queues it for getUpdates"""
+        if "inline_query" in update:
+            self.sent_at[update["inline_query"]["id"]] = time.monotonic()
+        if self.webhook_url:
+            assert self._session
+            async with self._session.post(
+                self.webhook_url,
+                json=update,
+                headers={"X-Telegram-Bot-Api-Secret-Token": self.webhook_secret},
+            ) as res:
+                if res.status != 200:
+                    logging.warning(f"Webhook answered {res.status} to update {update['update_id']}")
+        else:
+            self._updates.append(update)
+            self._new_update.set()
+
+    async def typeInlineQuery(self, user_id: int, query: str, delay_s=0.1, min_length=3):
+        """sends one inline query per keystroke of query, like telegram does while typing"""
+        for end in range(min_length, len(query) + 1):
+            await self.sendUpdate(inlineQueryUpdate(next(self._update_ids), user_id, query[:end]))
+            await asyncio.sleep(delay_s)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self._handleMethod)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self._session = aiohttp.ClientSession()
+
+    async def stop(self):
+        if self._session:
+            await self._session.close()
+        if self._runner:
+            await self._runner.cleanup()
+
+
+async def _run(args):
+    telegram = FakeTelegram(args.host, args.port)
+    await telegram.start()
+    print(f"Fake bot api at http://{args.host}:{args.port}/bot, waiting for the bot...")
+    await telegram.ready.wait()
+    # give a webhook bot the time to call setWebhook
+    await asyncio.sleep(args.startup_delay)
+
+    await asyncio.gather(*(
+        telegram.typeInlineQuery(user_id, query, delay_s=args.keystroke_delay)
+        for user_id in range(1, args.users + 1)
+        for query in args.query
+    ))
+    await asyncio.sleep(args.wait)
+
+    sent = len(telegram.sent_at)
+    latencies = sorted(telegram.latencies.values())
+    print(f"{sent} inline queries sent, {len(latencies)} answered")
+    if latencies:
+        p = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+        print(f"latency p50 {p(0.5) * 1000:.0f}ms, p90 {p(0.9) * 1000:.0f}ms, max {latencies[-1] * 1000:.0f}ms")
+    await telegram.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="fake telegram bot api sending inline queries")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--users", type=int, default=1)
+    parser.add_argument("--query", action="append", default=[], help="may be repeated")
+    parser.add_argument("--keystroke-delay", type=float, default=0.15)
+    parser.add_argument("--startup-delay", type=float, default=1)
+    parser.add_argument("--wait", type=float, default=5, help="seconds to wait for answers after the last update")
+    args = parser.parse_args()
+    if not args.query:
+        args.query = ["elden ring"]
+    asyncio.run(_run(args))
@@ -1,11 +1,18 @@
 from typing import Optional
 import logging
+import sys
 
+from modules.PriceFormatter import priceFormatter
 from modules.ProtonDBReport import ProtonDBReport
-from dataclasses import dataclass, field
+from dataclasses import dataclass
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class GameResult:
+    """Immutable and hashable. Equal results (same game, country, price and report)
+    are interchangeable, and their country, price and discount strings are interned.
+
+    price and discount are the texts shown. When the price came from steam's
+    price_overview, its amounts are kept too, in cents of currency"""
     link: str
     title: str
     appid: str
@@ -14,25 +21,18 @@ class GameResult:
     country: Optional[str]
     discount: Optional[str]
     protonDBReport: Optional[ProtonDBReport] = None
-    
-    @staticmethod
-    def _parseDiscount(priceStr, discountValue: int):
-        """Parses discounts in different locales"""
-        e = Exception()
-        for valueidx in [0,1]:
-            try: 
-                if float(priceStr.split()[valueidx].replace(",",".")) == 0.0:
-                    return None
-                else:
-                    if float(discountValue) == 0.0:
-                        return None
-                    discount = f"-{discountValue:.0f}%"
-                    return discount
-            except Exception as ee:
-                e = ee
-        logging.warning(f"Price parsing of price/discount: ('{priceStr}','{discountValue}') error: {e}")
-        return None
+    currency: Optional[str] = None
+    initial: Optional[int] = None
+    final: Optional[int] = None
+    discount_percent: int = 0
 
+    def __post_init__(self):
+        # few distinct values, repeated across every result of a country
+        for name in ("country", "price", "discount", "currency"):
+            value = getattr(self, name)
+            if value is not None:
+                object.__setattr__(self, name, sys.intern(value))
+    
     @staticmethod
     def makeGameResultFromSteamApiGameDetails(gamedetails:dict, protonDBReport:Optional[ProtonDBReport] = None, country:Optional[str]=None):
         try:
@@ -45,27 +45,53 @@ class GameResult:
             data = gamedetails[appid]['data']
             title = data['name']
             
-            has_price = False
-            is_free = False
-            discount = None
-
-            if data['is_free']:
-                is_free = True
-                price = None
-            elif 'price_overview' not in data:
-                price = None
-                discount = None
-            else:
-                #This is a WIP, as the value position changes based on locales/countries
-                price = str(data['price_overview']['final_formatted'])
-                discount = GameResult._parseDiscount(price, data["price_overview"]["discount_percent"])
+            is_free = bool(data['is_free'])
+            overview = data.get('price_overview')
+            if is_free or overview is None:
+                # free, or possibly to be announced or just not sellable
+                return GameResult(link=link, title=title, appid=appid, price=None, discount=None,
+                                  protonDBReport=protonDBReport, is_free=is_free, country=country)
 
-            return(GameResult(link=link, title=title, appid=appid, price=price, discount=discount, protonDBReport=protonDBReport, is_free=is_free, country=country))
+            currency = overview['currency']
+            final = int(overview['final'])
+            discount_percent = int(overview['discount_percent'])
+            formatted = overview.get('final_formatted')
+            if formatted:
+                priceFormatter.learn(currency, country, final, formatted)
+            return GameResult(
+                link=link, title=title, appid=appid,
+                # steam's own text when it sent one, it knows its stores' formats best
+                price=formatted or priceFormatter.format(final, currency, country),
+                discount=f"-{discount_percent}%" if discount_percent and final else None,
+                protonDBReport=protonDBReport, is_free=is_free, country=country,
+                currency=currency, initial=int(overview['initial']), final=final,
+                discount_percent=discount_percent,
+            )
 
         except Exception as e:
             logging.warning(f"Error in makeGameResultFromSteamApiGameDetails: {e}")
             return None
-        
+
+    @staticmethod
+    def makeGameResultFromSuggestion(suggestion, protonDBReport:Optional[ProtonDBReport] = None, country:Optional[str]=None, showPrice=True):
+        """fallback for when appdetails couldn't be fetched: uses only what the search suggestion
+        (SuggestParser.Suggestion) has, which is the name and the price text, but no discount.
+        showPrice should be False when the suggestion was searched in another country than the user's"""
+        try:
+            return GameResult(
+                link=f"https://store.steampowered.com/app/{suggestion.appid}/",
+                title=suggestion.name,
+                appid=suggestion.appid,
+                price=None if suggestion.is_free or not showPrice else suggestion.price,
+                is_free=suggestion.is_free,
+                country=country,
+                discount=None,
+                protonDBReport=protonDBReport,
+            )
+        except Exception as e:
+            logging.warning(f"Error in makeGameResultFromSuggestion: {e}")
+            return None
+
 
     def __repr__(self):
         return str({
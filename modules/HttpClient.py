@@ -0,0 +1,94 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+import aiohttp
+from yarl import URL
+
+from modules.UpstreamGuard import UpstreamGuard
+
+
+class HttpClient:
+    """Application-scoped aiohttp session shared by every upstream client.
+
+    Created once in main.main(), started from inside the running event loop and
+    closed on shutdown, so that Steam and ProtonDB connections are kept alive
+    and reused across inline queries instead of paying a TLS handshake each time.
+    """
+
+    def __init__(
+        self,
+        limit: int = 100,
+        limit_per_host: int = 20,
+        keepalive_timeout_s: float = 30,
+        dns_ttl_s: int = 300,
+        total_timeout_s: float = 10,
+        connect_timeout_s: float = 3,
+        read_timeout_s: float = 5,
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout_s = keepalive_timeout_s
+        self.dns_ttl_s = dns_ttl_s
+        self.timeout = aiohttp.ClientTimeout(
+            total=total_timeout_s,
+            sock_connect=connect_timeout_s,
+            sock_read=read_timeout_s,
+        )
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.guards: dict[str, UpstreamGuard] = {}
+        """rate limit and circuit breaker of each guarded host"""
+
+    def guard(self, guard: UpstreamGuard):
+        self.guards[guard.host] = guard
+
+    async def start(self):
+        """must be called from within the event loop that will use the session"""
+        if self._session is not None and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout_s,
+            ttl_dns_cache=self.dns_ttl_s,
+            use_dns_cache=True,
+        )
+        self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        logging.info(
+            f"HTTP client started (limit={self.limit}, per_host={self.limit_per_host}, "
+            f"keepalive={self.keepalive_timeout_s}s, dns_ttl={self.dns_ttl_s}s)"
+        )
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            raise RuntimeError("HttpClient used before start() or after close()")
+        return self._session
+
+    @asynccontextmanager
+    async def get(self, url: str, **kwargs) -> AsyncIterator[aiohttp.ClientResponse]:
+        """session.get, going through the guard of the url's host, if any.
+        Raises UpstreamUnavailable without sending the request when the guard refuses it"""
+        guard = self.guards.get(URL(url).host or "")
+        if guard is None:
+            async with self.session.get(url, **kwargs) as response:
+                yield response
+            return
+
+        await guard.acquire()
+        try:
+            async with self.session.get(url, **kwargs) as response:
+                retry_after = response.headers.get("Retry-After", "")
+                guard.on_response(response.status, float(retry_after) if retry_after.isdigit() else None)
+                yield response
+        except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError):
+            # timeouts and broken connections, while connecting or reading the body.
+            # error statuses raised by raise_for_status were already reported above
+            guard.on_failure()
+            raise
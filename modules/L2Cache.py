@@ -0,0 +1,35 @@
+from abc import ABC, abstractmethod
+from typing import Any, Callable, NamedTuple, Optional
+
+
+class L2Cache(ABC):
+    """Key-value store behind the in-memory caches, so that they survive restarts.
+
+    Entries are namespaced bytes with a wall clock (time.time()) expiry. Reads
+    are awaited on cache misses only, and writes must not block the caller:
+    implementations queue them and return right away.
+    """
+
+    @abstractmethod
+    async def get_many(self, namespace: str, keys: list[str]) -> dict[str, tuple[float, bytes]]:
+        """(expires, payload) of every unexpired entry found among keys"""
+
+    async def get(self, namespace: str, key: str) -> Optional[tuple[float, bytes]]:
+        return (await self.get_many(namespace, [key])).get(key)
+
+    @abstractmethod
+    def put(self, namespace: str, key: str, expires: float, payload: bytes):
+        """queues the entry's write"""
+
+    async def flush(self):
+        """waits for the queued writes, before shutting down"""
+
+
+class L2Codec(NamedTuple):
+    """how a cached function's entries are stored in the L2Cache"""
+
+    namespace: str
+    key: Callable[..., str]
+    """called with the function's arguments"""
+    dumps: Callable[[Any], bytes]
+    loads: Callable[[bytes], Any]
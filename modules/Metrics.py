@@ -0,0 +1,29 @@
+import asyncio
+import logging
+from collections import Counter
+from typing import Any
+
+
+class Metrics:
+    """Process wide counters and gauges, logged periodically"""
+
+    def __init__(self):
+        self.counters: Counter[str] = Counter()
+        self.gauges: dict[str, Any] = {}
+
+    def inc(self, name: str, n: int = 1):
+        self.counters[name] += n
+
+    def set(self, name: str, value: Any):
+        self.gauges[name] = value
+
+    def snapshot(self) -> dict[str, Any]:
+        return {**self.counters, **self.gauges}
+
+    async def logPeriodically(self, interval_s: float):
+        while True:
+            await asyncio.sleep(interval_s)
+            logging.warning(f"METRICS: {self.snapshot()}")
+
+
+metrics = Metrics()
@@ -0,0 +1,82 @@
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from modules.AppCatalogIndex import normalize
+from modules.SuggestParser import Suggestion
+
+
+class PrefixResultCache:
+    """Remembers the candidates of recent queries, so that a query extending one
+    of them ("stardew" after "stard") can be answered by filtering the earlier
+    candidates locally.
+
+    That's only done when the earlier candidate list is complete, that is,
+    steam sent fewer rows than its maximum (completeBelow) for it. Rows are
+    counted before bundles and packages are dropped, so a page cut at the
+    maximum never passes as complete: a longer query can only narrow a
+    complete list down, while a truncated one may be missing the games the
+    longer query is looking for.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl_s: float = 10 * 60, completeBelow: int = 10, minPrefixLength: int = 3):
+        self.maxsize = maxsize
+        self.ttl_s = ttl_s
+        self.completeBelow = completeBelow
+        self.minPrefixLength = minPrefixLength
+        # normalized query -> (time stored, candidates, rows steam sent)
+        self._entries: OrderedDict[str, Tuple[float, dict[str, Suggestion], int]] = OrderedDict()
+
+    def put(self, query: str, candidates: dict[str, Suggestion], rows: int):
+        """stores the candidates of query, parsed from the rows search/suggest sent for it"""
+        key = normalize(query)
+        self._entries[key] = (time.monotonic(), candidates, rows)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _get(self, key) -> Optional[Tuple[dict[str, Suggestion], int]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored, candidates, rows = entry
+        if time.monotonic() - stored > self.ttl_s:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return candidates, rows
+
+    def lookup(self, query: str) -> Tuple[Optional[dict[str, Suggestion]], bool]:
+        """returns the candidates for query and whether they are the ones of query itself,
+        or (None, False) if neither query nor a complete prefix of it are cached"""
+        normalized = normalize(query)
+        exact = self._get(normalized)
+        if exact is not None:
+            return exact[0], True
+
+        # the longest cached prefix is the most specific one
+        for end in range(len(normalized) - 1, self.minPrefixLength - 1, -1):
+            entry = self._get(normalized[:end].rstrip())
+            if entry is None:
+                continue
+            candidates, rows = entry
+            if rows >= self.completeBelow:
+                return None, False
+            return PrefixResultCache._narrow(normalized, candidates), False
+        return None, False
+
+    @staticmethod
+    def _narrow(normalized: str, candidates: dict[str, Suggestion]) -> Optional[dict[str, Suggestion]]:
+        """the candidates with a word starting with each of the query words, best matches first"""
+        queryWords = normalized.split()
+        matches = []
+        for position, suggestion in enumerate(candidates.values()):
+            name = normalize(suggestion.name)
+            nameWords = name.split()
+            if all(any(w.startswith(q) for w in nameWords) for q in queryWords):
+                # whole query as prefix of the name first, then shorter names, then steam's order
+                matches.append((not name.startswith(normalized), len(name), position, suggestion))
+
+        if not matches:
+            return None
+        return {m[-1].appid: m[-1] for m in sorted(matches, key=lambda m: m[:3])}
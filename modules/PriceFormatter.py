@@ -0,0 +1,95 @@
+from typing import NamedTuple, Optional
+
+
+class PriceFormat(NamedTuple):
+    """how a currency's amounts are written, e.g. prefix "R$ ", decimal ",", thousands ".".
+    thousands is None when the amount it was learned from was too small to show it"""
+    prefix: str
+    suffix: str
+    decimal: str
+    thousands: Optional[str]
+    decimals: int
+
+
+class PriceFormatter:
+    """Formats steam prices, which come as integer amounts in cents, for the
+    prices steam sent without a final_formatted text.
+
+    Rather than relying on a locale table, the format of a currency in a
+    country's store is learned from the first final_formatted text steam sent
+    for them along with its amount. Only texts showing the cents are learned
+    from: "20,--€" doesn't tell how 19.99 would be written. Amounts under 1000
+    don't tell the thousands separator either, so their format is replaced by
+    the first one learned from a larger amount.
+    """
+
+    def __init__(self, maxTexts: int = 8192):
+        self._formats: dict[tuple[str, Optional[str]], PriceFormat] = {}
+        self.maxTexts = maxTexts
+        # (amount, currency, country) -> text, dropped whenever a format changes
+        self._texts: dict[tuple[int, str, Optional[str]], str] = {}
+
+    @staticmethod
+    def parseFormat(amount: int, formatted: str) -> Optional[PriceFormat]:
+        """the format steam used to write amount as formatted, or None if that can't be told"""
+        if "--" in formatted:
+            # a placeholder for zero cents, e.g. "1.999,--€"
+            return None
+        digits = [i for i, c in enumerate(formatted) if c.isdigit()]
+        if not digits:
+            return None
+        first, last = digits[0], digits[-1]
+        number = formatted[first:last + 1]
+        shown = int("".join(c for c in number if c.isdigit()))
+        separators = [c for c in number if not c.isdigit()]
+
+        # the cents must be shown, after the last separator
+        if shown != amount or not separators or len(number) - number.rindex(separators[-1]) != 3:
+            return None
+        decimal = separators[-1]
+        others = [c for c in separators[:-1] if c != decimal]
+        if others:
+            thousands: Optional[str] = others[0]
+        else:
+            # an amount of 1000 or more written without a separator has none
+            thousands = "" if amount >= 100_000 else None
+        return PriceFormat(formatted[:first], formatted[last + 1:], decimal, thousands, 2)
+
+    def learn(self, currency: str, country: Optional[str], amount: int, formatted: str):
+        """remembers the format of currency in the store of country from steam's formatted text of amount"""
+        known = self._formats.get((currency, country))
+        if known is not None and known.thousands is not None:
+            return
+        priceFormat = PriceFormatter.parseFormat(amount, formatted)
+        if priceFormat is None or (known is not None and priceFormat.thousands is None):
+            return
+        self._formats[(currency, country)] = priceFormat
+        self._texts.clear()
+
+    def format(self, amount: int, currency: str, country: Optional[str] = None) -> str:
+        """amount in cents of currency, written as steam writes it in the store of country"""
+        priceFormat = self._formats.get((currency, country))
+        if priceFormat is None:
+            return f"{amount / 100:.2f} {currency}"
+        key = (amount, currency, country)
+        text = self._texts.get(key)
+        if text is None:
+            if len(self._texts) >= self.maxTexts:
+                self._texts.clear()
+            text = self._texts[key] = PriceFormatter._format(amount, priceFormat)
+        return text
+
+    @staticmethod
+    def _format(amount: int, priceFormat: PriceFormat) -> str:
+        thousands = priceFormat.thousands
+        if thousands is None:
+            # not learned yet: the usual one for this decimal separator
+            thousands = "," if priceFormat.decimal != "," else "."
+        whole, cents = divmod(amount, 100)
+        text = f"{whole:,}".replace(",", thousands)
+        if priceFormat.decimals:
+            text += f"{priceFormat.decimal}{cents:02d}"
+        return f"{priceFormat.prefix}{text}{priceFormat.suffix}"
+
+
+priceFormatter = PriceFormatter()
@@ -4,45 +4,131 @@ from enum import IntEnum
 import heapq
 from dataclasses import dataclass
 import logging
-from typing import Any, Callable, Iterable, List, Tuple
+from typing import Any, Callable, Iterable, List, Optional, Tuple
 import aiohttp
 from functools import wraps
 import time
  
-from modules.async_lru_cache_ttl import async_lru_cache_ttl
+import json
+from modules.async_lru_cache_ttl import NegativeResult, async_lru_cache_ttl
+from modules.HttpClient import HttpClient
+from modules.L2Cache import L2Codec
+from modules.Metrics import metrics
 from modules.ProtonDBReport import ProtonDBReport, ProtonDBTier
-            
+from modules.ProtonDBSnapshot import ProtonDBSnapshot
+from modules.UpstreamGuard import background_share
+
+
+def _dumpReport(report: Optional[ProtonDBReport]) -> bytes:
+    if report is None:
+        return b"null"
+    return json.dumps((
+        int(report.bestReportedTier), report.confidence, report.score,
+        int(report.tier), report.total, int(report.trendingTier),
+    ), separators=(",", ":")).encode()
+
+
+def _loadReport(payload: bytes) -> Optional[ProtonDBReport]:
+    fields = json.loads(payload)
+    if fields is None:
+        return None
+    bestReportedTier, confidence, score, tier, total, trendingTier = fields
+    return ProtonDBReport(
+        bestReportedTier=ProtonDBTier(bestReportedTier),
+        confidence=confidence,
+        score=score,
+        tier=ProtonDBTier(tier),
+        total=total,
+        trendingTier=ProtonDBTier(trendingTier),
+    )
+
+
+PROTONDB_HOST = "www.protondb.com"
+
+REPORTS_L2 = L2Codec("protondb", lambda self, appid: appid, _dumpReport, _loadReport)
+
 class ProtonDBClient:
+    def __init__(self, http: HttpClient, snapshot: Optional[ProtonDBSnapshot] = None):
+        self.http = http
+        self.snapshot = snapshot
+        """bulk dataset looked up before requesting reports, while it's fresh"""
+
+    # most appids have no protondb page at all: that 404 is cached for as long as a report,
+    # while other errors are only remembered briefly, to not retry them on every query
+    @async_lru_cache_ttl(stale_if_error_s=60 * 60 * 24 * 7, error_ttl_s=30, l2=REPORTS_L2)
+    async def _getReport(self, appid: str) -> Optional[ProtonDBReport]:
+        """returns None for appids without a protondb report.
+        Raises UpstreamUnavailable while protondb is failing or rate limited, so that
+        results are sent without the report (or with a stale one) instead of waiting for it"""
+        async with self.http.get(
+            f"https://{PROTONDB_HOST}/api/v1/reports/summaries/{appid}.json"
+        ) as res:
+            if res.status == 404:
+                raise NegativeResult(None)
+            res.raise_for_status()
+            data = await res.json()
+            return ProtonDBReport(
+                bestReportedTier=ProtonDBTier[data["bestReportedTier"].upper()],
+                confidence=data["confidence"],
+                score=data["score"],
+                tier=ProtonDBTier[data["tier"].upper()],
+                total=data["total"],
+                trendingTier=ProtonDBTier[data["trendingTier"].upper()]
+            )
+
+    async def warmReport(self, appid: str, within_s: float) -> bool:
+        """fetches the report of appid if it isn't cached (in memory or l2) or expires within
+        within_s, returning whether it did. Reports in the fresh snapshot are left alone"""
+        if self.snapshot is not None and self.snapshot.isFresh() and self.snapshot.get(appid) is not None:
+            return False
+        remaining = self._getReport.remaining_ttl(self, appid)  # type:ignore
+        if remaining is None and await self._getReport.load(self, appid):  # type:ignore
+            remaining = self._getReport.remaining_ttl(self, appid)  # type:ignore
+        if remaining is not None and remaining >= within_s:
+            return False
+
+        # the shared call runs in a context of its own, without background_share,
+        # so the background pace is waited for here, before it
+        share = background_share.get()
+        guard = self.http.guards.get(PROTONDB_HOST)
+        if share is not None and guard is not None:
+            await guard.pace_background(share)
+        await self._getReport.refresh(self, appid)  # type:ignore
+        return True
+
+    async def getReports(self, appids: Iterable[str], timeout_s: Optional[float] = None) -> tuple[list[None|ProtonDBReport], bool]:
+        """returns the report of each appid, None for those that failed or took longer than timeout_s,
+        and whether any of them took longer than timeout_s"""
+        appids = list(appids)
+        known: dict[str, ProtonDBReport] = {}
+        if self.snapshot is not None and self.snapshot.isFresh():
+            for appid in appids:
+                report = self.snapshot.get(appid)
+                if report is not None:
+                    known[appid] = report
+            metrics.inc("protondb_snapshot.hits", len(known))
+
+        # appids missing from the snapshot are requested one by one
+        tasks = {appid: asyncio.ensure_future(self._getReport(appid)) for appid in appids if appid not in known}
+        if not tasks:
+            return [known.get(appid) for appid in appids], False
+        _, pending = await asyncio.wait(tasks.values(), timeout=timeout_s)
+        for task in pending:
+            # only this wait is cancelled: the shared _getReport call keeps going and caches the report
+            task.cancel()
+        if pending:
+            metrics.inc("budget_exceeded.protondb", len(pending))
 
-    @staticmethod
-    @async_lru_cache_ttl
-    async def _getReport(appid: str):
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                f"https://www.protondb.com/api/v1/reports/summaries/{appid}.json"
-            ) as res:
-                res.raise_for_status()
-                data = await res.json()
-                return ProtonDBReport(
-                    bestReportedTier=ProtonDBTier[data["bestReportedTier"].upper()],
-                    confidence=data["confidence"],
-                    score=data["score"],
-                    tier=ProtonDBTier[data["tier"].upper()],
-                    total=data["total"],
-                    trendingTier=ProtonDBTier[data["trendingTier"].upper()]
-                )
-
-    @staticmethod
-    async def getReports(appids: Iterable[str]) -> list[None|ProtonDBReport]:
-        results = await asyncio.gather(
-            *(ProtonDBClient._getReport(appid) for appid in appids),
-            return_exceptions=True,
-        )
-
-        filtered: list[None|ProtonDBReport] = [
-            x if isinstance(x, ProtonDBReport) else None for x in results]
-        
-        for result,appid in filter(lambda x:isinstance(x[0], Exception), zip(results,appids)):
-            logging.info(f"Error in protondb report of appid {appid}: {result}")
-            
-        return filtered
+        filtered: list[None|ProtonDBReport] = []
+        for appid in appids:
+            task = tasks.get(appid)
+            if task is None:
+                filtered.append(known[appid])
+            elif task in pending:
+                filtered.append(None)
+            elif task.exception() is not None:
+                logging.info(f"Error in protondb report of appid {appid}: {task.exception()!r}")
+                filtered.append(None)
+            else:
+                filtered.append(task.result())
+        return filtered, bool(pending)
@@ -1,3 +1,4 @@
+import sys
 from dataclasses import dataclass
 from enum import IntEnum
 
@@ -27,8 +28,10 @@ class ProtonDBTier(IntEnum):
     def from_int(cls, tier: int):
         return cls(tier)
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class ProtonDBReport:
+    """Immutable and hashable, so that it can be shared by every cache and result
+    holding it. Tiers are ProtonDBTier members, which are shared small ints"""
     bestReportedTier: ProtonDBTier
     confidence: str
     score: float
@@ -36,6 +39,18 @@ class ProtonDBReport:
     total: int
     """Total number of reports"""
     trendingTier: ProtonDBTier
+
+    def __post_init__(self):
+        # there are only a handful of distinct confidences
+        object.__setattr__(self, "confidence", sys.intern(self.confidence))
+
     def __repr__(self):
-        return str(self.__dict__)
+        return str({
+            'bestReportedTier': self.bestReportedTier,
+            'confidence': self.confidence,
+            'score': self.score,
+            'tier': self.tier,
+            'total': self.total,
+            'trendingTier': self.trendingTier,
+        })
 
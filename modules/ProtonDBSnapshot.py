@@ -0,0 +1,127 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Optional
+
+import aiohttp
+
+from modules.HttpClient import HttpClient
+from modules.Metrics import metrics
+from modules.ProtonDBReport import ProtonDBReport, ProtonDBTier
+from modules.db.ProtonDBRepository import ProtonDBRepository
+
+
+def parseSummaries(payload: bytes) -> dict[int, ProtonDBReport]:
+    """parses a bulk summaries dataset: a json array (or json lines) of objects shaped
+    like the reports/summaries api responses plus their appid, or an object mapping
+    appids to such responses. Entries without a usable tier (e.g. "pending") are skipped"""
+    text = payload.decode()
+    try:
+        entries = json.loads(text)
+    except json.JSONDecodeError:
+        entries = [json.loads(line) for line in text.splitlines() if line.strip()]
+    if isinstance(entries, dict):
+        entries = [entries] if "appid" in entries else [{**summary, "appid": appid} for appid, summary in entries.items()]
+
+    reports = {}
+    for entry in entries:
+        try:
+            reports[int(entry.get("appid", entry.get("appId")))] = ProtonDBReport(
+                bestReportedTier=ProtonDBTier[entry["bestReportedTier"].upper()],
+                confidence=entry["confidence"],
+                score=float(entry["score"]),
+                tier=ProtonDBTier[entry["tier"].upper()],
+                total=int(entry["total"]),
+                trendingTier=ProtonDBTier[entry["trendingTier"].upper()],
+            )
+        except (KeyError, TypeError, ValueError, AttributeError):
+            continue
+    return reports
+
+
+class ProtonDBSnapshot:
+    """Local copy of a bulk protondb summaries dataset, so that reports are looked up
+    in memory instead of requested per appid.
+
+    The dataset is read from source, a local file or an http(s) url, stored in
+    sqlite (so that restarts don't need it) and held in memory. Its watermark is
+    when it was ingested: once older than max_age_s, the snapshot isn't used and
+    ProtonDBClient goes back to per-appid requests until a refresh succeeds.
+    """
+
+    def __init__(self, repo: ProtonDBRepository, http: HttpClient, source: str, max_age_s: float = 3 * 24 * 60 * 60):
+        self.repo = repo
+        self.http = http
+        self.source = source
+        self.max_age_s = max_age_s
+        self._reports: dict[int, ProtonDBReport] = {}
+        self.watermark: Optional[int] = None
+        """unix time of the last successful ingestion"""
+
+    def isFresh(self) -> bool:
+        return self.watermark is not None and time.time() - self.watermark <= self.max_age_s
+
+    def get(self, appid: str) -> Optional[ProtonDBReport]:
+        return self._reports.get(int(appid))
+
+    def __len__(self):
+        return len(self._reports)
+
+    def _set(self, reports: dict[int, ProtonDBReport], watermark: Optional[int]):
+        self._reports, self.watermark = reports, watermark
+        metrics.set("protondb_snapshot.size", len(reports))
+        metrics.set("protondb_snapshot.watermark", watermark)
+
+    async def load(self):
+        """loads the last ingested dataset from sqlite"""
+        reports, watermark = await self.repo.load_summaries()
+        self._set(reports, watermark)
+        logging.warning(f"Loaded {len(reports)} protondb summaries ingested at {watermark}")
+
+    async def _download(self) -> bytes:
+        if not self.source.startswith(("http://", "https://")):
+            return await asyncio.to_thread(self._readFile)
+        # the dataset is far bigger than an api response, hence its own timeout
+        async with self.http.session.get(
+            self.source, timeout=aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=60)
+        ) as response:
+            response.raise_for_status()
+            return await response.read()
+
+    def _readFile(self) -> bytes:
+        with open(self.source, "rb") as f:
+            return f.read()
+
+    async def refresh(self) -> int:
+        """ingests the dataset from source, returning the number of summaries in it.
+        An empty or unparseable dataset leaves the current one in place"""
+        payload = await self._download()
+        reports = await asyncio.to_thread(parseSummaries, payload)
+        if not reports:
+            raise ValueError(f"no protondb summaries found in {self.source}")
+        watermark = await self.repo.replace_summaries(reports)
+        self._set(reports, watermark)
+        logging.warning(f"Ingested {len(reports)} protondb summaries from {self.source}")
+        return len(reports)
+
+    async def watch(self, interval_s: float):
+        """refreshes the dataset whenever it's older than interval_s, forever"""
+        while True:
+            if self.watermark is None or time.time() - self.watermark >= interval_s:
+                try:
+                    await self.refresh()
+                except Exception as e:
+                    logging.error(f"Failed to ingest protondb summaries from {self.source}: {e}")
+            await asyncio.sleep(min(interval_s, 10 * 60))
+
+    async def follow(self, interval_s: float = 60):
+        """reloads the dataset from sqlite whenever another process ingested a newer
+        one, checking every interval_s, forever"""
+        while True:
+            await asyncio.sleep(interval_s)
+            try:
+                if await self.repo.get_watermark() != self.watermark:
+                    await self.load()
+            except Exception as e:
+                logging.error(f"Failed to reload protondb summaries: {e}")
@@ -0,0 +1,60 @@
+import asyncio
+import itertools
+from typing import Awaitable, Callable, TypeVar
+
+from modules.Metrics import metrics
+
+T = TypeVar("T")
+
+
+class Superseded(Exception):
+    """the query was dropped because the same user sent a newer one"""
+
+
+class QueryScheduler:
+    """Runs at most one inline query per user.
+
+    Telegram sends a query for almost every keystroke, so when a user's newer
+    query arrives the older one is cancelled, and with a debounce window a
+    query only starts once the user stopped typing for debounce_s. Upstream
+    calls shared with other queries (see async_lru_cache_ttl) are not
+    cancelled with it and still fill the caches.
+    """
+
+    def __init__(self, debounce_s: float = 0):
+        self.debounce_s = debounce_s
+        self._sequence = itertools.count()
+        self._latest: dict[int, int] = {}
+        """user id -> sequence number of their newest query"""
+        self._running: dict[int, asyncio.Task] = {}
+
+    async def run(self, user_id: int, query: Callable[[], Awaitable[T]]) -> T:
+        """awaits query() unless a newer query of user_id supersedes it, raising Superseded then"""
+        sequence = next(self._sequence)
+        self._latest[user_id] = sequence
+        metrics.inc("inline_queries")
+
+        previous = self._running.pop(user_id, None)
+        if previous is not None and not previous.done():
+            previous.cancel()
+
+        try:
+            if self.debounce_s:
+                await asyncio.sleep(self.debounce_s)
+                if self._latest.get(user_id) != sequence:
+                    metrics.inc("inline_queries_debounced")
+                    raise Superseded()
+
+            task = asyncio.ensure_future(query())
+            self._running[user_id] = task
+            try:
+                return await task
+            except asyncio.CancelledError:
+                if task.cancelled() and self._latest.get(user_id) != sequence:
+                    metrics.inc("inline_queries_cancelled")
+                    raise Superseded()
+                raise
+        finally:
+            if self._latest.get(user_id) == sequence:
+                del self._latest[user_id]
+                self._running.pop(user_id, None)
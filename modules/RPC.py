@@ -0,0 +1,161 @@
+import asyncio
+import inspect
+import itertools
+import logging
+import os
+import pickle
+import struct
+from typing import Any, Callable, Optional
+
+_HEADER = struct.Struct(">I")
+
+
+class RemoteError(Exception):
+    """an exception raised by a remote call that couldn't be sent back as is"""
+
+
+async def _readMessage(reader: asyncio.StreamReader) -> Any:
+    (size,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    return pickle.loads(await reader.readexactly(size))
+
+
+def _writeMessage(writer: asyncio.StreamWriter, message: Any):
+    data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    writer.write(_HEADER.pack(len(data)) + data)
+
+
+class RPCServer:
+    """Serves calls of handlers to the worker processes, over a unix socket.
+
+    Messages are pickled, so the socket must only be reachable by the bot's
+    own processes: it's created with 0600 permissions, and should live in a
+    directory private to the bot. Requests of a connection run concurrently,
+    and handlers can be coroutine functions or plain ones.
+    """
+
+    def __init__(self, path: str, handlers: dict[str, Callable[..., Any]]):
+        self.path = path
+        self.handlers = handlers
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._tasks: set[asyncio.Task] = set()
+        self._writers: set[asyncio.StreamWriter] = set()
+
+    async def start(self):
+        self._server = await asyncio.start_unix_server(self._serve, path=self.path)
+        os.chmod(self.path, 0o600)
+
+    async def stop(self):
+        if self._server is None:
+            return
+        self._server.close()
+        for task in self._tasks:
+            task.cancel()
+        # wait_closed waits for the connections to be closed too
+        for writer in self._writers:
+            writer.close()
+        await self._server.wait_closed()
+        self._server = None
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._writers.add(writer)
+        try:
+            while True:
+                requestId, op, args = await _readMessage(reader)
+                task = asyncio.create_task(self._handle(writer, requestId, op, args))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _handle(self, writer: asyncio.StreamWriter, requestId: Optional[int], op: str, args: tuple):
+        try:
+            result = self.handlers[op](*args)
+            if inspect.isawaitable(result):
+                result = await result
+            response = (requestId, True, result)
+        except Exception as e:
+            if requestId is None:
+                logging.error(f"RPC notification {op} failed: {e}")
+            response = (requestId, False, e)
+
+        # notifications get no response
+        if requestId is None or writer.is_closing():
+            return
+        try:
+            _writeMessage(writer, response)
+        except Exception as e:
+            # e.g. an unpicklable result or exception
+            _writeMessage(writer, (requestId, False, RemoteError(f"{op}: {e!r}")))
+
+
+class RPCClient:
+    """Calls the handlers of an RPCServer over a single connection, matching
+    responses to their calls so that many can be in flight at once"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reading: Optional[asyncio.Task] = None
+        self._pending: dict[int, asyncio.Future] = {}
+        self._ids = itertools.count()
+
+    async def connect(self):
+        reader, self._writer = await asyncio.open_unix_connection(self.path)
+        self._reading = asyncio.create_task(self._readResponses(reader))
+
+    async def _readResponses(self, reader: asyncio.StreamReader):
+        error = ConnectionError("RPC client closed")
+        try:
+            while True:
+                requestId, ok, result = await _readMessage(reader)
+                future = self._pending.pop(requestId, None)
+                if future is None or future.done():
+                    continue
+                if ok:
+                    future.set_result(result)
+                else:
+                    future.set_exception(result)
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            error = ConnectionError(f"RPC server at {self.path} went away: {e}")
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(error)
+            self._pending.clear()
+
+    async def call(self, op: str, *args: Any) -> Any:
+        """the result of the server's op handler called with args"""
+        if self._writer is None or self._writer.is_closing():
+            raise ConnectionError(f"RPC client of {self.path} isn't connected")
+        requestId = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[requestId] = future
+        try:
+            _writeMessage(self._writer, (requestId, op, args))
+            await self._writer.drain()
+            return await future
+        finally:
+            self._pending.pop(requestId, None)
+
+    def notify(self, op: str, *args: Any):
+        """calls op without waiting for it, nor hearing of its failure"""
+        if self._writer is None or self._writer.is_closing():
+            raise ConnectionError(f"RPC client of {self.path} isn't connected")
+        _writeMessage(self._writer, (None, op, args))
+
+    async def drain(self):
+        """waits for the calls written so far to be sent"""
+        if self._writer is not None and not self._writer.is_closing():
+            await self._writer.drain()
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._reading is not None:
+            self._reading.cancel()
+            await asyncio.gather(self._reading, return_exceptions=True)
+            self._reading = None
@@ -0,0 +1,79 @@
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from modules.L2Cache import L2Cache
+from modules.Metrics import metrics
+from modules.RPC import RPCClient
+
+
+class SharedCache(L2Cache):
+    """L2Cache held in memory by the front process and shared by the worker
+    processes through SharedCacheClient, so that what one worker fetched is a
+    cache hit in the others.
+
+    Entries beyond maxsize are evicted least recently used first. With a
+    backing L2Cache (e.g. CacheRepository), writes go through to it and misses
+    are read from it, so the entries also survive restarts.
+    """
+
+    def __init__(self, maxsize: int = 200_000, backing: Optional[L2Cache] = None):
+        self.maxsize = maxsize
+        self.backing = backing
+        self._entries: OrderedDict[tuple[str, str], tuple[float, bytes]] = OrderedDict()
+
+    def _store(self, namespace: str, key: str, expires: float, payload: bytes):
+        self._entries[(namespace, key)] = (expires, payload)
+        self._entries.move_to_end((namespace, key))
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def get_many(self, namespace: str, keys: list[str]) -> dict[str, tuple[float, bytes]]:
+        now = time.time()
+        found, missing = {}, []
+        for key in keys:
+            entry = self._entries.get((namespace, key))
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end((namespace, key))
+                found[key] = entry
+            else:
+                missing.append(key)
+        metrics.inc("shared_cache.hits", len(found))
+        metrics.inc("shared_cache.misses", len(missing))
+
+        if missing and self.backing is not None:
+            stored = await self.backing.get_many(namespace, missing)
+            for key, (expires, payload) in stored.items():
+                # unless a put happened while the backing cache was read
+                if (namespace, key) not in self._entries:
+                    self._store(namespace, key, expires, payload)
+            found.update(stored)
+        metrics.set("shared_cache.size", len(self._entries))
+        return found
+
+    def put(self, namespace: str, key: str, expires: float, payload: bytes):
+        self._store(namespace, key, expires, payload)
+        if self.backing is not None:
+            self.backing.put(namespace, key, expires, payload)
+
+    async def flush(self):
+        if self.backing is not None:
+            await self.backing.flush()
+
+
+class SharedCacheClient(L2Cache):
+    """L2Cache of the worker processes, backed by the SharedCache of the front
+    process. Puts are sent without waiting for them"""
+
+    def __init__(self, rpc: RPCClient):
+        self.rpc = rpc
+
+    async def get_many(self, namespace: str, keys: list[str]) -> dict[str, tuple[float, bytes]]:
+        return await self.rpc.call("cache.get_many", namespace, keys)
+
+    def put(self, namespace: str, key: str, expires: float, payload: bytes):
+        self.rpc.notify("cache.put", namespace, key, expires, payload)
+
+    async def flush(self):
+        """waits for the puts made so far to be sent, before shutting down"""
+        await self.rpc.drain()
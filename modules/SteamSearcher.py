@@ -1,12 +1,20 @@
 from typing import Iterable, Optional, Union
 from attr import dataclass
 from gazpacho.soup import Soup
+from modules.AppCatalogIndex import AppCatalog
+from modules.AppDetailsCache import AppDetailsCache
+from modules.L2Cache import L2Codec
+from modules.Metrics import metrics
+from modules.PrefixResultCache import PrefixResultCache
+from modules.HttpClient import HttpClient
 from modules.ProtonDBClient import ProtonDBClient
-from bs4 import BeautifulSoup
+from modules.ProtonDBSnapshot import ProtonDBSnapshot
+from modules.SuggestParser import Suggestion, countSuggestionRows, parseSuggestions
 import aiohttp
 import asyncio
 from urllib.parse import quote_plus
 import time
+import json
 
 from modules.GameResult import GameResult
 from modules.async_lru_cache_ttl import async_lru_cache_ttl
@@ -14,6 +22,23 @@ from urllib.parse import urlencode
 import logging
 
 API_APP_DETAILS_URL = "https://store.steampowered.com/api/appdetails?filters=basic,price_overview"
+# country search/suggest is queried with, for every user
+SEARCH_COUNTRY = "US"
+# with only the price_overview filter, appdetails accepts a comma separated list of appids
+API_APP_PRICES_URL = "https://store.steampowered.com/api/appdetails?filters=price_overview"
+
+def _dumpSuggestions(found: tuple[dict[str, Suggestion], int]) -> bytes:
+    # suggestions are stored as json arrays of their fields, after the row count
+    appids, rows = found
+    return json.dumps((rows, list(appids.values())), separators=(",", ":")).encode()
+
+
+def _loadSuggestions(payload: bytes) -> tuple[dict[str, Suggestion], int]:
+    rows, suggestions = json.loads(payload)
+    return {fields[0]: Suggestion(*fields) for fields in suggestions}, rows
+
+
+APPIDS_L2 = L2Codec("suggestions", lambda self, gamenames: "\x1f".join(gamenames), _dumpSuggestions, _loadSuggestions)
 
 
 # WIP that uses the search endpoint rather than the appdetails one
@@ -63,89 +88,368 @@ async def _scrapSteam(query, MAX_RESULTS, cacheApp: dict = {}):
 class ScrapeResult:
     found_error: Union[bool, Exception]
     results: list[GameResult]
+    partial: bool = False
+    """some enrichment missed its budget, so the results are less complete than usual"""
 
 
 class SteamSearcher:
-    def __init__(self, MAX_RESULTS):
+    def __init__(self, MAX_RESULTS, http: HttpClient, detailsCache: Optional[AppDetailsCache] = None, batchDetails=False,
+                 catalog: Optional[AppCatalog] = None, catalogFirst=False, prefixCache: Optional[PrefixResultCache] = None,
+                 searchBudget_s: Optional[float] = None, detailsBudget_s: Optional[float] = None,
+                 protonDBBudget_s: Optional[float] = None, protonDBSnapshot: Optional[ProtonDBSnapshot] = None):
         self.MAX_RESULTS = MAX_RESULTS
         self.API_GAME_SEARCH = "https://store.steampowered.com/search/suggest"
         self.API_APP_DETAILS_URL = API_APP_DETAILS_URL
+        self.API_APP_PRICES_URL = API_APP_PRICES_URL
+        self.batchDetails = batchDetails
+        """fetch only prices, in a single request, taking names from the suggest results"""
+        self.catalog = catalog
+        """local app index used when search/suggest fails"""
+        self.catalogFirst = catalogFirst
+        """search the local app index before search/suggest, which is then only used when nothing was found"""
+        self.prefixCache = prefixCache
+        self.searchCountry = SEARCH_COUNTRY
+        self.http = http
+        self.protonDBClient = ProtonDBClient(http, snapshot=protonDBSnapshot)
+        self.detailsCache = detailsCache if detailsCache is not None else AppDetailsCache()
+        self._refreshing: dict[tuple[str, str], asyncio.Task] = {}
+        # how long each stage of scrapeGameResults may take before answering without it (None waits for it).
+        # searchBudget_s only applies with a catalog, which answers instead of a late search
+        self.searchBudget_s = searchBudget_s
+        self.detailsBudget_s = detailsBudget_s
+        self.protonDBBudget_s = protonDBBudget_s
+        self._late: set[asyncio.Task] = set()
+        """tasks that missed their budget, kept until they finish filling the caches"""
+
+    async def _getGameSuggestion(self, gamename: str) -> str:
+        params = {
+            "term": (gamename),
+            "f": "games",
+            "cc": self.searchCountry,
+            "realm": 1,
+            "l": "english",
+        }
+
+        logging.info(f"Searching games URL: {self.API_GAME_SEARCH}?{urlencode(params)}")
+
+        async with self.http.get(self.API_GAME_SEARCH, params=params) as response:
+            response.raise_for_status()
+            return await response.text()
+
+    async def _getGameSugestions(self, gamenames: Iterable[str]) -> list[str]:
+        """returns the suggest html of each given game name"""
+        return await asyncio.gather(
+            *(self._getGameSuggestion(gamename) for gamename in gamenames)
+        )
+
+    @async_lru_cache_ttl(stale_if_error_s=60 * 60 * 24, l2=APPIDS_L2)
+    async def getAppids(self, gamenames: Iterable[str]) -> tuple[dict[str, Suggestion], int]:
+        """analyzes html and returns dict of every appid found in the search for each given game name, mapped to its suggestion,
+        along with the number of rows steam sent, bundles and packages included.
+        Which games match barely depends on the country, so this is searched in searchCountry for every user and
+        the price text of the suggestions is the one of searchCountry"""
+        pages = await self._getGameSugestions(gamenames)
+        appids = {}
+        rows = 0
+        for html_content in pages:
+            rows += countSuggestionRows(html_content)
+            for suggestion in parseSuggestions(html_content):
+                appids.setdefault(suggestion.appid, suggestion)
+        return appids, rows
 
-    async def _getGameSugestions(self, gamenames: Iterable[str], country):
-        async with aiohttp.ClientSession() as session:
-            tasks = []
-            for gamename in gamenames:
-                params = {
-                    "term": (gamename),
-                    "f": "games",
-                    "cc": country,
-                    "realm": 1,
-                    "l": "english",
-                }
-                
-                logging.info(f"Searching games URL: {self.API_GAME_SEARCH}?{urlencode(params)}")
-
-                req = session.get(self.API_GAME_SEARCH, params=params)
-                tasks.append(req)
-
-            return await asyncio.gather(*tasks)
-
-    @async_lru_cache_ttl
-    async def getAppids(self, gamenames: Iterable[str],country):
-        "analyzes html and returns dict of every appid found in the search for each given game name. empty keys (for now)"
-        responses = await self._getGameSugestions(gamenames, country)
+    async def _getCandidates(self, query: str) -> dict[str, Suggestion]:
+        """the candidates of a single query: the local app catalog's with catalogFirst, else
+        search/suggest's, or the catalog's when search/suggest fails without a stale result.
+        The catalog is searched here rather than in getAppids, so that its answers are
+        neither cached as search/suggest's nor served before a stale search/suggest one"""
+        if self.catalog is not None and self.catalogFirst:
+            candidates = self._searchCatalog((query,))
+            if candidates:
+                return candidates
 
+        try:
+            return await self._getSuggestCandidates(query)
+        except Exception as e:
+            if self.catalog is None:
+                raise
+            logging.warning(f"search/suggest failed, searching the local app catalog: {e}")
+            return self._searchCatalog((query,))
+
+    async def _getSuggestCandidates(self, query: str) -> dict[str, Suggestion]:
+        """getAppids for a single query, answered from the candidates of an earlier
+        query it extends when possible. Those are only used when they were complete,
+        so the query's own aren't requested at all"""
+        if self.prefixCache is None:
+            return (await self.getAppids((query,)))[0]
+
+        candidates, exact = self.prefixCache.lookup(query)
+        if candidates is None:
+            return await self._fetchCandidates(query)
+        if not exact:
+            metrics.inc("prefix_cache_hits")
+        return candidates
+
+    async def _fetchCandidates(self, query: str) -> dict[str, Suggestion]:
+        assert self.prefixCache is not None
+        # only search/suggest's candidates are stored: the catalog's are cut at MAX_RESULTS
+        candidates, rows = await self.getAppids((query,))
+        self.prefixCache.put(query, candidates, rows)
+        return candidates
+
+    def _searchCatalog(self, gamenames: Iterable[str]) -> dict[str, Suggestion]:
+        assert self.catalog is not None
         appids = {}
-        for response in responses:
-            html_content = await response.text()
-            soup = BeautifulSoup(html_content, "html.parser")
-            for l in soup.find_all("a"):
-                if l.has_attr("data-ds-appid"):
-                    appids[l["data-ds-appid"]] = ""
+        for gamename in gamenames:
+            for suggestion in self.catalog.search(gamename, limit=self.MAX_RESULTS):
+                appids.setdefault(suggestion.appid, suggestion)
         return appids
 
-    async def _getGameDetailsFromAppid(self, appid, country, session) -> dict:
+    async def _getGameDetailsFromAppid(self, appid, country) -> dict:
         """makes steam api details request for given appid and returns future for it's json response"""
         params = {'appids':appid, "cc": country}
         logging.info(f"Getting gamedetails json: {self.API_APP_DETAILS_URL}?{urlencode(params)}")
 
-        async with session.get(self.API_APP_DETAILS_URL, params=params) as r:
-            return await r.json()
+        async with self.http.get(self.API_APP_DETAILS_URL, params=params) as r:
+            r.raise_for_status()
+            gamedetails = await r.json()
+        self.detailsCache.put(appid, country, gamedetails)
+        return gamedetails
+
+    async def _getPrices(self, appids: list[str], country) -> dict[str, Optional[dict]]:
+        """makes a single price_overview appdetails request for every given appid, caches
+        the prices and returns them, None for games without a price. Appids steam didn't
+        answer for are left out"""
+        params = {"appids": ",".join(appids), "cc": country}
+        logging.info(f"Getting game prices json: {self.API_APP_PRICES_URL}?{urlencode(params)}")
+
+        async with self.http.get(self.API_APP_PRICES_URL, params=params) as r:
+            r.raise_for_status()
+            prices = await r.json()
+
+        found = {}
+        for appid in appids:
+            result = prices.get(appid)
+            if not result or not result.get("success"):
+                continue
+            # games without a price come back with an empty list as data
+            overview = result["data"].get("price_overview") if isinstance(result["data"], dict) else None
+            self.detailsCache.putPrice(appid, country, overview)
+            found[appid] = overview
+        return found
+
+    async def _getGamePrices(self, suggestions: list[Suggestion], country) -> dict:
+        """makes a single price_overview appdetails request for every given suggestion and
+        returns appdetails-like json of each appid, with the name and is_free cached from an
+        earlier appdetails request, or else taken from the suggestion"""
+        found = await self._getPrices([s.appid for s in suggestions], country)
+
+        gamedetails = {}
+        for suggestion in suggestions:
+            if suggestion.appid not in found:
+                continue
+            if not self.detailsCache.hasStatic(suggestion.appid):
+                self.detailsCache.putStatic(suggestion.appid, suggestion.name, suggestion.is_free)
+            details = self.detailsCache.get(suggestion.appid, country)
+            if details is not None:
+                gamedetails[suggestion.appid] = details
+        return gamedetails
+
+    async def _refreshGameDetails(self, appid, country):
+        """refreshes the cached details of appid, requesting only its price when its
+        static part isn't about to expire"""
+        if self.detailsCache.hasStatic(appid, self.detailsCache.refresh_ahead_s):
+            await self._getPrices([appid], country)
+        else:
+            await self._getGameDetailsFromAppid(appid, country)
+
+    def _refreshInBackground(self, key, coro):
+        """runs coro, which refreshes cached entries, in the background, once per key"""
+        if key in self._refreshing:
+            coro.close()
+            return
+        task = asyncio.create_task(coro)
+        self._refreshing[key] = task
+
+        def on_done(t: asyncio.Task):
+            self._refreshing.pop(key, None)
+            if not t.cancelled() and t.exception() is not None:
+                logging.info(f"Background refresh {key} failed: {t.exception()}")
+
+        task.add_done_callback(on_done)
+
+    def _finishInBackground(self, task: asyncio.Task, stage: str, late: bool = True):
+        """lets a task that missed its budget (or whose query was cancelled, when not late)
+        finish, so that its result still gets cached"""
+        if late:
+            metrics.inc(f"budget_exceeded.{stage}")
+        self._late.add(task)
+
+        def on_done(t: asyncio.Task):
+            self._late.discard(t)
+            if not t.cancelled() and t.exception() is not None:
+                logging.info(f"Late {stage} failed: {t.exception()}")
+
+        task.add_done_callback(on_done)
+
+    async def _getCandidatesWithinBudget(self, query: str) -> dict[str, Suggestion]:
+        """_getCandidates, answered from the catalog instead if it takes longer than searchBudget_s"""
+        if self.searchBudget_s is None or self.catalog is None:
+            return await self._getCandidates(query)
+
+        task = asyncio.ensure_future(self._getCandidates(query))
+        try:
+            done, _ = await asyncio.wait((task,), timeout=self.searchBudget_s)
+        except asyncio.CancelledError:
+            # the query was given up on (e.g. superseded), the search may still be cached
+            self._finishInBackground(task, "search", late=False)
+            raise
+        if done:
+            return task.result()
+        candidates = self._searchCatalog((query,))
+        if not candidates:
+            # nothing better to answer with than waiting for the search
+            return await task
+        self._finishInBackground(task, "search")
+        return candidates
+
+    async def _getDetailsWithinBudget(self, details, appids, country) -> tuple[list, bool]:
+        """awaits the details coroutine for up to detailsBudget_s. When it's late, returns whatever
+        details of appids were cached (or stale) by then, and whether that happened"""
+        task = asyncio.ensure_future(details)
+        try:
+            done, _ = await asyncio.wait((task,), timeout=self.detailsBudget_s)
+        except asyncio.CancelledError:
+            self._finishInBackground(task, "details", late=False)
+            raise
+        if done:
+            return task.result(), False
+        self._finishInBackground(task, "details")
+        return [self.detailsCache.getStale(appid, country) for appid in appids], True
 
     #we need this only to get discount data, as _getGame_sugestions doesnt have it
-    async def _getAllGameDetails(self, appids, country, session):
-        """gets game details for each given appid and returns list with every response's json"""
-        tasks = [
-            asyncio.create_task(self._getGameDetailsFromAppid(appid, country, session))
-            for appid in appids
+    async def _getAllGameDetails(self, appids, country):
+        """gets game details for each given appid and returns list with every response's json.
+        Appids whose details couldn't be fetched are stale cached details or None"""
+        await self.detailsCache.load(appids, country)
+        results = [self.detailsCache.get(appid, country) for appid in appids]
+        for appid, cached in zip(appids, results):
+            if cached is not None and self.detailsCache.needsRefresh(appid, country):
+                self._refreshInBackground((appid, country), self._refreshGameDetails(appid, country))
+
+        misses = [i for i, cached in enumerate(results) if cached is None]
+        fetched = await asyncio.gather(
+            *(self._getGameDetailsFromAppid(appids[i], country) for i in misses),
+            return_exceptions=True,
+        )
+        for i, gamedetails in zip(misses, fetched):
+            if isinstance(gamedetails, Exception):
+                logging.warning(f"appdetails request of {appids[i]} failed: {gamedetails}")
+                gamedetails = self.detailsCache.getStale(appids[i], country)
+            results[i] = gamedetails
+        return results
+
+    async def _getAllGameDetailsBatched(self, suggestions: list[Suggestion], country):
+        """like _getAllGameDetails, but with at most one request for all the uncached appids.
+        Appids whose price couldn't be fetched are stale cached details or None in the returned list"""
+        await self.detailsCache.load((s.appid for s in suggestions), country)
+        results = [self.detailsCache.get(s.appid, country) for s in suggestions]
+        stale = [
+            s for s, cached in zip(suggestions, results)
+            if cached is not None and self.detailsCache.needsRefresh(s.appid, country)
         ]
-        results = await asyncio.gather(*tasks)
+        if stale:
+            self._refreshInBackground(
+                (tuple(s.appid for s in stale), country), self.warmGameDetails(stale, country))
+
+        misses = [i for i, cached in enumerate(results) if cached is None]
+        batched = [i for i in misses if self._knowsIsFree(suggestions[i])]
+        full = [i for i in misses if i not in batched]
+        prices, *fetched = await asyncio.gather(
+            self._getGamePrices([suggestions[i] for i in batched], country) if batched else asyncio.sleep(0, {}),
+            *(self._getGameDetailsFromAppid(suggestions[i].appid, country) for i in full),
+            return_exceptions=True,
+        )
+        if isinstance(prices, Exception):
+            logging.warning(f"Batch price request failed, using stale prices or search results only: {prices}")
+            prices = {}
+        for i in batched:
+            appid = suggestions[i].appid
+            results[i] = prices.get(appid) or self.detailsCache.getStale(appid, country)
+        for i, gamedetails in zip(full, fetched):
+            if isinstance(gamedetails, Exception):
+                logging.warning(f"appdetails request of {suggestions[i].appid} failed: {gamedetails}")
+                gamedetails = self.detailsCache.getStale(suggestions[i].appid, country)
+            results[i] = gamedetails
         return results
 
+    def _knowsIsFree(self, suggestion: Suggestion) -> bool:
+        """whether a price request is enough for suggestion: catalog results (and unpriced
+        suggest rows) don't tell whether the game is free, unless it's cached already"""
+        return suggestion.price is not None or self.detailsCache.hasStatic(suggestion.appid)
+
+    async def warmGameDetails(self, suggestions: list[Suggestion], country, within_s: Optional[float] = None) -> int:
+        """fetches the details of the given games that aren't cached or expire within within_s
+        (the cache's refresh_ahead_s by default), as a query would, and returns how many were.
+        The prices of those whose static part stays cached are fetched in a single request,
+        and so are, in batch mode, the ones with a name and a price text telling whether
+        they're free (which catalog results lack)"""
+        await self.detailsCache.load((s.appid for s in suggestions), country)
+        cold = [
+            s for s in suggestions
+            if self.detailsCache.get(s.appid, country) is None
+            or self.detailsCache.needsRefresh(s.appid, country, within_s)
+        ]
+        if not cold:
+            return 0
+        # the ones whose name and is_free stay cached only need their price
+        window = self.detailsCache.refresh_ahead_s if within_s is None else within_s
+        pricesOnly = [s.appid for s in cold if self.detailsCache.hasStatic(s.appid, window)]
+        rest = [s for s in cold if s.appid not in pricesOnly]
+        batched = [s for s in rest if s.name and s.price is not None] if self.batchDetails else []
+        await asyncio.gather(
+            *((self._getPrices(pricesOnly, country),) if pricesOnly else ()),
+            *((self._getGamePrices(batched, country),) if batched else ()),
+            *(self._getGameDetailsFromAppid(s.appid, country) for s in rest if s not in batched),
+        )
+        return len(cold)
+
     async def scrapeGameResults(self, query: str, country:str) -> ScrapeResult:
         """gets game details for each appid found in the search for the given
         query(game name) and makes GameResult obj from each of those and returns a list of them all
         """
 
-        appids = tuple((await self.getAppids((query,), country)).keys())
+        # candidates are shared by every country, only prices are fetched per country
+        suggestions = await self._getCandidatesWithinBudget(query)
+        appids = tuple(suggestions.keys())
+
+        if self.batchDetails:
+            details = self._getAllGameDetailsBatched(list(suggestions.values()), country)
+        else:
+            details = self._getAllGameDetails(appids, country)
 
-        async with aiohttp.ClientSession() as session:
-            gamedetails, protondbs = await asyncio.gather(
-                self._getAllGameDetails(appids,country, session),
-                ProtonDBClient.getReports(appids),
+        # both budgets run concurrently, from now on
+        (gamedetails, detailsLate), (protondbs, protonDBLate) = await asyncio.gather(
+            self._getDetailsWithinBudget(details, appids, country),
+            self.protonDBClient.getReports(appids, timeout_s=self.protonDBBudget_s),
+        )
+        # hopefully, their order is the same
+
+        raw_results = [
+            GameResult.makeGameResultFromSteamApiGameDetails(
+                gameDetail, protonDBReport=protondb,country=country
             )
-            # hopefully, their order is the same
-
-            raw_results = [
-                GameResult.makeGameResultFromSteamApiGameDetails(
-                    gameDetail, protonDBReport=protondb,country=country
-                )
-                for gameDetail, protondb in zip(gamedetails, protondbs)
-            ]
-            return ScrapeResult(
-                (None in raw_results),
-                [result for result in raw_results if result is not None],
+            if gameDetail is not None
+            else GameResult.makeGameResultFromSuggestion(
+                suggestions[appid], protonDBReport=protondb, country=country,
+                showPrice=country == self.searchCountry,
             )
+            for appid, gameDetail, protondb in zip(appids, gamedetails, protondbs)
+        ]
+        return ScrapeResult(
+            (None in raw_results),
+            [result for result in raw_results if result is not None],
+            partial=detailsLate or protonDBLate,
+        )
 
 
 # debug
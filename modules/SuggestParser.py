@@ -0,0 +1,90 @@
+from html import unescape
+from typing import NamedTuple, Optional
+
+
+class Suggestion(NamedTuple):
+    """a result of the search/suggest endpoint"""
+    appid: str
+    name: str
+    price: Optional[str]
+    """price text as shown by steam (e.g. '$59.99' or 'Free To Play'), if any"""
+    thumbnail: Optional[str] = None
+
+    @property
+    def is_free(self) -> bool:
+        return bool(self.price) and self.price.lower().startswith("free")
+
+
+def _textAfter(html: str, marker: str, start: int, end: int) -> Optional[str]:
+    """text of the element whose opening tag contains marker, searching only html[start:end].
+    Only the first text node is returned, nested elements are not descended into"""
+    i = html.find(marker, start, end)
+    if i == -1:
+        return None
+    i = html.find(">", i, end)
+    if i == -1:
+        return None
+    j = html.find("<", i + 1, end)
+    if j == -1:
+        j = end
+    return html[i + 1 : j].strip()
+
+
+def _attr(html: str, attr: str, start: int, end: int) -> Optional[str]:
+    """value of a double quoted attribute (attr given as 'name="'), searching only html[start:end]"""
+    i = html.find(attr, start, end)
+    if i == -1:
+        return None
+    i += len(attr)
+    j = html.find('"', i, end)
+    if j == -1:
+        return None
+    return html[i:j]
+
+
+def parseSuggestions(html: str) -> list[Suggestion]:
+    """extracts every app of a search/suggest response, in the order steam ranked them.
+
+    Walks the markup once with str.find over each <a> match instead of building
+    a tree, only slicing out the fields that are kept. Bundles and packages,
+    which have no data-ds-appid, are skipped.
+    """
+    results: list[Suggestion] = []
+    find = html.find
+    length = len(html)
+
+    pos = find("<a ")
+    while pos != -1:
+        end = find("</a>", pos)
+        if end == -1:
+            end = length
+        tagEnd = find(">", pos, end)
+        if tagEnd == -1:
+            break
+
+        appid = _attr(html, 'data-ds-appid="', pos, tagEnd)
+        if appid:
+            name = _textAfter(html, 'class="match_name', tagEnd, end) or ""
+            if "&" in name:
+                name = unescape(name)
+
+            price = _textAfter(html, 'class="match_price', tagEnd, end)
+            if not price:
+                # discounted prices are nested in a discount block
+                price = _textAfter(html, 'class="discount_final_price', tagEnd, end)
+
+            results.append(Suggestion(
+                appid=appid,
+                name=name,
+                price=price or None,
+                thumbnail=_attr(html, '<img src="', tagEnd, end),
+            ))
+
+        pos = find("<a ", end)
+    return results
+
+
+def countSuggestionRows(html: str) -> int:
+    """number of rows of a search/suggest response, bundles and packages included,
+    which tells whether steam cut it at its row limit"""
+    return html.count("<a ")
@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from modules.Metrics import metrics
+
+
+class UpstreamUnavailable(Exception):
+    """the request wasn't sent: the host's circuit is open or its rate limit is exhausted"""
+
+
+background_share: ContextVar[Optional[float]] = ContextVar("background_share", default=None)
+"""set by background work such as CacheWarmer to the share of each upstream's rate
+it may use. Its requests then only go out while the rest is left for user queries"""
+
+
+class TokenBucket:
+    """Token bucket whose rate adapts to the upstream: halved whenever it throttles
+    us (429/5xx), then increased additively on every success up to max_rate."""
+
+    def __init__(self, rate: float, burst: float, min_rate: Optional[float] = None, increase: Optional[float] = None):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate if min_rate is not None else rate / 16
+        self.increase = increase if increase is not None else rate / 50
+        self.tokens = burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, reserve: float = 0) -> float:
+        """seconds until a token is available while keeping reserve tokens in the bucket"""
+        now = time.monotonic()
+        self._refill(now)
+        paused = max(0.0, self._paused_until - now)
+        missing = max(0.0, 1 + reserve - self.tokens)
+        return max(paused, missing / self.rate)
+
+    def try_acquire(self, reserve: float = 0) -> bool:
+        """takes a token only if one is available right away and reserve tokens remain
+        after it, so that background work can't drain the bucket"""
+        if self.wait_time(reserve) > 0:
+            return False
+        self.tokens -= 1
+        return True
+
+    async def acquire(self, max_wait_s: float = float("inf")):
+        wait = self.wait_time()
+        if wait > max_wait_s:
+            raise UpstreamUnavailable(f"rate limited for {wait:.1f}s")
+        # taken ahead of time: concurrent waiters queue up behind it
+        self.tokens -= 1
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def on_throttled(self, retry_after_s: Optional[float] = None):
+        self.rate = max(self.min_rate, self.rate / 2)
+        if retry_after_s:
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after_s)
+
+    def on_success(self):
+        self.rate = min(self.max_rate, self.rate + self.increase)
+
+
+class CircuitBreaker:
+    """Opens after failure_threshold consecutive failures, rejecting every request
+    for reset_timeout_s, then lets a single probe through (half open) and closes
+    again once it succeeds. A probe whose outcome never came is replaced by
+    another one after reset_timeout_s"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout_s: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self.state = CircuitBreaker.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_at: Optional[float] = None
+
+    def allow(self) -> bool:
+        if self.state == CircuitBreaker.CLOSED:
+            return True
+        now = time.monotonic()
+        if self.state == CircuitBreaker.OPEN and now - self._opened_at >= self.reset_timeout_s:
+            self.state = CircuitBreaker.HALF_OPEN
+            self._probe_at = None
+        if self.state == CircuitBreaker.HALF_OPEN and (
+            self._probe_at is None or now - self._probe_at >= self.reset_timeout_s
+        ):
+            self._probe_at = now
+            return True
+        return False
+
+    def on_success(self):
+        self.failures = 0
+        self.state = CircuitBreaker.CLOSED
+
+    def on_failure(self):
+        self.failures += 1
+        if self.state == CircuitBreaker.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = CircuitBreaker.OPEN
+            self._opened_at = time.monotonic()
+
+
+class UpstreamGuard:
+    """Rate limit and circuit breaker of one upstream host, reporting to metrics"""
+
+    def __init__(self, host: str, rate: float, burst: float, max_wait_s: float = 2,
+                 failure_threshold: int = 5, reset_timeout_s: float = 30):
+        self.host = host
+        self.max_wait_s = max_wait_s
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout_s)
+        self._next_background = 0.0
+        self._report()
+
+    def _report(self):
+        metrics.set(f"upstream.{self.host}.circuit", self.breaker.state)
+        metrics.set(f"upstream.{self.host}.rate", round(self.bucket.rate, 2))
+
+    async def acquire(self):
+        """waits for the rate limit, raising UpstreamUnavailable instead if that'd take
+        more than max_wait_s or if the circuit is open"""
+        share = background_share.get()
+        if share is not None:
+            return await self._acquire_background(share)
+        # rate checked first, so that a half open circuit doesn't spend its probe on it
+        wait = self.bucket.wait_time()
+        if wait > self.max_wait_s:
+            metrics.inc(f"upstream.{self.host}.rejected")
+            raise UpstreamUnavailable(f"{self.host} rate limited for {wait:.1f}s")
+        if not self.breaker.allow():
+            metrics.inc(f"upstream.{self.host}.rejected")
+            raise UpstreamUnavailable(f"circuit to {self.host} is open")
+        await self.bucket.acquire()
+
+    async def _acquire_background(self, share: float):
+        await self.pace_background(share)
+        self.bucket.tokens -= 1
+
+    async def pace_background(self, share: float):
+        """waits, for as long as needed, until a request can be sent at share of the current
+        rate, with (1 - share) of the burst still available to user queries. The token
+        isn't taken: the request sent right after, through acquire, takes it"""
+        reserve = self.bucket.burst * (1 - share)
+        while True:
+            # background requests never probe a circuit that isn't closed
+            if self.breaker.state != CircuitBreaker.CLOSED:
+                raise UpstreamUnavailable(f"circuit to {self.host} is {self.breaker.state}")
+            now = time.monotonic()
+            wait = max(self.bucket.wait_time(reserve), self._next_background - now)
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+        self._next_background = now + 1 / (share * self.bucket.rate)
+
+    def on_response(self, status: int, retry_after_s: Optional[float] = None):
+        if status == 429 or status >= 500:
+            metrics.inc(f"upstream.{self.host}.throttled")
+            self.bucket.on_throttled(retry_after_s)
+            self.on_failure()
+            return
+        self.bucket.on_success()
+        if self.breaker.state != CircuitBreaker.CLOSED:
+            logging.warning(f"Circuit to {self.host} is now {CircuitBreaker.CLOSED}")
+        self.breaker.on_success()
+        self._report()
+
+    def on_failure(self):
+        previous = self.breaker.state
+        self.breaker.on_failure()
+        metrics.inc(f"upstream.{self.host}.failures")
+        if previous != self.breaker.state:
+            logging.warning(f"Circuit to {self.host} is now {self.breaker.state}")
+        self._report()
@@ -0,0 +1,59 @@
+import hmac
+import json
+import logging
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """Receives updates pushed by telegram on an embedded aiohttp server and
+    feeds them to the application's update queue, in place of run_polling.
+
+    Requests without the secret token given to setWebhook are rejected, so only
+    telegram can submit updates.
+    """
+
+    def __init__(self, application: Application, secret_token: str, path="/telegram", host="0.0.0.0", port=8443):
+        self.application = application
+        self.secret_token = secret_token
+        self.path = path
+        self.host = host
+        self.port = port
+        self._runner: web.AppRunner | None = None
+
+    async def _handleUpdate(self, request: web.Request) -> web.Response:
+        token = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(token.encode(), self.secret_token.encode()):
+            logging.warning(f"Webhook request from {request.remote} with a wrong secret token")
+            return web.Response(status=403)
+
+        try:
+            update = Update.de_json(await request.json(), self.application.bot)
+        except (json.JSONDecodeError, ValueError, TypeError, KeyError) as e:
+            logging.warning(f"Malformed webhook update: {e}")
+            return web.Response(status=400)
+
+        # answered right away: the update is handled by the application, whose
+        # concurrent_updates setting bounds how many run at once
+        await self.application.update_queue.put(update)
+        return web.Response()
+
+    def makeApp(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self._handleUpdate)
+        return app
+
+    async def start(self):
+        self._runner = web.AppRunner(self.makeApp(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logging.info(f"Webhook server listening on {self.host}:{self.port}{self.path}")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import multiprocessing
+import queue
+from typing import Any, Callable
+
+from telegram import Update
+
+from modules.Metrics import metrics
+
+
+class WorkerPool:
+    """Worker processes handling the updates received by the front process.
+
+    Updates are dispatched by user id, so every update of a user goes to the
+    same worker, in order, and per user state (debouncing, the user country
+    cache) stays within a process. Each worker is started as
+    target(index, workers, updates, *args), and must handle the update dicts
+    it gets from its updates queue until it gets None.
+    """
+
+    def __init__(self, target: Callable[..., Any], workers: int, args: tuple = (), queueSize: int = 10_000):
+        self.target = target
+        self.workers = workers
+        self.args = args
+        self.queueSize = queueSize
+        # spawned rather than forked: the front process has threads and an event loop
+        self._context = multiprocessing.get_context("spawn")
+        self._queues = [self._context.Queue(queueSize) for _ in range(workers)]
+        self._processes: list[Any] = [None] * workers
+
+    def _spawn(self, index: int):
+        process = self._context.Process(
+            target=self.target,
+            args=(index, self.workers, self._queues[index], *self.args),
+            name=f"worker-{index}",
+        )
+        process.start()
+        self._processes[index] = process
+
+    def start(self):
+        for index in range(self.workers):
+            self._spawn(index)
+        logging.warning(f"Started {self.workers} worker processes")
+
+    def shard(self, update: Update) -> int:
+        user = update.effective_user
+        return (user.id if user else update.update_id) % self.workers
+
+    async def dispatch(self, update: Update, context=None):
+        """handler of the front process, passing update on to its worker"""
+        index = self.shard(update)
+        try:
+            self._queues[index].put_nowait(update.to_dict())
+            metrics.inc(f"workers.dispatched.{index}")
+        except queue.Full:
+            # the worker is stuck or far behind: the user will retry anyway
+            metrics.inc(f"workers.dropped.{index}")
+            logging.error(f"Dropped update {update.update_id}, the queue of worker {index} is full")
+
+    async def watch(self, interval_s: float = 5):
+        """restarts the workers that died, every interval_s, forever.
+        A worker killed while reading its queue may hold the queue's lock for
+        good, so it gets a new one, losing the updates still in the old one"""
+        while True:
+            await asyncio.sleep(interval_s)
+            for index, process in enumerate(self._processes):
+                if process is not None and not process.is_alive():
+                    logging.error(f"Worker {index} exited with code {process.exitcode}, restarting it")
+                    metrics.inc("workers.restarts")
+                    self._queues[index].close()
+                    self._queues[index].cancel_join_thread()
+                    self._queues[index] = self._context.Queue(self.queueSize)
+                    self._spawn(index)
+
+    async def stop(self, timeout_s: float = 10):
+        """lets the workers handle the updates already dispatched and waits for
+        them to exit, terminating those that take longer than timeout_s"""
+        for updates in self._queues:
+            try:
+                await asyncio.to_thread(updates.put, None, timeout=timeout_s)
+            except queue.Full:
+                pass
+        for index, process in enumerate(self._processes):
+            if process is None:
+                continue
+            await asyncio.to_thread(process.join, timeout_s)
+            if process.is_alive():
+                logging.error(f"Worker {index} didn't exit in {timeout_s}s, terminating it")
+                process.terminate()
+                await asyncio.to_thread(process.join)
+        for updates in self._queues:
+            updates.close()
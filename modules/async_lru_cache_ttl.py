@@ -1,42 +1,258 @@
-from typing import List, Callable, Tuple, Any
-import heapq
+from collections import OrderedDict
+from typing import Callable, NamedTuple, Optional, Tuple, Any
 import time
 import asyncio
-from functools import wraps
+import contextvars
+import logging
+from functools import wraps, partial
 
+from modules.L2Cache import L2Cache, L2Codec
 
-def async_lru_cache_ttl(f: Callable, maxsize=5000, delta_s=60*60*48):
-    cache: dict[Tuple, Tuple[float, float, Any]] = {}
-    heap: List[Tuple[float, Tuple]] = []
-    lock = asyncio.Lock()
+_l2_backend: Optional[L2Cache] = None
+
+
+def set_l2_backend(backend: Optional[L2Cache]):
+    """sets the L2Cache of every async_lru_cache_ttl given an l2 codec. Their
+    in-memory misses are then looked up in it before calling the function"""
+    global _l2_backend
+    _l2_backend = backend
+
+
+class NegativeResult(Exception):
+    """raised by a cached coroutine for a definitive "not found": callers get
+    value instead of the exception, and it's cached for ttl_s, or for the
+    decorator's negative_ttl_s"""
+
+    def __init__(self, value: Any = None, ttl_s: Optional[float] = None):
+        super().__init__(value, ttl_s)
+        self.value = value
+        self.ttl_s = ttl_s
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    stale_hits: int
+    maxsize: int
+    currsize: int
+    inflight: int
+
+
+def async_lru_cache_ttl(f: Optional[Callable] = None, maxsize=5000, delta_s=60*60*48, stale_if_error_s=0,
+                        negative_ttl_s: Optional[float] = None, error_ttl_s=0, sweep_interval_s=60,
+                        l2: Optional[L2Codec] = None):
+    """caches the results of the coroutine f by its arguments, evicting the least
+    recently used entry beyond maxsize entries.
+    Concurrent calls with the same key share a single in-flight call of f:
+    every caller awaits the same task, and a failure is propagated to all of
+    them. That call runs in an empty contextvars context, not the one of the
+    caller that started it.
+
+    Each outcome has its own ttl: delta_s for values, negative_ttl_s (delta_s
+    by default) for NegativeResult and error_ttl_s for any other exception,
+    which is raised again to the calls made meanwhile (not cached by default).
+    With stale_if_error_s, a value expired less than stale_if_error_s ago is
+    returned instead of the exception when refreshing it fails.
+    Entries that can't be served anymore are swept every sweep_interval_s.
+
+    With an l2 codec, values and negative results are also written to the
+    L2Cache set by set_l2_backend, and read back from it on misses, e.g. after
+    a restart, for the rest of their ttl.
+
+    Like functools.lru_cache, the wrapper has cache_info() and cache_clear(), and
+    remaining_ttl(*args) and refresh(*args) let an entry be refreshed before it expires,
+    and load(*args) reads an entry from the l2 cache without calling f.
+    Usable both as @async_lru_cache_ttl and @async_lru_cache_ttl(...)."""
+    if f is None:
+        return partial(async_lru_cache_ttl, maxsize=maxsize, delta_s=delta_s, stale_if_error_s=stale_if_error_s,
+                       negative_ttl_s=negative_ttl_s, error_ttl_s=error_ttl_s, sweep_interval_s=sweep_interval_s,
+                       l2=l2)
+    if negative_ttl_s is None:
+        negative_ttl_s = delta_s
+
+    _NO_VALUE = object()
+    # key -> (expires, stale until, value, error), least recently used first.
+    # an error entry keeps the value it replaced, which is served until stale until
+    cache: OrderedDict[Tuple, Tuple[float, float, Any, Optional[BaseException]]] = OrderedDict()
+    inflight: dict[Tuple, asyncio.Task] = {}
+    stats = {"hits": 0, "misses": 0, "stale_hits": 0}
+    next_sweep = time.monotonic() + sweep_interval_s
+
+    # every cache access below happens without awaiting, so the event loop
+    # can't interleave two of them and no lock is needed.
+    def store(key, expires, stale_until, val, error=None):
+        cache[key] = (expires, stale_until, val, error)
+        cache.move_to_end(key)
+        while len(cache) > maxsize:
+            cache.popitem(last=False)
+
+    def sweep(curtime):
+        """drops the entries that are past both their ttl and their stale period"""
+        nonlocal next_sweep
+        next_sweep = curtime + sweep_interval_s
+        dead = [k for k, (expires, stale_until, _, _) in cache.items() if curtime > max(expires, stale_until)]
+        for k in dead:
+            del cache[k]
+
+    def l2_put(l2key, ttl_s, value):
+        if _l2_backend is None:
+            return
+        try:
+            _l2_backend.put(l2.namespace, l2key, time.time() + ttl_s, l2.dumps(value))
+        except Exception as e:
+            logging.warning(f"L2 cache put of {l2.namespace}/{l2key} failed: {e}")
+
+    async def l2_get(l2key):
+        """returns (value, remaining ttl) or None"""
+        try:
+            found = await _l2_backend.get(l2.namespace, l2key)
+            if found is not None:
+                expires, payload = found
+                return l2.loads(payload), expires - time.time()
+        except Exception as e:
+            logging.warning(f"L2 cache get of {l2.namespace}/{l2key} failed: {e}")
+        return None
+
+    async def l2_load(key, l2key):
+        """stores the unexpired l2 entry of key in memory, returning it as a 1-tuple, or None"""
+        found = await l2_get(l2key)
+        if found is None or found[1] <= 0:
+            return None
+        value, ttl_s = found
+        expires = time.monotonic() + ttl_s
+        store(key, expires, expires + stale_if_error_s, value)
+        return (value,)
+
+    async def call(key, args, kwargs, read_l2=True):
+        """the shared call of f for key, storing its outcome"""
+        l2key = None
+        if l2 is not None and _l2_backend is not None:
+            l2key = l2.key(*args, **kwargs)
+            found = await l2_load(key, l2key) if read_l2 else None
+            if found is not None:
+                return found[0]
+
+        try:
+            value = await f(*args, **kwargs)
+        except NegativeResult as e:
+            ttl_s = e.ttl_s if e.ttl_s is not None else negative_ttl_s
+            expires = time.monotonic() + ttl_s
+            store(key, expires, expires, e.value)
+            if l2key is not None:
+                l2_put(l2key, ttl_s, e.value)
+            raise
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if error_ttl_s:
+                _, stale_until, stale, _ = cache.get(key, (0, 0, _NO_VALUE, None))
+                store(key, time.monotonic() + error_ttl_s, stale_until, stale, e)
+            raise
+
+        expires = time.monotonic() + delta_s
+        store(key, expires, expires + stale_if_error_s, value)
+        if l2key is not None:
+            l2_put(l2key, delta_s, value)
+        return value
+
+    def on_done(key, task: asyncio.Task):
+        inflight.pop(key, None)
+        # retrieving the exception silences "never retrieved" warnings
+        # when every waiter was cancelled before the call finished
+        if not task.cancelled():
+            task.exception()
 
     @wraps(f)
     async def ff(*args, **kwargs):
         key = args + tuple(sorted(kwargs.items()))
         curtime = time.monotonic()
+        stale = _NO_VALUE
+        if curtime >= next_sweep:
+            sweep(curtime)
 
-        async with lock:
-            if key in cache:
-                created, last_access, value = cache[key]
-                if curtime - created <= delta_s:
-                    cache[key] = (created, curtime, value)
-                    heapq.heappush(heap, (curtime, key))
+        entry = cache.get(key)
+        if entry is not None:
+            expires, stale_until, value, error = entry
+            if curtime <= expires:
+                cache.move_to_end(key)
+                stats["hits"] += 1
+                if error is None:
+                    return value
+                if value is not _NO_VALUE and curtime <= stale_until:
+                    stats["stale_hits"] += 1
                     return value
-                else:
-                    cache.pop(key)
+                raise error.with_traceback(None)
+            elif curtime <= stale_until and value is not _NO_VALUE:
+                # kept until the refresh succeeds, replacing it
+                stale = value
+            else:
+                del cache[key]
+        stats["misses"] += 1
 
-        val = await f(*args, **kwargs)
-        curtime = time.monotonic()
+        return await join(key, args, kwargs, stale)
+
+    async def join(key, args, kwargs, stale, read_l2=True):
+        """awaits the in-flight call of key, starting it if there's none"""
+        task = inflight.get(key)
+        if task is None:
+            # run in an empty context rather than a copy of this caller's: the call is
+            # shared, and e.g. a background_share set by a cache warmer mustn't pace the
+            # user queries joining it
+            task = asyncio.get_running_loop().create_task(
+                call(key, args, kwargs, read_l2), context=contextvars.Context())
+            inflight[key] = task
+            task.add_done_callback(lambda t: on_done(key, t))
+
+        # shielded so that a caller giving up doesn't cancel the call for the others
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            raise
+        except NegativeResult as e:
+            return e.value
+        except Exception:
+            if stale is _NO_VALUE:
+                raise
+            stats["stale_hits"] += 1
+            return stale
+
+    def remaining_ttl(*args, **kwargs) -> Optional[float]:
+        """seconds until the cached outcome of these arguments expires (negative once
+        expired), or None if there's none in memory"""
+        entry = cache.get(args + tuple(sorted(kwargs.items())))
+        if entry is None:
+            return None
+        return entry[0] - time.monotonic()
 
-        async with lock:
-            while len(cache) >= maxsize:
-                access, k = heapq.heappop(heap)
-                if k in cache and access == cache[k][1]:
-                    cache.pop(k)
+    async def refresh(*args, **kwargs):
+        """calls f for these arguments even if their outcome is cached, without reading
+        the l2 cache, and caches the new outcome. Calls made meanwhile keep getting
+        the cached one, and the current value is returned if f fails"""
+        key = args + tuple(sorted(kwargs.items()))
+        entry = cache.get(key)
+        stale = entry[2] if entry is not None and entry[3] is None else _NO_VALUE
+        return await join(key, args, kwargs, stale, read_l2=False)
+
+    async def load(*args, **kwargs) -> bool:
+        """reads the l2 entry of these arguments into memory, without calling f, unless
+        an outcome is there already. Returns whether there's one in memory afterwards"""
+        key = args + tuple(sorted(kwargs.items()))
+        if key not in cache and l2 is not None and _l2_backend is not None:
+            await l2_load(key, l2.key(*args, **kwargs))
+        return key in cache
 
-            cache[key] = (curtime, curtime, val)
-            heapq.heappush(heap, (curtime, key))
+    def cache_info() -> CacheInfo:
+        return CacheInfo(stats["hits"], stats["misses"], stats["stale_hits"], maxsize, len(cache), len(inflight))
 
-        return val
+    def cache_clear():
+        """empties the cache and its statistics. Calls in flight still share their result"""
+        cache.clear()
+        for k in stats:
+            stats[k] = 0
 
+    ff.cache_info = cache_info  # type:ignore
+    ff.cache_clear = cache_clear  # type:ignore
+    ff.remaining_ttl = remaining_ttl  # type:ignore
+    ff.refresh = refresh  # type:ignore
+    ff.load = load  # type:ignore
     return ff
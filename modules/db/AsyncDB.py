@@ -0,0 +1,26 @@
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, TypeVar
+
+T = TypeVar("T")
+
+
+class AsyncDB:
+    """Owns the sqlite connection and runs every query on one dedicated thread,
+    so that a slow fsync never blocks the event loop. Using a single thread also
+    serializes all writes, as sqlite wants."""
+
+    def __init__(self, db: sqlite3.Connection):
+        self.db = db
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        """runs fn(connection, *args) on the db thread and returns its result"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(fn, self.db, *args))
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.db.close()
@@ -0,0 +1,96 @@
+import sqlite3
+import logging
+import asyncio
+import time
+from typing import Optional
+
+from modules.L2Cache import L2Cache
+from modules.db.AsyncDB import AsyncDB
+
+
+class CacheRepository(L2Cache):
+    """L2Cache stored in the l2cache table.
+
+    Writes are queued and flushed in a single transaction once the db thread
+    is free, so a burst of cached results costs one commit.
+    """
+
+    def __init__(self, db: AsyncDB):
+        self.db = db
+        self._pending: dict[tuple[str, str], tuple[float, bytes]] = {}
+        self._flushing: Optional[asyncio.Task] = None
+
+    async def get_many(self, namespace: str, keys: list[str]) -> dict[str, tuple[float, bytes]]:
+        found = await self.db.run(CacheRepository._get_entries, namespace, keys, time.time())
+        # writes still queued are newer than the stored rows
+        for key in keys:
+            pending = self._pending.get((namespace, key))
+            if pending is not None:
+                found[key] = pending
+        return found
+
+    def put(self, namespace: str, key: str, expires: float, payload: bytes):
+        self._pending[(namespace, key)] = (expires, payload)
+        if self._flushing is None:
+            self._flushing = asyncio.create_task(self._flush())
+
+    async def _flush(self):
+        try:
+            while self._pending:
+                rows = [(namespace, key, expires, payload)
+                        for (namespace, key), (expires, payload) in self._pending.items()]
+                self._pending = {}
+                await self.db.run(CacheRepository._upsert_entries, rows)
+        except Exception as e:
+            logging.error(f"L2 cache write failed: {e}")
+        finally:
+            self._flushing = None
+
+    async def flush(self):
+        """waits for the queued writes, before shutting down"""
+        if self._flushing is not None:
+            await self._flushing
+
+    async def sweep(self, interval_s: float = 60 * 60):
+        """deletes expired entries every interval_s, forever"""
+        while True:
+            try:
+                deleted = await self.db.run(CacheRepository._delete_expired, time.time())
+                logging.info(f"L2 cache sweep deleted {deleted} entries")
+            except Exception as e:
+                logging.error(f"L2 cache sweep failed: {e}")
+            await asyncio.sleep(interval_s)
+
+    # the methods below run on the db thread
+
+    @staticmethod
+    def _get_entries(db: sqlite3.Connection, namespace: str, keys: list[str], now: float):
+        found = {}
+        # sqlite limits the number of parameters of a statement
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            for key, expires, payload in db.execute(
+                f"""
+                SELECT key, expires, payload FROM l2cache
+                WHERE namespace = ? AND key IN ({",".join("?" * len(chunk))}) AND expires > ?
+                """,
+                (namespace, *chunk, now),
+            ):
+                found[key] = (expires, payload)
+        return found
+
+    @staticmethod
+    def _upsert_entries(db: sqlite3.Connection, rows: list[tuple[str, str, float, bytes]]):
+        with db:
+            db.executemany(
+                """
+                INSERT INTO l2cache (namespace, key, expires, payload) VALUES (?, ?, ?, ?)
+                ON CONFLICT (namespace, key) DO UPDATE SET expires = excluded.expires, payload = excluded.payload
+                """,
+                rows,
+            )
+
+    @staticmethod
+    def _delete_expired(db: sqlite3.Connection, now: float) -> int:
+        with db:
+            return db.execute("DELETE FROM l2cache WHERE expires <= ?", (now,)).rowcount
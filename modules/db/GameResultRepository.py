@@ -1,74 +1,239 @@
 import sqlite3
 import logging
+import asyncio
+import re
+from base64 import urlsafe_b64encode
+from hashlib import blake2b
 from typing import Optional
 from modules.GameResult import GameResult
 from modules.ProtonDBReport import ProtonDBReport, ProtonDBTier
+from modules.db.AsyncDB import AsyncDB
 import time 
 
+SNAPSHOT_COLUMNS = (
+    "key, appid, country, title, link, price, is_free, discount, "
+    "bestReportedTier, confidence, score, tier, total, trendingTier, "
+    "currency, initial, final, discount_percent"
+)
+
+# urlsafe base64 of the 9 byte digest of snapshot_key, 12 characters without padding.
+# legacy keys are gameresults ids, too small to ever be 12 digits long
+SNAPSHOT_KEY = re.compile(r"[A-Za-z0-9_-]{12}")
+
 class GameResultRepository:
-    def __init__(self, db: sqlite3.Connection):
+    """Stores the data behind the protondb_cb/overview_cb buttons of sent results.
+
+    Results are stored as snapshots addressed by a hash of their content, so
+    the same game shown with the same price and report to many users is a
+    single row, and the short key fits in callback_data.
+    """
+    def __init__(self, db: AsyncDB):
         self.db = db
 
-    def insert_game_result(self, game: GameResult) -> int:
+    @staticmethod
+    def snapshot_key(game: GameResult) -> str:
+        """stable 12 character key of everything shown about the game: appid, country, title, price, discount and report"""
+        report = game.protonDBReport
+        fields = (
+            game.appid, game.country, game.title, game.price, int(game.is_free), game.discount,
+            *((int(report.bestReportedTier), report.confidence, report.score,
+               int(report.tier), report.total, int(report.trendingTier)) if report else ()),
+        )
+        digest = blake2b("\x1f".join(map(str, fields)).encode(), digest_size=9).digest()
+        return urlsafe_b64encode(digest).decode()
+
+    async def insert_game_result(self, game: GameResult) -> str:
         """
-        Inserts a GameResult and optional ProtonDBReport.
-        Returns the gameresults.id
+        Stores the snapshot of a GameResult and its optional ProtonDBReport.
+        Returns the snapshot key
         """
-        with self.db:
-            cur = self.db.execute(
-                """
-                INSERT INTO gameresults (
-                    appid, link, price, is_free, discount, date
-                )
-                VALUES (?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    game.appid,
-                    game.link,
-                    game.price,
-                    int(game.is_free),
-                    game.discount,
-                    int(time.time()),
-                ),
-            )
+        return (await self.insert_game_results([game]))[0]
+
+    async def insert_game_results(self, games: list[GameResult], keys: Optional[list[str]] = None) -> list[str]:
+        """
+        Stores the snapshots of every GameResult in a single transaction, reusing
+        the rows of identical ones. Returns the snapshot key of each, in order,
+        computed unless given
+        """
+        if keys is None:
+            keys = [GameResultRepository.snapshot_key(game) for game in games]
+        await self.db.run(GameResultRepository._upsert_snapshots, list(zip(keys, games)))
+        return keys
+
+    async def get_game_result(self, key: str) -> Optional[GameResult]:
+        if SNAPSHOT_KEY.fullmatch(key):
+            return await self.db.run(GameResultRepository._get_snapshot, key)
+        if key.isdigit():
+            # callback_data of messages sent before snapshots existed
+            return await self.db.run(GameResultRepository._get_legacy_game_result, int(key))
+        return None
+
+    async def delete_snapshots_older_than(self, max_age_s: float) -> int:
+        return await self.db.run(
+            GameResultRepository._delete_snapshots_before, int(time.time() - max_age_s))
 
-            game_id = cur.lastrowid
-            assert game_id
+    async def sweep_snapshots(self, max_age_s: float, interval_s: float = 60 * 60):
+        """deletes snapshots unseen for max_age_s, and legacy gameresults older than that,
+        every interval_s, forever"""
+        while True:
+            try:
+                deleted = await self.delete_snapshots_older_than(max_age_s)
+                logging.info(f"Snapshot sweep deleted {deleted} snapshots and legacy results")
+            except Exception as e:
+                logging.error(f"Snapshot sweep failed: {e}")
+            await asyncio.sleep(interval_s)
 
-            if game.protonDBReport:
-                self._insert_protondb_report(game_id, game.protonDBReport)
+    async def get_popular_games(self, max_age_s: float, limit: int) -> list[tuple[str, Optional[str], bool]]:
+        """(appid, title, is_free) of the games shown the most in the last max_age_s, most shown first.
+        The title is None for games only found in the legacy gameresults table"""
+        return await self.db.run(
+            GameResultRepository._get_popular_games, int(time.time() - max_age_s), limit)
 
-            return game_id
+    async def get_popular_countries(self, max_age_s: float, limit: int) -> list[str]:
+        """countries results were shown for the most in the last max_age_s, most used first"""
+        return await self.db.run(
+            GameResultRepository._get_popular_countries, int(time.time() - max_age_s), limit)
 
-    def _insert_protondb_report(
-        self, gameresult_id: int, report: ProtonDBReport
-    ) -> None:
-        self.db.execute(
+    # the methods below run on the db thread
+
+    @staticmethod
+    def _get_popular_games(db: sqlite3.Connection, since: int, limit: int):
+        rows = db.execute(
             """
-            INSERT INTO protondbresults (
-                id,
-                bestReportedTier,
-                confidence,
-                score,
-                tier,
-                total,
-                trendingTier
+            SELECT appid, MAX(title), MAX(is_free), SUM(n) AS shown FROM (
+                SELECT appid, title, is_free, hits AS n FROM snapshots WHERE last_seen >= ?
+                UNION ALL
+                SELECT appid, NULL, is_free, 1 FROM gameresults WHERE date >= ?
             )
-            VALUES (?, ?, ?, ?, ?, ?, ?)
+            GROUP BY appid
+            ORDER BY shown DESC
+            LIMIT ?
             """,
-            (
-                gameresult_id,
-                report.bestReportedTier,
-                report.confidence,
-                report.score,
-                report.tier,
-                report.total,
-                report.trendingTier,
-            ),
+            (since, since, limit),
+        ).fetchall()
+        return [(str(appid), title, bool(is_free)) for appid, title, is_free, _ in rows]
+
+    @staticmethod
+    def _get_popular_countries(db: sqlite3.Connection, since: int, limit: int):
+        rows = db.execute(
+            """
+            SELECT country, SUM(n) AS shown FROM (
+                SELECT country, hits AS n FROM snapshots WHERE last_seen >= ?
+                UNION ALL
+                SELECT country, 1 FROM gameresults WHERE date >= ?
+            )
+            WHERE country IS NOT NULL
+            GROUP BY country
+            ORDER BY shown DESC
+            LIMIT ?
+            """,
+            (since, since, limit),
+        ).fetchall()
+        return [country for country, _ in rows]
+
+    @staticmethod
+    def _upsert_snapshots(db: sqlite3.Connection, snapshots: list[tuple[str, GameResult]]):
+        now = int(time.time())
+        rows = []
+        for key, game in snapshots:
+            report = game.protonDBReport
+            rows.append((
+                key, game.appid, game.country, game.title, game.link, game.price,
+                int(game.is_free), game.discount,
+                *((report.bestReportedTier, report.confidence, report.score,
+                   report.tier, report.total, report.trendingTier)
+                  if report else (None,) * 6),
+                game.currency, game.initial, game.final, game.discount_percent,
+                now,
+            ))
+
+        with db:
+            db.executemany(
+                f"""
+                INSERT INTO snapshots ({SNAPSHOT_COLUMNS}, last_seen)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (key)
+                DO UPDATE SET hits = hits + 1, last_seen = excluded.last_seen
+                """,
+                rows,
+            )
+
+    @staticmethod
+    def _delete_snapshots_before(db: sqlite3.Connection, timestamp: int) -> int:
+        with db:
+            deleted = db.execute(
+                "DELETE FROM snapshots WHERE last_seen < ?", (timestamp,)
+            ).rowcount
+            # the legacy rows age out the same way, reports first as they reference them
+            db.execute(
+                "DELETE FROM protondbresults WHERE id IN (SELECT id FROM gameresults WHERE date < ?)",
+                (timestamp,),
+            )
+            deleted += db.execute(
+                "DELETE FROM gameresults WHERE date < ?", (timestamp,)
+            ).rowcount
+            return deleted
+
+    @staticmethod
+    def _get_snapshot(db: sqlite3.Connection, key: str) -> Optional[GameResult]:
+        row = db.execute(
+            f"SELECT {SNAPSHOT_COLUMNS} FROM snapshots WHERE key = ?",
+            (key,),
+        ).fetchone()
+
+        if not row:
+            return None
+
+        (
+            _key,
+            appid,
+            country,
+            title,
+            link,
+            price,
+            is_free,
+            discount,
+            bestReportedTier,
+            confidence,
+            score,
+            tier,
+            total,
+            trendingTier,
+            currency,
+            initial,
+            final,
+            discount_percent,
+        ) = row
+
+        report = None
+        if bestReportedTier is not None:
+            report = ProtonDBReport(
+                bestReportedTier=ProtonDBTier(int(bestReportedTier)),
+                confidence=confidence,
+                score=score,
+                tier=ProtonDBTier(int(tier)),
+                total=total,
+                trendingTier=ProtonDBTier(int(trendingTier)),
+            )
+
+        return GameResult(
+            appid=str(appid),
+            link=link,
+            title=title,
+            price=price,
+            is_free=bool(is_free),
+            discount=discount,
+            protonDBReport=report,
+            country=country,
+            currency=currency,
+            initial=initial,
+            final=final,
+            discount_percent=discount_percent,
         )
 
-    def get_game_result(self, gameresult_id: int) -> Optional[GameResult]:
-        row = self.db.execute(
+    @staticmethod
+    def _get_legacy_game_result(db: sqlite3.Connection, gameresult_id: int) -> Optional[GameResult]:
+        row = db.execute(
             """
             SELECT
                 g.id, g.appid, g.link, g.price, g.is_free, g.discount, g.date,g.country,
@@ -0,0 +1,76 @@
+import sqlite3
+import time
+from typing import Optional
+
+from modules.ProtonDBReport import ProtonDBReport, ProtonDBTier
+from modules.db.AsyncDB import AsyncDB
+
+WATERMARK = "protondb_summaries"
+
+
+class ProtonDBRepository:
+    """Stores the bulk protondb summaries ingested by ProtonDBSnapshot, along with
+    the time they were ingested (their watermark)"""
+
+    def __init__(self, db: AsyncDB):
+        self.db = db
+
+    async def replace_summaries(self, reports: dict[int, ProtonDBReport]) -> int:
+        """replaces every stored summary with reports in a single transaction and
+        returns the new watermark"""
+        return await self.db.run(ProtonDBRepository._replace_summaries, reports, int(time.time()))
+
+    async def load_summaries(self) -> tuple[dict[int, ProtonDBReport], Optional[int]]:
+        """the stored summaries and their watermark, None if none were ever ingested"""
+        return await self.db.run(ProtonDBRepository._load_summaries)
+
+    async def get_watermark(self) -> Optional[int]:
+        return await self.db.run(ProtonDBRepository._get_watermark)
+
+    # the methods below run on the db thread
+
+    @staticmethod
+    def _replace_summaries(db: sqlite3.Connection, reports: dict[int, ProtonDBReport], now: int) -> int:
+        with db:
+            db.execute("DELETE FROM protondb_summaries")
+            db.executemany(
+                """
+                INSERT INTO protondb_summaries (appid, bestReportedTier, confidence, score, tier, total, trendingTier)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    (appid, int(r.bestReportedTier), r.confidence, r.score, int(r.tier), r.total, int(r.trendingTier))
+                    for appid, r in reports.items()
+                ),
+            )
+            db.execute(
+                """
+                INSERT INTO watermarks (name, updated) VALUES (?, ?)
+                ON CONFLICT (name) DO UPDATE SET updated = excluded.updated
+                """,
+                (WATERMARK, now),
+            )
+        return now
+
+    @staticmethod
+    def _get_watermark(db: sqlite3.Connection) -> Optional[int]:
+        row = db.execute("SELECT updated FROM watermarks WHERE name = ?", (WATERMARK,)).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def _load_summaries(db: sqlite3.Connection):
+        row = db.execute("SELECT updated FROM watermarks WHERE name = ?", (WATERMARK,)).fetchone()
+        reports = {
+            appid: ProtonDBReport(
+                bestReportedTier=ProtonDBTier(bestReportedTier),
+                confidence=confidence,
+                score=score,
+                tier=ProtonDBTier(tier),
+                total=total,
+                trendingTier=ProtonDBTier(trendingTier),
+            )
+            for appid, bestReportedTier, confidence, score, tier, total, trendingTier in db.execute(
+                "SELECT appid, bestReportedTier, confidence, score, tier, total, trendingTier FROM protondb_summaries"
+            )
+        }
+        return reports, row[0] if row else None
@@ -0,0 +1,26 @@
+from typing import Any, Callable, TypeVar
+
+from modules.RPC import RPCClient
+
+T = TypeVar("T")
+
+
+class RemoteDB:
+    """AsyncDB of the worker processes: queries run on the AsyncDB of the front
+    process, the only one that opens the sqlite file, so that it stays the
+    single writer.
+
+    fn is sent by reference, so it must be importable, like the staticmethods
+    the repositories run; its arguments and result must be picklable.
+    """
+
+    def __init__(self, rpc: RPCClient):
+        self.rpc = rpc
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        """runs fn(connection, *args) on the db thread of the front process and returns its result"""
+        return await self.rpc.call("db.run", fn, *args)
+
+    def close(self):
+        # the connection belongs to the front process
+        pass
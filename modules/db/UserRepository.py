@@ -1,33 +1,76 @@
 import sqlite3
 import logging
+from collections import OrderedDict
+from typing import Mapping, Optional
+
+from modules.db.AsyncDB import AsyncDB
+
 class UserRepository:
-    def __init__(self, db: sqlite3.Connection):
+    def __init__(self, db: AsyncDB, countries: Mapping[str, str], cache_size: int = 100_000):
+        """countries maps languages to country codes, see init_db.load_countries"""
         self.db = db
+        self.countries = countries
+        self.cache_size = cache_size
+        # user id -> country, or None for users that haven't set one.
+        # kept in sync by upsert_user_country and delete_user
+        self._user_countries: OrderedDict[int, Optional[str]] = OrderedDict()
+
+    def _cache_user_country(self, user_id: int, country: Optional[str]):
+        self._user_countries[user_id] = country
+        self._user_countries.move_to_end(user_id)
+        while len(self._user_countries) > self.cache_size:
+            self._user_countries.popitem(last=False)
+
+    async def delete_user(self, user_id: int) -> int:
+        deleted = await self.db.run(UserRepository._delete_user, user_id)
+        self._cache_user_country(user_id, None)
+        return deleted
+
+    async def get_country_by_language(self, language):
+        return self.countries.get(language.lower())
+
+    async def get_user_country(self, user_id: int) -> str | None:
+        if user_id in self._user_countries:
+            self._user_countries.move_to_end(user_id)
+            return self._user_countries[user_id]
+
+        country = await self.db.run(UserRepository._get_user_country, user_id)
+        # an upsert or delete may have finished while this was reading, and its
+        # value is newer than the one read
+        if user_id not in self._user_countries:
+            self._cache_user_country(user_id, country)
+        return self._user_countries.get(user_id, country)
 
-    def delete_user(self, user_id: int) -> int:
-        cur = self.db.execute(
+    async def upsert_user_country(self, user_id: int, country_code: str) -> bool:
+        success = await self.db.run(UserRepository._upsert_user_country, user_id, country_code)
+        if success:
+            self._cache_user_country(user_id, country_code.upper())
+        else:
+            self._user_countries.pop(user_id, None)
+        return success
+
+    # the methods below run on the db thread
+
+    @staticmethod
+    def _delete_user(db: sqlite3.Connection, user_id: int) -> int:
+        cur = db.execute(
             "DELETE FROM users WHERE id = ?",
             (user_id,),
         )
-        self.db.commit()
+        db.commit()
         return cur.rowcount
 
-    def get_country_by_language(self, language):
-        row = self.db.execute(
-            "SELECT country from countries where language = ?",
-            (language.lower(),),
-        ).fetchone()
-        return row[0] if row else None
-
-    def get_user_country(self, user_id: int) -> str | None:
-        row = self.db.execute(
+    @staticmethod
+    def _get_user_country(db: sqlite3.Connection, user_id: int) -> str | None:
+        row = db.execute(
             "SELECT u.country from users u where id=?",
             (user_id,),
         ).fetchone()
         return row[0] if row else None
 
-    def upsert_user_country(self, user_id: int, country_code: str) -> bool:
-        cur = self.db.execute(
+    @staticmethod
+    def _upsert_user_country(db: sqlite3.Connection, user_id: int, country_code: str) -> bool:
+        cur = db.execute(
             """
             INSERT INTO users (id, country)
             VALUES (?, ?)
@@ -38,10 +81,10 @@ class UserRepository:
         )
 
         try:
-            self.db.commit()
+            db.commit()
             return cur.rowcount == 1
         except sqlite3.IntegrityError as e:
             logging.error(f"upsert user country error: {e}")
             raise e
 
-        
+
@@ -1,56 +1,156 @@
 import sqlite3
 import json
+import logging
+from types import MappingProxyType
+from typing import Mapping
 
+# applied on every connection. WAL + synchronous=NORMAL only fsyncs on
+# checkpoints instead of on every commit, which is safe against app crashes
+PRAGMAS = """
+    PRAGMA foreign_keys = ON;
+    PRAGMA journal_mode = WAL;
+    PRAGMA synchronous = NORMAL;
+    PRAGMA mmap_size = 268435456;
+    PRAGMA cache_size = -16384;
+    PRAGMA temp_store = MEMORY;
+"""
 
-def init_db(path):
-    db = sqlite3.connect(path)
-    db.execute("PRAGMA foreign_keys = ON;")
+# MIGRATIONS[i] upgrades a database from version i to i + 1 (PRAGMA user_version).
+# Append new ones, never edit the ones already released.
+MIGRATIONS = [
+    # 1: initial schema. databases from before versioning are at version 0 but
+    # already have these tables, hence the IF NOT EXISTS
+    """
+    CREATE TABLE IF NOT EXISTS countries (
+        language VARCHAR(5),
+        country VARCHAR(5) PRIMARY KEY
+    );
 
-    db.executescript(
-        """
-        CREATE TABLE IF NOT EXISTS countries (
-            language VARCHAR(5),
-            country VARCHAR(5) PRIMARY KEY
-        );
-
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY,
-            country VARCHAR(5) NOT NULL,
-            FOREIGN KEY (country) REFERENCES countries(country)
-        );
-
-
-        CREATE TABLE IF NOT EXISTS gameresults (
-            appid INTEGER,
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            country TEXT,
-            link TEXT,
-            price TEXT,
-            is_free INTEGER,
-            discount TEXT,
-            date INTEGER
-        );
-
-        CREATE TABLE IF NOT EXISTS protondbresults (
-            appid INTEGER,
-            id INTEGER,
-            bestReportedTier TEXT,
-            confidence TEXT,
-            score REAL,
-            tier TEXT,
-            total INTEGER,
-            trendingTier TEXT,
-            PRIMARY KEY (id),
-            FOREIGN KEY (id)
-            REFERENCES gameresults (id)
-        );
-        """
-    )
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY,
+        country VARCHAR(5) NOT NULL,
+        FOREIGN KEY (country) REFERENCES countries(country)
+    );
+
+
+    CREATE TABLE IF NOT EXISTS gameresults (
+        appid INTEGER,
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        country TEXT,
+        link TEXT,
+        price TEXT,
+        is_free INTEGER,
+        discount TEXT,
+        date INTEGER
+    );
+
+    CREATE TABLE IF NOT EXISTS protondbresults (
+        appid INTEGER,
+        id INTEGER,
+        bestReportedTier TEXT,
+        confidence TEXT,
+        score REAL,
+        tier TEXT,
+        total INTEGER,
+        trendingTier TEXT,
+        PRIMARY KEY (id),
+        FOREIGN KEY (id)
+        REFERENCES gameresults (id)
+    );
+    """,
+    # 2: lookup indexes
+    """
+    CREATE INDEX IF NOT EXISTS countries_language ON countries (language);
+    CREATE INDEX IF NOT EXISTS gameresults_appid_date ON gameresults (appid, date);
+    """,
+    # 3: content addressed results, replacing one gameresults row per shown result.
+    # gameresults is kept so that buttons of older messages keep working
+    """
+    CREATE TABLE IF NOT EXISTS snapshots (
+        key TEXT PRIMARY KEY,
+        appid INTEGER,
+        country TEXT,
+        title TEXT,
+        link TEXT,
+        price TEXT,
+        is_free INTEGER,
+        discount TEXT,
+        bestReportedTier INTEGER,
+        confidence TEXT,
+        score REAL,
+        tier INTEGER,
+        total INTEGER,
+        trendingTier INTEGER,
+        hits INTEGER NOT NULL DEFAULT 1,
+        last_seen INTEGER NOT NULL
+    ) WITHOUT ROWID;
+
+    CREATE INDEX IF NOT EXISTS snapshots_last_seen ON snapshots (last_seen);
+    """,
+    # 4: persistent second level of the in-memory caches (CacheRepository)
+    """
+    CREATE TABLE IF NOT EXISTS l2cache (
+        namespace TEXT NOT NULL,
+        key TEXT NOT NULL,
+        expires REAL NOT NULL,
+        payload BLOB NOT NULL,
+        PRIMARY KEY (namespace, key)
+    ) WITHOUT ROWID;
+
+    CREATE INDEX IF NOT EXISTS l2cache_expires ON l2cache (expires);
+    """,
+    # 5: the amounts behind the price text of snapshots, in cents of currency
+    """
+    ALTER TABLE snapshots ADD COLUMN currency TEXT;
+    ALTER TABLE snapshots ADD COLUMN initial INTEGER;
+    ALTER TABLE snapshots ADD COLUMN final INTEGER;
+    ALTER TABLE snapshots ADD COLUMN discount_percent INTEGER NOT NULL DEFAULT 0;
+    """,
+    # 6: bulk protondb summaries (ProtonDBSnapshot) and when each dataset was last ingested
+    """
+    CREATE TABLE IF NOT EXISTS protondb_summaries (
+        appid INTEGER PRIMARY KEY,
+        bestReportedTier INTEGER NOT NULL,
+        confidence TEXT NOT NULL,
+        score REAL NOT NULL,
+        tier INTEGER NOT NULL,
+        total INTEGER NOT NULL,
+        trendingTier INTEGER NOT NULL
+    );
 
+    CREATE TABLE IF NOT EXISTS watermarks (
+        name TEXT PRIMARY KEY,
+        updated INTEGER NOT NULL
+    );
+    """,
+]
+
+
+def init_db(path, cached_statements=256):
+    # used from the AsyncDB thread, not the one that opened it.
+    # the repositories only use constant sql strings, so every statement
+    # they run is prepared once and reused from the statement cache
+    db = sqlite3.connect(path, check_same_thread=False, cached_statements=cached_statements)
+    db.executescript(PRAGMAS)
+
+    migrate(db)
     populate_countries(db)
     return db
 
 
+def migrate(db: sqlite3.Connection):
+    version = db.execute("PRAGMA user_version").fetchone()[0]
+    for target, script in enumerate(MIGRATIONS[version:], start=version + 1):
+        logging.warning(f"Migrating database from version {target - 1} to {target}")
+        try:
+            db.executescript(f"BEGIN; {script} PRAGMA user_version = {target}; COMMIT;")
+        except Exception:
+            # executescript leaves the failed migration's transaction open
+            db.rollback()
+            logging.error(f"Migration to database version {target} failed, rolled back")
+            raise
+
+
 def populate_countries(db: sqlite3.Connection, file: str = "modules/countries.json"):
     with open(file) as f:
         countries = json.load(f)["countries"]
@@ -61,3 +161,12 @@ def populate_countries(db: sqlite3.Connection, file: str = "modules/countries.js
         [( r["language"],r["code"]) for r in countries],
     )
     db.commit()
+
+
+def load_countries(db: sqlite3.Connection) -> Mapping[str, str]:
+    """read-only language -> country code map of the countries table.
+    Some languages belong to several countries, the first one listed wins"""
+    countries: dict[str, str] = {}
+    for language, country in db.execute("SELECT language, country FROM countries ORDER BY rowid"):
+        countries.setdefault(language, country)
+    return MappingProxyType(countries)
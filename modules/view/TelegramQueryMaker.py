@@ -1,4 +1,5 @@
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
+from typing import NamedTuple
 from os import replace
 from telegram import (
     InlineKeyboardMarkup,
@@ -13,9 +14,22 @@ from uuid import uuid4
 from modules.GameResult import GameResult
 
 
+class RenderedResult(NamedTuple):
+    """a rendered GameResult: the fields of its InlineQueryResultArticle but the id"""
+    title: str
+    description: str
+    thumbnail_url: str
+    message_text: str
+    input_message_content: InputTextMessageContent
+    reply_markup: InlineKeyboardMarkup
+
+
 class TelegramInlineQueryMaker(InlineQueryMaker):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, renderCacheSize: int = 20000, **kwargs):
         super().__init__(*args, **kwargs)
+        self.renderCacheSize = renderCacheSize
+        # result key -> its rendering, least recently used first
+        self._rendered: OrderedDict[str, RenderedResult] = OrderedDict()
 
     @staticmethod
     def _digitsToEmoji(digit: str):
@@ -30,20 +44,27 @@ class TelegramInlineQueryMaker(InlineQueryMaker):
         return TelegramInlineQueryMaker._digitsToEmoji(discount[1:-1])
 
     @staticmethod
-    def makeInlineQueryResultArticle(result: GameResult): 
-        try:
+    def _priceText(result: GameResult) -> str:
+        if result.is_free:
+            price_text = "Price: FREE"
+        elif result.price is not None:
+            price_text =f"Price: {result.price}"
+        else:
+            #possibly to be announced or just not sellable
+            price_text = ""
 
-            if result.is_free:
-                price_text = "Price: FREE"
-            elif result.price is not None:
-                price_text =f"Price: {result.price}"
-            else:
-                #possibly to be announced or just not sellable
-                price_text = ""
+        if result.discount:
+            price_text += f"\t[{result.discount}]"
+        return price_text
 
-            if result.discount:
-                price_text += f"\t[{result.discount}]"
+    @staticmethod
+    def _thumbnailUrl(appid: str) -> str:
+        return f"https://cdn.akamai.steamstatic.com/steam/apps/{appid}/capsule_sm_120.jpg?t"
 
+    @staticmethod
+    def makeInlineQueryResultArticle(result: GameResult): 
+        try:
+            price_text = TelegramInlineQueryMaker._priceText(result)
             message_text = (
                 f"[{result.title}]({result.link})\n"
                 + price_text + '\n'
@@ -60,10 +81,7 @@ class TelegramInlineQueryMaker(InlineQueryMaker):
                 id=str(uuid4()),
                 title=result.title,
                 description=price_text,
-                thumbnail_url=(
-                    f"https://cdn.akamai.steamstatic.com/steam/apps/"
-                    f"{result.appid}/capsule_sm_120.jpg?t"
-                ),
+                thumbnail_url=TelegramInlineQueryMaker._thumbnailUrl(result.appid),
                 input_message_content=InputTextMessageContent(
                     parse_mode="Markdown",
                     message_text=message_text,
@@ -94,60 +112,70 @@ class TelegramInlineQueryMaker(InlineQueryMaker):
                 f"Error in makeInlineQueryResultArticle: {e} "
                 f"(type: {type(e).__name__})"
             )
-    @staticmethod
-    def makeInlineQueryResultArticle_interactive(result: GameResult, resultId:int):
-        try:
 
-            if result.is_free:
-                price_text = "Price: FREE"
-            elif result.price is not None:
-                price_text =f"Price: {result.price}"
-            else:
-                #possibly to be announced or just not sellable
-                price_text = ""
+    @staticmethod
+    def renderInteractive(result: GameResult, resultId: str) -> RenderedResult:
+        """renders everything shown of a result stored under resultId, but the article id"""
+        price_text = TelegramInlineQueryMaker._priceText(result)
+        message_text = (
+            f"[{result.title}]({result.link})\n"
+            + price_text + '\n'
+        )
 
-            if result.discount:
-                price_text += f"\t[{result.discount}]"
+        if result.protonDBReport is not None:
+            tier = result.protonDBReport.tier
+            is_positive_trend = result.protonDBReport.trendingTier > result.protonDBReport.tier
+            trend_text = f"{tier}📈" if is_positive_trend else f"{tier}📉"
 
-            message_text = (
-                f"[{result.title}]({result.link})\n"
-                + price_text + '\n'
+            message_text += (
+                f"\nProtonDB Tier: *{tier}*"
+                f"{tier.to_emoji()}"
+                f"\nTrending: {trend_text}"
             )
 
-            if result.protonDBReport is not None:
-                tier = result.protonDBReport.tier
-                is_positive_trend = result.protonDBReport.trendingTier > result.protonDBReport.tier
-                trend_text = f"{tier}📈" if is_positive_trend else f"{tier}📉"
-
-                message_text += (
-                    f"\nProtonDB Tier: *{tier}*"
-                    f"{tier.to_emoji()}"
-                    f"\nTrending: {trend_text}"
-                )
-
-            keyboardMarkup = TelegramInlineQueryMaker._makeKeyboardMarkup(
+        return RenderedResult(
+            title=result.title,
+            description=price_text,
+            thumbnail_url=TelegramInlineQueryMaker._thumbnailUrl(result.appid),
+            message_text=message_text,
+            input_message_content=InputTextMessageContent(
+                parse_mode="Markdown",
+                message_text=message_text,
+            ),
+            reply_markup=TelegramInlineQueryMaker._makeKeyboardMarkup(
                 appid=result.appid,
                 steamlink=result.link,
                 resultId=resultId,
                 hasProtonDB=result.protonDBReport is not None
-            )
-                        
-            #this must be refactored asap.
-            # at this point it's soldered rather than coupled
+            ),
+        )
+
+    def _getRendered(self, result: GameResult, resultId: str) -> RenderedResult:
+        """renderInteractive, cached by resultId. Stored results are immutable and
+        addressed by their content, so a resultId always renders the same"""
+        rendered = self._rendered.get(resultId)
+        if rendered is not None:
+            self._rendered.move_to_end(resultId)
+            return rendered
+
+        rendered = TelegramInlineQueryMaker.renderInteractive(result, resultId)
+        self._rendered[resultId] = rendered
+        while len(self._rendered) > self.renderCacheSize:
+            self._rendered.popitem(last=False)
+        return rendered
+
+    def makeInlineQueryResultArticle_interactive(self, result: GameResult, resultId:str):
+        try:
+            rendered = self._getRendered(result, resultId)
+            # telegram objects are frozen, so the cached content and keyboard can be shared
             return InlineQueryResultArticle(
                 id=str(uuid4()),
-                title=result.title,
-                description=price_text,
-                thumbnail_url=(
-                    f"https://cdn.akamai.steamstatic.com/steam/apps/"
-                    f"{result.appid}/capsule_sm_120.jpg?t"
-                ),
-                input_message_content=InputTextMessageContent(
-                    parse_mode="Markdown",
-                    message_text=message_text,
-                ),
-                reply_markup=keyboardMarkup
-            ),message_text, keyboardMarkup
+                title=rendered.title,
+                description=rendered.description,
+                thumbnail_url=rendered.thumbnail_url,
+                input_message_content=rendered.input_message_content,
+                reply_markup=rendered.reply_markup,
+            ), rendered.message_text, rendered.reply_markup
 
         except Exception as e:
             raise Exception(
@@ -155,7 +183,7 @@ class TelegramInlineQueryMaker(InlineQueryMaker):
                 f"(type: {type(e).__name__})"
             )
     @staticmethod
-    def makeProtonDBResultText(result: GameResult, resultId:int):
+    def makeProtonDBResultText(result: GameResult, resultId:str):
         try:
             message_text = ""
             if result.protonDBReport is not None:
@@ -184,7 +212,7 @@ class TelegramInlineQueryMaker(InlineQueryMaker):
                 f"(type: {type(e).__name__})"
             )
     @staticmethod
-    def _makeKeyboardMarkup(appid, steamlink, resultId:int, hasProtonDB:bool, replace_back=None):
+    def _makeKeyboardMarkup(appid, steamlink, resultId:str, hasProtonDB:bool, replace_back=None):
         row1conts = {
             "STEAM": InlineKeyboardButton("Steam Page", url=steamlink),
             "PROTONDB": InlineKeyboardButton(
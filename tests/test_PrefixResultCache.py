@@ -0,0 +1,91 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from modules.PrefixResultCache import PrefixResultCache
+from modules.SuggestParser import Suggestion
+
+
+def candidates(*names: str) -> dict[str, Suggestion]:
+    return {str(i): Suggestion(str(i), name, "$1.00") for i, name in enumerate(names)}
+
+
+def names(found) -> list[str]:
+    return [s.name for s in found.values()]
+
+
+class LookupTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = PrefixResultCache(completeBelow=10, minPrefixLength=3)
+
+    def test_exact(self):
+        stored = candidates("Stardew Valley")
+        self.cache.put("Stardew", stored, rows=1)
+        self.assertEqual(self.cache.lookup("stardew"), (stored, True))
+
+    def test_complete_prefix_is_narrowed(self):
+        self.cache.put("stard", candidates("Stardew Valley", "Star Wars", "Stardust"), rows=3)
+        found, exact = self.cache.lookup("stardew")
+        self.assertFalse(exact)
+        self.assertEqual(names(found), ["Stardew Valley"])
+
+    def test_truncated_prefix_isnt_used(self):
+        # 10 rows sent, fewer candidates left once bundles were dropped: still truncated
+        self.cache.put("star", candidates("Stardew Valley", "Star Wars"), rows=10)
+        self.assertEqual(self.cache.lookup("stardew"), (None, False))
+
+    def test_longest_prefix_is_used(self):
+        self.cache.put("sta", candidates("Stardew Valley"), rows=1)
+        self.cache.put("star", candidates("Star Wars"), rows=10)
+        self.assertEqual(self.cache.lookup("stardew"), (None, False))
+        self.cache.put("stard", candidates("Stardust"), rows=1)
+        self.assertEqual(names(self.cache.lookup("stardus")[0]), ["Stardust"])
+
+    def test_short_prefixes_arent_used(self):
+        self.cache.put("st", candidates("Stardew Valley"), rows=1)
+        self.assertEqual(self.cache.lookup("stardew"), (None, False))
+
+    def test_no_match_is_a_miss(self):
+        self.cache.put("stard", candidates("Stardust"), rows=1)
+        self.assertEqual(self.cache.lookup("stardew"), (None, False))
+
+    def test_entries_expire(self):
+        clock = SimpleNamespace(monotonic=lambda: 1000.0)
+        with mock.patch("modules.PrefixResultCache.time", clock):
+            cache = PrefixResultCache(ttl_s=60)
+            cache.put("stard", candidates("Stardew Valley"), rows=1)
+            clock.monotonic = lambda: 1061.0
+            self.assertEqual(cache.lookup("stard"), (None, False))
+            self.assertEqual(cache.lookup("stardew"), (None, False))
+
+    def test_least_recently_used_is_evicted(self):
+        cache = PrefixResultCache(maxsize=1)
+        cache.put("stard", candidates("Stardew Valley"), rows=1)
+        cache.put("elden", candidates("ELDEN RING"), rows=1)
+        self.assertEqual(cache.lookup("stardew"), (None, False))
+
+
+class NarrowTest(unittest.TestCase):
+    def test_every_query_word_prefixes_a_name_word(self):
+        found = PrefixResultCache._narrow("dark so", candidates(
+            "Dark Sector", "Souls of Darkness", "DARK SOULS™: Remastered", "Dark Souls II", "Darkest Dungeon Soundtrack",
+        ))
+        self.assertEqual(names(found), [
+            # the query as prefix of the name first, shorter names first
+            "Dark Souls II", "DARK SOULS™: Remastered", "Souls of Darkness", "Darkest Dungeon Soundtrack",
+        ])
+
+    def test_names_are_normalized(self):
+        found = PrefixResultCache._narrow("pokemon ru", candidates("Pokémon™ Ruby", "Pokemon Red"))
+        self.assertEqual(names(found), ["Pokémon™ Ruby"])
+
+    def test_steam_order_breaks_ties(self):
+        found = PrefixResultCache._narrow("sim", candidates("Sim B", "Sim A"))
+        self.assertEqual(names(found), ["Sim B", "Sim A"])
+
+    def test_no_match(self):
+        self.assertIsNone(PrefixResultCache._narrow("zelda", candidates("Stardew Valley")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+
+from modules.PriceFormatter import PriceFormat, PriceFormatter
+
+
+class ParseFormatTest(unittest.TestCase):
+    def test_prefix_currencies(self):
+        self.assertEqual(PriceFormatter.parseFormat(5999, "$59.99"), PriceFormat("$", "", ".", None, 2))
+        self.assertEqual(PriceFormatter.parseFormat(123456, "R$ 1.234,56"), PriceFormat("R$ ", "", ",", ".", 2))
+        self.assertEqual(PriceFormatter.parseFormat(2999, "CHF 29.99"), PriceFormat("CHF ", "", ".", None, 2))
+
+    def test_suffix_currencies(self):
+        self.assertEqual(PriceFormatter.parseFormat(1999, "19,99€"), PriceFormat("", "€", ",", None, 2))
+        self.assertEqual(PriceFormatter.parseFormat(149900, "1 499,00 pуб."), PriceFormat("", " pуб.", ",", " ", 2))
+        self.assertEqual(PriceFormatter.parseFormat(199999, "1999,99 zł"), PriceFormat("", " zł", ",", "", 2))
+
+    def test_rejected_texts(self):
+        for amount, formatted in [
+            (2000, "20,--€"),  # cents placeholder
+            (199900, "1.999,--€"),
+            (5999, "Free"),  # no amount
+            (5999, "$49.99"),  # another amount
+            (199900, "¥ 1,999"),  # cents not shown
+            (5999, "5999"),
+            (59990, "$599.9"),
+        ]:
+            with self.subTest(formatted=formatted):
+                self.assertIsNone(PriceFormatter.parseFormat(amount, formatted))
+
+
+class FormatTest(unittest.TestCase):
+    def setUp(self):
+        self.formatter = PriceFormatter()
+
+    def test_unknown_currency(self):
+        self.assertEqual(self.formatter.format(5999, "USD", "US"), "59.99 USD")
+
+    def test_learned_per_currency_and_country(self):
+        self.formatter.learn("EUR", "DE", 1999, "19,99€")
+        self.assertEqual(self.formatter.format(4999, "EUR", "DE"), "49,99€")
+        self.assertEqual(self.formatter.format(4999, "EUR", "IE"), "49.99 EUR")
+
+    def test_guessed_thousands_separator_is_replaced(self):
+        self.formatter.learn("EUR", "FR", 1999, "19,99€")
+        self.assertEqual(self.formatter.format(199999, "EUR", "FR"), "1.999,99€")
+        self.formatter.learn("EUR", "FR", 149999, "1 499,99€")
+        self.assertEqual(self.formatter.format(199999, "EUR", "FR"), "1 999,99€")
+        # a known separator stays
+        self.formatter.learn("EUR", "FR", 149999, "1.499,99€")
+        self.assertEqual(self.formatter.format(199999, "EUR", "FR"), "1 999,99€")
+
+    def test_small_amounts_dont_replace_a_format(self):
+        self.formatter.learn("EUR", "FR", 1999, "19,99€")
+        self.formatter.learn("EUR", "FR", 1999, "19.99 €")
+        self.assertEqual(self.formatter.format(999, "EUR", "FR"), "9,99€")
+
+    def test_texts_are_bounded(self):
+        formatter = PriceFormatter(maxTexts=2)
+        formatter.learn("USD", "US", 5999, "$59.99")
+        for amount in range(10):
+            formatter.format(amount, "USD", "US")
+        self.assertLessEqual(len(formatter._texts), 2)
+        self.assertEqual(formatter.format(123456, "USD", "US"), "$1,234.56")
+
+
+if __name__ == "__main__":
+    unittest.main()
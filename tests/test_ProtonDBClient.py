@@ -0,0 +1,101 @@
+import asyncio
+import json
+import time
+import unittest
+from contextlib import asynccontextmanager
+
+from modules.HttpClient import HttpClient
+from modules.L2Cache import L2Cache
+from modules.ProtonDBClient import PROTONDB_HOST, ProtonDBClient
+from modules.UpstreamGuard import UpstreamGuard, background_share
+from modules.async_lru_cache_ttl import set_l2_backend
+
+SUMMARY = {
+    "bestReportedTier": "platinum", "confidence": "strong", "score": 0.9,
+    "tier": "gold", "total": 100, "trendingTier": "platinum",
+}
+
+
+class FakeResponse:
+    status = 200
+    headers: dict = {}
+
+    def raise_for_status(self):
+        pass
+
+    async def json(self):
+        return SUMMARY
+
+
+class FakeSession:
+    closed = False
+
+    def __init__(self):
+        self.urls = []
+
+    @asynccontextmanager
+    async def get(self, url, **kwargs):
+        self.urls.append(url)
+        yield FakeResponse()
+
+
+class MemoryL2(L2Cache):
+    def __init__(self):
+        self.entries = {}
+
+    async def get_many(self, namespace, keys):
+        return {k: self.entries[namespace, k] for k in keys if (namespace, k) in self.entries}
+
+    def put(self, namespace, key, expires, payload):
+        self.entries[namespace, key] = (expires, payload)
+
+
+class WarmReportTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.http = HttpClient()
+        self.session = FakeSession()
+        self.http._session = self.session  # type:ignore
+        self.guard = UpstreamGuard(PROTONDB_HOST, rate=10, burst=10)
+        self.http.guard(self.guard)
+        self.client = ProtonDBClient(self.http)
+        ProtonDBClient._getReport.cache_clear()  # type:ignore
+
+    def tearDown(self):
+        set_l2_backend(None)
+
+    async def test_waits_for_the_background_pace(self):
+        # the background pace allows no request for the next minute
+        self.guard._next_background = time.monotonic() + 60
+        background_share.set(0.2)
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(self.client.warmReport("1", 60), timeout=0.1)
+        self.assertEqual(self.session.urls, [])
+
+    async def test_background_request_leaves_the_reserve(self):
+        self.guard.bucket.tokens = 5
+        background_share.set(0.2)
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(self.client.warmReport("1", 60), timeout=0.1)
+        self.assertEqual(self.session.urls, [])
+
+    async def test_fetches_missing_reports(self):
+        background_share.set(0.2)
+        self.assertTrue(await self.client.warmReport("1", 60))
+        self.assertEqual(len(self.session.urls), 1)
+        # fresh for longer than within_s
+        self.assertFalse(await self.client.warmReport("1", 60))
+        self.assertEqual(len(self.session.urls), 1)
+
+    async def test_report_found_in_l2_isnt_counted(self):
+        l2 = MemoryL2()
+        l2.put("protondb", "1", time.time() + 3600, json.dumps([4, "strong", 0.9, 3, 100, 4]).encode())
+        set_l2_backend(l2)
+        self.assertFalse(await self.client.warmReport("1", 60))
+        self.assertEqual(self.session.urls, [])
+        # expiring within within_s, so refreshed from protondb
+        self.assertTrue(await self.client.warmReport("1", 2 * 3600))
+        self.assertEqual(len(self.session.urls), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
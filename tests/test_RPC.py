@@ -0,0 +1,151 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from modules.L2Cache import L2Cache
+from modules.Metrics import metrics
+from modules.RPC import RemoteError, RPCClient, RPCServer
+from modules.SharedCache import SharedCache, SharedCacheClient
+
+
+class RPCTestCase(unittest.IsolatedAsyncioTestCase):
+    handlers: dict = {}
+
+    async def asyncSetUp(self):
+        directory = tempfile.mkdtemp(prefix="steaminlinebot-test-")
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, "rpc.sock")
+        self.server = RPCServer(self.path, self.handlers)
+        await self.server.start()
+        self.client = RPCClient(self.path)
+        await self.client.connect()
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.server.stop()
+
+
+class RPCTest(RPCTestCase):
+    def setUp(self):
+        self.notified = []
+        self.release = asyncio.Event()
+
+        async def slow(value):
+            await self.release.wait()
+            return value
+
+        def fail(message):
+            raise ValueError(message)
+
+        self.handlers = {
+            "add": lambda a, b: a + b,
+            "slow": slow,
+            "fail": fail,
+            "unpicklable": lambda: (lambda: None),
+            "notified": self.notified.append,
+        }
+
+    async def test_round_trip(self):
+        self.assertEqual(await self.client.call("add", 1, 2), 3)
+        self.assertEqual(await self.client.call("add", [1], [2]), [1, 2])
+
+    async def test_calls_are_answered_out_of_order(self):
+        slow = asyncio.create_task(self.client.call("slow", "late"))
+        self.assertEqual(await self.client.call("add", 1, 1), 2)
+        self.assertFalse(slow.done())
+        self.release.set()
+        self.assertEqual(await slow, "late")
+
+    async def test_exceptions_are_raised_to_the_caller(self):
+        with self.assertRaisesRegex(ValueError, "boom"):
+            await self.client.call("fail", "boom")
+        with self.assertRaises(RemoteError):
+            await self.client.call("unpicklable")
+        with self.assertRaises(KeyError):
+            await self.client.call("missing")
+        # the connection is still usable
+        self.assertEqual(await self.client.call("add", 1, 2), 3)
+
+    async def test_notifications(self):
+        self.client.notify("notified", "a")
+        self.client.notify("fail", "ignored")
+        self.client.notify("notified", "b")
+        # requests of a connection are handled in order
+        await self.client.call("add", 0, 0)
+        self.assertEqual(self.notified, ["a", "b"])
+
+    async def test_pending_calls_fail_when_the_server_stops(self):
+        slow = asyncio.create_task(self.client.call("slow", "never"))
+        await asyncio.sleep(0.01)
+        await self.server.stop()
+        with self.assertRaises(ConnectionError):
+            await asyncio.wait_for(slow, timeout=1)
+        with self.assertRaises(ConnectionError):
+            await self.client.call("add", 1, 2)
+
+
+class MemoryL2(L2Cache):
+    def __init__(self):
+        self.entries = {}
+
+    async def get_many(self, namespace, keys):
+        now = time.time()
+        return {
+            k: self.entries[namespace, k] for k in keys
+            if (namespace, k) in self.entries and self.entries[namespace, k][0] > now
+        }
+
+    def put(self, namespace, key, expires, payload):
+        self.entries[namespace, key] = (expires, payload)
+
+
+class SharedCacheTest(RPCTestCase):
+    def setUp(self):
+        self.backing = MemoryL2()
+        self.shared = SharedCache(maxsize=2, backing=self.backing)
+        self.handlers = {"cache.get_many": self.shared.get_many, "cache.put": self.shared.put}
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        # another worker, with its own connection to the front
+        self.other = RPCClient(self.path)
+        await self.other.connect()
+        self.addAsyncCleanup(self.other.close)
+
+    async def test_puts_of_a_worker_are_hits_in_the_others(self):
+        hits, misses = metrics.counters["shared_cache.hits"], metrics.counters["shared_cache.misses"]
+        expires = time.time() + 60
+        SharedCacheClient(self.client).put("ns", "a", expires, b"1")
+        await SharedCacheClient(self.client).flush()
+
+        found = await SharedCacheClient(self.other).get_many("ns", ["a", "b"])
+        self.assertEqual(found, {"a": (expires, b"1")})
+        self.assertEqual(await SharedCacheClient(self.other).get("ns", "b"), None)
+        self.assertEqual(metrics.counters["shared_cache.hits"] - hits, 1)
+        self.assertEqual(metrics.counters["shared_cache.misses"] - misses, 2)
+        # written through to the backing cache
+        self.assertEqual(self.backing.entries["ns", "a"], (expires, b"1"))
+
+    async def test_expired_entries_are_misses(self):
+        SharedCacheClient(self.client).put("ns", "a", time.time() - 1, b"1")
+        await SharedCacheClient(self.client).flush()
+        self.assertEqual(await SharedCacheClient(self.other).get_many("ns", ["a"]), {})
+
+    async def test_misses_are_read_from_the_backing_cache(self):
+        expires = time.time() + 60
+        self.backing.put("ns", "a", expires, b"1")
+        client = SharedCacheClient(self.other)
+        self.assertEqual(await client.get("ns", "a"), (expires, b"1"))
+        # and kept in memory, least recently used evicted first
+        self.shared.put("ns", "b", expires, b"2")
+        self.assertEqual(await client.get("ns", "a"), (expires, b"1"))
+        self.shared.put("ns", "c", expires, b"3")
+        self.backing.entries.clear()
+        self.assertEqual(await client.get_many("ns", ["a", "b", "c"]), {"a": (expires, b"1"), "c": (expires, b"3")})
+
+
+if __name__ == "__main__":
+    unittest.main()
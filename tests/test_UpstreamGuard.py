@@ -0,0 +1,166 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from modules.UpstreamGuard import CircuitBreaker, TokenBucket, UpstreamGuard, UpstreamUnavailable, background_share
+
+
+class FakeClock:
+    """stands for the time module of UpstreamGuard, advanced by hand"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class ClockTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch("modules.UpstreamGuard.time", SimpleNamespace(monotonic=self.clock.monotonic))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class CircuitBreakerTest(ClockTestCase):
+    def open(self) -> CircuitBreaker:
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout_s=30)
+        breaker.on_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        breaker.on_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        return breaker
+
+    def test_single_probe_when_half_open(self):
+        breaker = self.open()
+        self.assertFalse(breaker.allow())
+        self.clock.now += 30
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        # only the probe goes through until its outcome is known
+        self.assertFalse(breaker.allow())
+        breaker.on_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(breaker.allow())
+        self.assertTrue(breaker.allow())
+
+    def test_failed_probe_opens_again(self):
+        breaker = self.open()
+        self.clock.now += 30
+        self.assertTrue(breaker.allow())
+        breaker.on_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.clock.now += 29
+        self.assertFalse(breaker.allow())
+        self.clock.now += 1
+        self.assertTrue(breaker.allow())
+
+    def test_lost_probe_is_replaced(self):
+        breaker = self.open()
+        self.clock.now += 30
+        self.assertTrue(breaker.allow())
+        self.clock.now += 29
+        self.assertFalse(breaker.allow())
+        self.clock.now += 1
+        self.assertTrue(breaker.allow())
+
+
+class TokenBucketTest(ClockTestCase):
+    def test_rate_is_halved_when_throttled_and_recovers(self):
+        guard = UpstreamGuard("example.com", rate=10, burst=10)
+        guard.on_response(429)
+        self.assertEqual(guard.bucket.rate, 5)
+        guard.on_response(503)
+        self.assertEqual(guard.bucket.rate, 2.5)
+        for _ in range(10):
+            guard.on_response(429)
+        self.assertEqual(guard.bucket.rate, 10 / 16)
+        # additive increase, up to the configured rate
+        guard.on_response(200)
+        self.assertAlmostEqual(guard.bucket.rate, 10 / 16 + 10 / 50)
+        for _ in range(100):
+            guard.on_response(200)
+        self.assertEqual(guard.bucket.rate, 10)
+
+    def test_retry_after_pauses_the_bucket(self):
+        bucket = TokenBucket(rate=10, burst=10)
+        bucket.on_throttled(retry_after_s=7)
+        self.assertEqual(bucket.wait_time(), 7)
+        self.clock.now += 7
+        self.assertEqual(bucket.wait_time(), 0)
+
+    def test_refill(self):
+        bucket = TokenBucket(rate=2, burst=4)
+        for _ in range(4):
+            self.assertTrue(bucket.try_acquire())
+        self.assertFalse(bucket.try_acquire())
+        self.assertEqual(bucket.wait_time(), 0.5)
+        self.clock.now += 0.5
+        self.assertTrue(bucket.try_acquire())
+        # never above burst
+        self.clock.now += 100
+        self.assertEqual(bucket.wait_time(reserve=3), 0)
+        self.assertEqual(bucket.wait_time(reserve=4), 0.5)
+
+
+class UpstreamGuardTest(ClockTestCase):
+    async def test_rejects_requests_waiting_longer_than_max_wait(self):
+        guard = UpstreamGuard("example.com", rate=10, burst=1, max_wait_s=0.5)
+        guard.bucket.tokens = -10
+        with self.assertRaises(UpstreamUnavailable):
+            await guard.acquire()
+        # nothing was taken by the rejected request
+        self.assertEqual(guard.bucket.tokens, -10)
+        guard.bucket.tokens = 0
+        await guard.acquire()
+        self.assertEqual(guard.bucket.tokens, -1)
+
+    async def test_rejects_requests_while_open(self):
+        guard = UpstreamGuard("example.com", rate=10, burst=10, failure_threshold=1)
+        guard.on_failure()
+        with self.assertRaises(UpstreamUnavailable):
+            await guard.acquire()
+
+    async def test_background_requests_leave_a_reserve(self):
+        guard = UpstreamGuard("example.com", rate=10, burst=10)
+        background_share.set(0.2)
+        # 1 token for the request, 8 left for user queries
+        guard.bucket.tokens = 9
+        await guard.acquire()
+        self.assertEqual(guard.bucket.tokens, 8)
+
+        guard._next_background = 0
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(guard.acquire(), timeout=0.05)
+        # user queries still get the reserve
+        background_share.set(None)
+        await guard.acquire()
+        self.assertEqual(guard.bucket.tokens, 7)
+
+    async def test_background_requests_are_paced(self):
+        guard = UpstreamGuard("example.com", rate=10, burst=10)
+        background_share.set(0.2)
+        await guard.acquire()
+        # one request every 1 / (0.2 * 10) seconds
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(guard.acquire(), timeout=0.05)
+        self.clock.now += 0.5
+        await asyncio.wait_for(guard.acquire(), timeout=1)
+
+    async def test_background_requests_never_probe(self):
+        guard = UpstreamGuard("example.com", rate=10, burst=10, failure_threshold=1, reset_timeout_s=30)
+        guard.on_failure()
+        self.clock.now += 30
+        background_share.set(0.2)
+        with self.assertRaises(UpstreamUnavailable):
+            await guard.acquire()
+        # the probe is left to a user query
+        background_share.set(None)
+        await guard.acquire()
+        self.assertEqual(guard.breaker.state, CircuitBreaker.HALF_OPEN)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+from aiohttp.test_utils import TestClient, TestServer
+from telegram import Update
+
+from modules.WebhookServer import SECRET_HEADER, WebhookServer
+
+UPDATE = {
+    "update_id": 1,
+    "inline_query": {
+        "id": "10",
+        "from": {"id": 7, "is_bot": False, "first_name": "user"},
+        "query": "elden ring",
+        "offset": "",
+    },
+}
+
+
+class WebhookServerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.application = SimpleNamespace(bot=None, update_queue=asyncio.Queue())
+        server = WebhookServer(self.application, "secret", path="/telegram")  # type:ignore
+        self.client = TestClient(TestServer(server.makeApp()))
+        await self.client.start_server()
+        self.addAsyncCleanup(self.client.close)
+
+    async def test_rejects_a_missing_secret_token(self):
+        response = await self.client.post("/telegram", json=UPDATE)
+        self.assertEqual(response.status, 403)
+        self.assertTrue(self.application.update_queue.empty())
+
+    async def test_rejects_a_wrong_secret_token(self):
+        response = await self.client.post("/telegram", json=UPDATE, headers={SECRET_HEADER: "secreT"})
+        self.assertEqual(response.status, 403)
+        self.assertTrue(self.application.update_queue.empty())
+
+    async def test_rejects_malformed_updates(self):
+        response = await self.client.post("/telegram", data=b"{", headers={SECRET_HEADER: "secret"})
+        self.assertEqual(response.status, 400)
+        self.assertTrue(self.application.update_queue.empty())
+
+    async def test_queues_valid_updates(self):
+        response = await self.client.post("/telegram", json=UPDATE, headers={SECRET_HEADER: "secret"})
+        self.assertEqual(response.status, 200)
+        update = self.application.update_queue.get_nowait()
+        self.assertIsInstance(update, Update)
+        self.assertEqual(update.inline_query.query, "elden ring")
+        self.assertEqual(update.effective_user.id, 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import queue
+import unittest
+
+from telegram import InlineQuery, Update, User
+
+from modules.WorkerPool import WorkerPool
+
+
+def inlineQuery(update_id: int, user_id: int, query: str) -> Update:
+    user = User(id=user_id, first_name="user", is_bot=False)
+    return Update(update_id, inline_query=InlineQuery(str(update_id), user, query, ""))
+
+
+def drain(updates) -> list[dict]:
+    """what was put in updates, which goes through a feeder thread"""
+    found = []
+    while True:
+        try:
+            found.append(updates.get(timeout=0.2))
+        except queue.Empty:
+            return found
+
+
+class DispatchTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        # never started: updates stay in the queues
+        self.pool = WorkerPool(target=print, workers=3)
+
+    def tearDown(self):
+        for updates in self.pool._queues:
+            updates.close()
+
+    async def test_updates_of_a_user_go_to_the_same_worker_in_order(self):
+        queries = ["e", "el", "eld", "elden"]
+        for update_id, query in enumerate(queries):
+            await self.pool.dispatch(inlineQuery(update_id, 7, query))
+        await self.pool.dispatch(inlineQuery(10, 8, "stardew"))
+
+        received = [drain(updates) for updates in self.pool._queues]
+        self.assertEqual([u["inline_query"]["query"] for u in received[7 % 3]], queries)
+        self.assertEqual([u["inline_query"]["query"] for u in received[8 % 3]], ["stardew"])
+        self.assertEqual(received[9 % 3], [])
+
+    async def test_shard_is_stable(self):
+        self.assertEqual(
+            [self.pool.shard(inlineQuery(i, 1234, "q")) for i in range(5)],
+            [1234 % 3] * 5,
+        )
+        # updates without a user are spread by their id
+        self.assertEqual(self.pool.shard(Update(5)), 5 % 3)
+
+    async def test_dispatched_updates_can_be_rebuilt(self):
+        update = inlineQuery(1, 7, "elden ring")
+        await self.pool.dispatch(update)
+        (sent,) = drain(self.pool._queues[1])
+        self.assertEqual(Update.de_json(sent, None), update)
+
+    async def test_full_queue_drops_updates(self):
+        pool = WorkerPool(target=print, workers=1, queueSize=1)
+        self.addCleanup(pool._queues[0].close)
+        await pool.dispatch(inlineQuery(1, 7, "a"))
+        await pool.dispatch(inlineQuery(2, 7, "b"))
+        self.assertEqual([u["update_id"] for u in drain(pool._queues[0])], [1])
+
+
+if __name__ == "__main__":
+    unittest.main()
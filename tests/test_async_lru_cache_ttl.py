@@ -0,0 +1,371 @@
+import asyncio
+import time
+import traceback
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from modules.UpstreamGuard import UpstreamGuard, background_share
+from modules.L2Cache import L2Cache, L2Codec
+from modules.async_lru_cache_ttl import NegativeResult, async_lru_cache_ttl, set_l2_backend
+
+
+class FakeClock:
+    """stands for the time module of async_lru_cache_ttl, advanced by hand"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+
+class ClockTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch("modules.async_lru_cache_ttl.time",
+                             SimpleNamespace(monotonic=self.clock.monotonic, time=self.clock.time))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class SharedCallContextTest(unittest.IsolatedAsyncioTestCase):
+    async def test_shared_call_doesnt_inherit_background_share(self):
+        started = asyncio.Event()
+        release = asyncio.Event()
+        seen = []
+
+        @async_lru_cache_ttl
+        async def fetch(key):
+            seen.append(background_share.get())
+            started.set()
+            await release.wait()
+            return key
+
+        async def background():
+            background_share.set(0.2)
+            return await fetch("a")
+
+        warming = asyncio.create_task(background())
+        await started.wait()
+        joining = asyncio.create_task(fetch("a"))
+        release.set()
+        self.assertEqual(await asyncio.gather(warming, joining), ["a", "a"])
+        self.assertEqual(seen, [None])
+
+    async def test_foreground_caller_joining_a_background_call_isnt_paced_as_background(self):
+        guard = UpstreamGuard("example.com", rate=10, burst=10)
+        # the background pace allows no request for the next minute
+        guard._next_background = time.monotonic() + 60
+
+        @async_lru_cache_ttl
+        async def fetch(key):
+            await guard.acquire()
+            return key
+
+        async def background():
+            background_share.set(0.2)
+            return await fetch("a")
+
+        warming = asyncio.create_task(background())
+        await asyncio.sleep(0)
+        self.assertEqual(await asyncio.wait_for(fetch("a"), timeout=1), "a")
+        self.assertEqual(await warming, "a")
+
+
+class SingleFlightTest(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_misses_make_a_single_call(self):
+        calls = []
+        release = asyncio.Event()
+
+        @async_lru_cache_ttl
+        async def fetch(key):
+            calls.append(key)
+            await release.wait()
+            return key.upper()
+
+        waiters = [asyncio.create_task(fetch("a")) for _ in range(10)]
+        await asyncio.sleep(0)
+        release.set()
+        self.assertEqual(await asyncio.gather(*waiters), ["A"] * 10)
+        self.assertEqual(calls, ["a"])
+        self.assertEqual(fetch.cache_info().misses, 10)
+
+    async def test_failure_reaches_every_waiter(self):
+        calls = []
+        release = asyncio.Event()
+
+        @async_lru_cache_ttl
+        async def fetch(key):
+            calls.append(key)
+            await release.wait()
+            raise ValueError(key)
+
+        waiters = [asyncio.create_task(fetch("a")) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        self.assertEqual([type(r) for r in results], [ValueError] * 3)
+        self.assertEqual(calls, ["a"])
+        # failures aren't cached by default
+        with self.assertRaises(ValueError):
+            await fetch("a")
+        self.assertEqual(calls, ["a", "a"])
+
+    async def test_cancelled_waiter_doesnt_cancel_the_call(self):
+        calls = []
+        release = asyncio.Event()
+
+        @async_lru_cache_ttl
+        async def fetch(key):
+            calls.append(key)
+            await release.wait()
+            return key
+
+        cancelled = asyncio.create_task(fetch("a"))
+        other = asyncio.create_task(fetch("a"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        self.assertEqual(await other, "a")
+        with self.assertRaises(asyncio.CancelledError):
+            await cancelled
+        self.assertEqual(calls, ["a"])
+        self.assertEqual(fetch.cache_info().inflight, 0)
+        # the outcome was cached despite its starter giving up
+        self.assertEqual(await fetch("a"), "a")
+        self.assertEqual(calls, ["a"])
+
+
+class OutcomeTest(ClockTestCase):
+    async def test_negative_result_is_cached_for_its_own_ttl(self):
+        calls = []
+
+        @async_lru_cache_ttl(delta_s=100)
+        async def fetch(key):
+            calls.append(key)
+            raise NegativeResult("missing", ttl_s=5)
+
+        self.assertEqual(await fetch("a"), "missing")
+        self.clock.now += 4
+        self.assertEqual(await fetch("a"), "missing")
+        self.assertEqual(len(calls), 1)
+        self.clock.now += 2
+        self.assertEqual(await fetch("a"), "missing")
+        self.assertEqual(len(calls), 2)
+
+    async def test_negative_result_defaults_to_negative_ttl(self):
+        calls = []
+
+        @async_lru_cache_ttl(delta_s=100, negative_ttl_s=10)
+        async def fetch(key):
+            calls.append(key)
+            raise NegativeResult(None)
+
+        self.assertIsNone(await fetch("a"))
+        self.clock.now += 9
+        self.assertIsNone(await fetch("a"))
+        self.assertEqual(len(calls), 1)
+        self.clock.now += 2
+        self.assertIsNone(await fetch("a"))
+        self.assertEqual(len(calls), 2)
+
+    async def test_error_is_cached_for_error_ttl_and_raised_again(self):
+        calls = []
+
+        @async_lru_cache_ttl(error_ttl_s=30)
+        async def fetch(key):
+            calls.append(key)
+            raise ValueError(key)
+
+        with self.assertRaises(ValueError):
+            await fetch("a")
+        self.clock.now += 29
+        with self.assertRaises(ValueError) as raised:
+            await fetch("a")
+        self.assertEqual(len(calls), 1)
+        # raised from the cache, without the traceback of the call that failed
+        frames = [frame.name for frame in traceback.extract_tb(raised.exception.__traceback__)]
+        self.assertNotIn("fetch", frames)
+        self.clock.now += 2
+        with self.assertRaises(ValueError):
+            await fetch("a")
+        self.assertEqual(len(calls), 2)
+
+    async def test_stale_value_is_returned_when_refreshing_fails(self):
+        results = [1, ValueError("down"), ValueError("down"), 2]
+
+        @async_lru_cache_ttl(delta_s=10, stale_if_error_s=100)
+        async def fetch(key):
+            result = results.pop(0)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        self.assertEqual(await fetch("a"), 1)
+        self.clock.now += 11
+        self.assertEqual(await fetch("a"), 1)
+        self.assertEqual(await fetch("a"), 1)
+        self.assertEqual(fetch.cache_info().stale_hits, 2)
+        # the first successful refresh replaces it
+        self.assertEqual(await fetch("a"), 2)
+        self.assertEqual(results, [])
+
+    async def test_cached_error_serves_the_value_it_replaced(self):
+        calls = []
+
+        @async_lru_cache_ttl(delta_s=10, stale_if_error_s=100, error_ttl_s=30)
+        async def fetch(key):
+            calls.append(key)
+            if len(calls) > 1:
+                raise ValueError("down")
+            return 1
+
+        self.assertEqual(await fetch("a"), 1)
+        self.clock.now += 11
+        self.assertEqual(await fetch("a"), 1)
+        # the error is cached: no new call until error_ttl_s passes, the stale value served meanwhile
+        self.clock.now += 20
+        self.assertEqual(await fetch("a"), 1)
+        self.assertEqual(len(calls), 2)
+        # past the stale period, the error is all there is
+        self.clock.now += 90
+        with self.assertRaises(ValueError):
+            await fetch("a")
+
+
+class MemoryL2(L2Cache):
+    def __init__(self):
+        self.entries = {}
+        self.reads = 0
+
+    async def get_many(self, namespace, keys):
+        self.reads += 1
+        return {k: self.entries[namespace, k] for k in keys if (namespace, k) in self.entries}
+
+    def put(self, namespace, key, expires, payload):
+        self.entries[namespace, key] = (expires, payload)
+
+
+class LRUTest(ClockTestCase):
+    async def test_least_recently_used_is_evicted(self):
+        calls = []
+
+        @async_lru_cache_ttl(maxsize=2)
+        async def fetch(key):
+            calls.append(key)
+            return key
+
+        await fetch("a")
+        await fetch("b")
+        # a hit makes a the most recently used, so b goes
+        await fetch("a")
+        await fetch("c")
+        self.assertEqual(fetch.cache_info().currsize, 2)
+        await fetch("a")
+        self.assertEqual(calls, ["a", "b", "c"])
+        await fetch("b")
+        self.assertEqual(calls, ["a", "b", "c", "b"])
+
+    async def test_sweep_drops_entries_past_ttl_and_stale_period(self):
+        @async_lru_cache_ttl(delta_s=10, sweep_interval_s=5)
+        async def short(key):
+            return key
+
+        @async_lru_cache_ttl(delta_s=10, stale_if_error_s=100, sweep_interval_s=5)
+        async def stale(key):
+            return key
+
+        await short("a")
+        await stale("a")
+        self.clock.now += 20
+        # sweeps happen on calls
+        await short("b")
+        await stale("b")
+        self.assertEqual(short.cache_info().currsize, 1)
+        # expired, but still servable if refreshing it fails
+        self.assertEqual(stale.cache_info().currsize, 2)
+
+    async def test_cache_info_and_clear(self):
+        @async_lru_cache_ttl(maxsize=10)
+        async def fetch(key):
+            return key
+
+        await fetch("a")
+        await fetch("a")
+        await fetch("b")
+        info = fetch.cache_info()
+        self.assertEqual((info.hits, info.misses, info.stale_hits, info.maxsize, info.currsize, info.inflight),
+                         (1, 2, 0, 10, 2, 0))
+        fetch.cache_clear()
+        self.assertEqual(fetch.cache_info(), (0, 0, 0, 10, 0, 0))
+
+    async def test_remaining_ttl(self):
+        @async_lru_cache_ttl(delta_s=10)
+        async def fetch(key):
+            return key
+
+        self.assertIsNone(fetch.remaining_ttl("a"))
+        await fetch("a")
+        self.clock.now += 4
+        self.assertEqual(fetch.remaining_ttl("a"), 6)
+        self.clock.now += 10
+        self.assertEqual(fetch.remaining_ttl("a"), -4)
+
+
+class RefreshTest(ClockTestCase):
+    def setUp(self):
+        super().setUp()
+        self.l2 = MemoryL2()
+        set_l2_backend(self.l2)
+        self.addCleanup(set_l2_backend, None)
+
+    async def test_refresh_skips_l2_and_replaces_the_value(self):
+        values = [1, 2]
+
+        @async_lru_cache_ttl(delta_s=10, l2=L2Codec("test", lambda key: key, lambda v: str(v).encode(), int))
+        async def fetch(key):
+            return values.pop(0)
+
+        self.assertEqual(await fetch("a"), 1)
+        self.assertEqual(self.l2.reads, 1)
+        self.clock.now += 5
+        self.assertEqual(await fetch.refresh("a"), 2)
+        self.assertEqual(self.l2.reads, 1)
+        self.assertEqual(await fetch("a"), 2)
+        self.assertEqual(fetch.remaining_ttl("a"), 10)
+        self.assertEqual(self.l2.entries["test", "a"][1], b"2")
+
+    async def test_refresh_returns_the_current_value_on_failure(self):
+        results = [1, ValueError("down")]
+
+        @async_lru_cache_ttl(delta_s=10)
+        async def fetch(key):
+            result = results.pop(0)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        await fetch("a")
+        self.clock.now += 5
+        self.assertEqual(await fetch.refresh("a"), 1)
+        self.assertEqual(results, [])
+        # still cached until its own expiry
+        self.assertEqual(await fetch("a"), 1)
+        self.assertEqual(fetch.remaining_ttl("a"), 5)
+
+    async def test_refresh_of_a_missing_entry_fails(self):
+        @async_lru_cache_ttl
+        async def fetch(key):
+            raise ValueError("down")
+
+        with self.assertRaises(ValueError):
+            await fetch.refresh("a")
+
+
+if __name__ == "__main__":
+    unittest.main()